@@ -0,0 +1,272 @@
+"""Local stand-in for the Artifactory server used by the download benchmarks.
+
+Serves a folder laid out like the sdg-generic-development repository with
+HTML index pages, the storage API (folder children, deep listings, file
+info and properties), AQL property searches and file downloads with ETag
+and Range support. Requests and bytes sent are counted so benchmarks can
+report them per stage.
+"""
+
+import datetime
+import hashlib
+import html
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+REPO = "sdg-generic-development"
+
+BLOCK_SIZE = 1024 * 1024
+
+
+class artifactory_standin:
+    """Artifactory stand-in serving the files below root on a local port
+
+    Files are added with add_file, which also records their checksums and
+    properties. Use as a context manager to run the server in a thread.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.requests = 0
+        self.bytes_sent = 0
+        self._checksums = {}
+        self._properties = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _handler)
+        self.server.daemon_threads = True
+        self.server.standin = self
+
+    @property
+    def host(self):
+        return f"127.0.0.1:{self.server.server_port}"
+
+    @property
+    def url(self):
+        return "http://" + self.host
+
+    @property
+    def artifactory(self):
+        """URL of the repository root"""
+        return f"{self.url}/artifactory/{REPO}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_file(self, path, data, properties=None):
+        """Store data at path, relative to the repository root"""
+        path = path.strip("/")
+        fname = os.path.join(self.root, REPO, path)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        with open(fname, "wb") as f:
+            f.write(data)
+        self._checksums[path] = {
+            "md5": hashlib.md5(data).hexdigest(),
+            "sha1": hashlib.sha1(data).hexdigest(),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        }
+        self._properties[path] = {
+            key: value if isinstance(value, list) else [value]
+            for key, value in (properties or {}).items()
+        }
+
+    def counters(self):
+        """Requests served and bytes sent so far"""
+        with self._lock:
+            return self.requests, self.bytes_sent
+
+    def _count(self, sent=0, request=False):
+        with self._lock:
+            self.requests += int(request)
+            self.bytes_sent += sent
+
+
+def _timestamp(mtime):
+    return datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc).isoformat()
+
+
+class _handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def standin(self):
+        return self.server.standin
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+            self.standin._count(len(body))
+
+    def _json(self, value):
+        self._send(200, json.dumps(value).encode())
+
+    def _route(self):
+        self.standin._count(request=True)
+        parts = urlsplit(self.path)
+        path = re.sub("/+", "/", unquote(parts.path))
+        if not path.startswith("/artifactory/"):
+            return None, None, parts.query
+        path = path[len("/artifactory/") :]
+        return path, os.path.join(self.standin.root, path), parts.query
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        path, local, query = self._route()
+        if path is None:
+            return self._send(404, b"Not Found", "text/plain")
+        if path.startswith("api/storage/"):
+            return self._storage(path[len("api/storage/") :].strip("/"), query)
+        if os.path.isdir(local):
+            return self._index(path, local)
+        if os.path.isfile(local):
+            return self._file(local)
+        self._send(404, b"Not Found", "text/plain")
+
+    def do_POST(self):
+        path, _, _ = self._route()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        if path != "api/search/aql":
+            return self._send(404, b"Not Found", "text/plain")
+        repo = re.search(r'"repo":\s*"([^"]+)"', body)
+        folder = re.search(r'"path":\s*"([^"]+)"', body)
+        if not repo or not folder or repo.group(1) != REPO:
+            return self._json({"results": []})
+        prefix = folder.group(1).strip("/") + "/"
+        results = []
+        for name, props in self.standin._properties.items():
+            if not name.startswith(prefix):
+                continue
+            results.append(
+                {
+                    "repo": REPO,
+                    "path": os.path.dirname(name),
+                    "name": os.path.basename(name),
+                    "properties": [
+                        {"key": key, "value": value}
+                        for key, values in props.items()
+                        for value in values
+                    ],
+                }
+            )
+        self._json({"results": results})
+
+    def _index(self, path, local):
+        title = html.escape("Index of " + path)
+        links = ['<a href="../">../</a>']
+        for name in sorted(os.listdir(local)):
+            if os.path.isdir(os.path.join(local, name)):
+                name += "/"
+            links.append(f'<a href="{html.escape(name)}">{html.escape(name)}</a>')
+        page = (
+            f"<html><head><title>{title}</title></head><body><h1>{title}</h1>"
+            "<pre>" + "\n".join(links) + "</pre><hr/></body></html>"
+        )
+        self._send(200, page.encode(), "text/html")
+
+    def _storage(self, path, query):
+        local = os.path.join(self.standin.root, path)
+        if not os.path.exists(local):
+            return self._send(404, b"Unable to find item", "text/plain")
+        repo, _, rel = path.partition("/")
+        uri = f"{self.standin.url}/artifactory/api/storage/{path}"
+        st = os.stat(local)
+        info = {
+            "repo": repo,
+            "path": "/" + rel,
+            "uri": uri,
+            "created": _timestamp(st.st_mtime),
+            "lastModified": _timestamp(st.st_mtime),
+            "lastUpdated": _timestamp(st.st_mtime),
+        }
+        if "properties" in query.split("&"):
+            props = self.standin._properties.get(rel, {})
+            if not props:
+                return self._send(404, b"No properties could be found", "text/plain")
+            return self._json({"uri": uri, "properties": props})
+        if os.path.isdir(local):
+            if "list" in query.split("&"):
+                files = []
+                for root, _, names in os.walk(local):
+                    for name in sorted(names):
+                        fname = os.path.join(root, name)
+                        key = os.path.relpath(
+                            fname, os.path.join(self.standin.root, repo)
+                        )
+                        files.append(
+                            {
+                                "uri": "/" + os.path.relpath(fname, local),
+                                "size": os.path.getsize(fname),
+                                "sha2": self.standin._checksums[key]["sha256"],
+                                "folder": False,
+                            }
+                        )
+                return self._json({"uri": uri, "files": files})
+            info["children"] = [
+                {"uri": "/" + name, "folder": os.path.isdir(os.path.join(local, name))}
+                for name in sorted(os.listdir(local))
+            ]
+            return self._json(info)
+        info.update(
+            {
+                "size": str(st.st_size),
+                "mimeType": "application/octet-stream",
+                "checksums": self.standin._checksums[rel],
+                "downloadUri": f"{self.standin.url}/artifactory/{path}",
+            }
+        )
+        self._json(info)
+
+    def _file(self, local):
+        st = os.stat(local)
+        etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, headers={"ETag": etag})
+        start, end = 0, st.st_size - 1
+        status = 200
+        ranged = self.headers.get("Range")
+        if ranged and self.headers.get("If-Range", etag) == etag:
+            first, last = ranged.split("=", 1)[1].split("-")
+            start = int(first)
+            end = min(int(last), end) if last else end
+            if start >= st.st_size:
+                return self._send(416)
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{st.st_size}")
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        with open(local, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining:
+                data = f.read(min(BLOCK_SIZE, remaining))
+                if not data:
+                    break
+                self.wfile.write(data)
+                self.standin._count(len(data))
+                remaining -= len(data)
@@ -0,0 +1,79 @@
+"""Benchmark reference design lookups of filter_boards.
+
+Compares the precompiled board_table index against the previous approach of
+parsing board_table.yaml and scanning every board for each artifact.
+
+Usage: python benchmarks/bench_board_table.py [--artifacts 1000]
+"""
+
+import argparse
+import logging
+import random
+import time
+
+import yaml
+
+from nebula.common import BOARD_TABLE, CARRIER_ALIASES
+from nebula.downloader import filter_boards
+
+
+def legacy_translate(fmc, fpga):
+    with open(BOARD_TABLE) as f:
+        board_configs = yaml.load(f, Loader=yaml.FullLoader)
+    fpga = CARRIER_ALIASES.get(fpga.lower().strip(), fpga)
+    for board in board_configs:
+        if board_configs[board]["carrier"].lower().strip() == fpga.lower().strip() and (
+            "addons" in board_configs[board] or fmc.lower().strip() in board.lower()
+        ):
+            if fmc.lower().strip() in board.lower():
+                return board
+            for addon in board_configs[board]["addons"]:
+                if fmc.lower() in addon.lower():
+                    return board
+    return None
+
+
+def synthetic_artifacts(count, seed=0):
+    """MATLAB style bootbin names drawn from board_table carriers"""
+    with open(BOARD_TABLE) as f:
+        board_configs = yaml.load(f, Loader=yaml.FullLoader)
+    pairs = []
+    for details in board_configs.values():
+        for addon in details.get("addons") or []:
+            pairs.append((addon.split()[0].split("/")[0], details["carrier"]))
+    pairs += [("ADRV9361", alias) for alias in CARRIER_ALIASES]
+    rng = random.Random(seed)
+    return [
+        "{} {} ({}).BIN".format(*rng.choice(pairs), rng.choice(["rx", "tx", "rxtx"]))
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--artifacts", type=int, default=1000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    paths = synthetic_artifacts(args.artifacts)
+
+    start = time.perf_counter()
+    legacy = []
+    for path in paths:
+        fmc, fpga = path.split("(")[0].split(" ")[:2]
+        legacy.append(legacy_translate(fmc, fpga))
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, indexed = filter_boards(paths, None, None)
+    indexed_time = time.perf_counter() - start
+
+    assert indexed == legacy, "Index lookup differs from board table scan"
+    print(f"artifacts: {len(paths)}")
+    print(f"yaml scan: {legacy_time * 1000:.1f} ms")
+    print(f"index:     {indexed_time * 1000:.1f} ms (includes first load)")
+    print(f"speedup:   {legacy_time / indexed_time:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark the download writer against a local HTTP server.
+
+Compares the previous writer, which hashed, wrote and updated progress for
+every 1 KB chunk, against _write_response with adaptive chunks, reused
+buffers, preallocation and throttled progress. Reports throughput and CPU
+time per GB transferred.
+
+Usage: python benchmarks/bench_download.py [--size-mb 512] [--repeat 3]
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from tqdm import tqdm
+
+from nebula.downloader import _write_response
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def legacy_write_response(resp, fname):
+    total = int(resp.headers.get("content-length", 0))
+    sha256_hash = hashlib.sha256()
+    with open(fname, "wb") as file, tqdm(
+        desc=fname, total=total, unit="iB", unit_scale=True, unit_divisor=1024
+    ) as bar:
+        for data in resp.iter_content(chunk_size=1024):
+            size = file.write(data)
+            sha256_hash.update(data)
+            bar.update(size)
+    return sha256_hash.hexdigest()
+
+
+def measure(writer, session, url, fname, size, repeat):
+    best = None
+    for _ in range(repeat):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        resp = session.get(url, stream=True)
+        writer(resp, fname)
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        os.remove(fname)
+        if best is None or wall < best[0]:
+            best = (wall, cpu)
+    wall, cpu = best
+    return size / wall / 1024**2, cpu * 1024**3 / size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as root:
+        size = args.size_mb * 1024**2
+        with open(os.path.join(root, "image.bin"), "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024**2))
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), partial(QuietHandler, directory=root)
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/image.bin"
+        fname = os.path.join(root, "out.bin")
+        session = requests.Session()
+        try:
+            results = {
+                "legacy 1 KB chunks": measure(
+                    legacy_write_response, session, url, fname, size, args.repeat
+                ),
+                "_write_response": measure(
+                    lambda r, f: _write_response(r, f, desc="image.bin"),
+                    session,
+                    url,
+                    fname,
+                    size,
+                    args.repeat,
+                ),
+            }
+        finally:
+            server.shutdown()
+
+    print(f"{args.size_mb} MB over loopback, best of {args.repeat}")
+    for name, (rate, cpu) in results.items():
+        print(f"{name:20s} {rate:8.1f} MB/s  {cpu:6.2f} CPU s/GB")
+
+
+if __name__ == "__main__":
+    main()
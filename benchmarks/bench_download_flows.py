@@ -0,0 +1,228 @@
+"""Benchmark the download flows against a local Artifactory stand-in.
+
+Runs build folder resolution with gen_url, download_boot_files with a cold
+and a warm artifact cache, download_sdcard_release and the MATLAB bootbin
+flow against artifactory_standin. Reports latency, request count, bytes and
+throughput of each stage, so regressions in the download path show up
+without access to artifactory.analog.com.
+
+Usage: python benchmarks/bench_download_flows.py [--boards 4] [--scale 1.0]
+       [--bootbins 16] [--json results.json]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import lzma
+import os
+import tempfile
+import time
+
+from artifactory_standin import REPO, artifactory_standin
+
+BUILD = "2025_10_23-22_24_49"
+OLDER_BUILDS = ["2025_09_30-08_00_00", "2025_10_01-12_30_00"]
+MATLAB = ("HighSpeedConverterToolbox", "main", "1234")
+
+INFO_TXT = """Built on: {build}
+Triggered by: hdl
+COMMIT SHA: 0123456789abcdef0123456789abcdef01234567
+Built projects:
+{projects}
+"""
+
+
+def pick_boards(count):
+    """Alternate zynq and zynqmp boards from board_table"""
+    from nebula.common import get_board_index
+
+    configs = get_board_index().configs
+    zynq = [b for b, d in configs.items() if d["carrier"] == "ZC706"]
+    zynqmp = [b for b, d in configs.items() if d["carrier"] == "ZCU102"]
+    boards = [b for pair in zip(zynq, zynqmp) for b in pair]
+    return boards[:count]
+
+
+def populate(standin, boards, scale, bootbins):
+    """Lay out build folders for all flows on the stand-in"""
+
+    def blob(mb):
+        return os.urandom(max(1, int(mb * scale * 1024**2)))
+
+    props = {"hdl_git_sha": "0123456", "linux_git_sha": "89abcde"}
+    new_flow = f"test_boot_files/main/HDL_PRs/pr_1/{BUILD}"
+    standin.add_file(
+        f"{new_flow}/info.txt",
+        INFO_TXT.format(
+            build=BUILD, projects="\n".join(f"  - {b}" for b in boards)
+        ).encode(),
+    )
+    standin.add_file(f"{new_flow}/boot_partition/zynq-common/uImage", blob(8), props)
+    standin.add_file(f"{new_flow}/boot_partition/zynqmp-common/Image", blob(24), props)
+    for board in boards:
+        dt = "system.dtb" if board.startswith("zynqmp") else "devicetree.dtb"
+        for name, mb in [("BOOT.BIN", 4), ("bootgen_sysfiles.tgz", 1), (dt, 1 / 16)]:
+            standin.add_file(
+                f"{new_flow}/boot_partition/{board}/{name}", blob(mb), props
+            )
+
+    # Daily builds resolved by gen_url, only their layout matters
+    for build in OLDER_BUILDS + [BUILD]:
+        for board in boards:
+            standin.add_file(
+                f"boot_partition/main/{build}/boot_partition/{board}/BOOT.BIN", b"0"
+            )
+
+    image = os.urandom(int(32 * scale * 1024**2)) + bytes(int(32 * scale * 1024**2))
+    xz = lzma.compress(image, preset=0)
+    standin.add_file("cse/bench.img.xz", xz)
+
+    toolbox, branch, build = MATLAB
+    for i in range(bootbins):
+        standin.add_file(
+            f"{toolbox}/dev/{branch}/{build}/bootbin_{i}.BIN", blob(4), props
+        )
+    return image, xz
+
+
+class stage:
+    """Time a benchmark stage and collect the stand-in counters"""
+
+    def __init__(self, standin, results, name):
+        self.standin = standin
+        self.results = results
+        self.name = name
+
+    def __enter__(self):
+        self.before = self.standin.counters()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        requests, sent = self.standin.counters()
+        requests -= self.before[0]
+        sent -= self.before[1]
+        self.results[self.name] = {
+            "seconds": seconds,
+            "requests": requests,
+            "bytes": sent,
+            "mb_per_s": sent / seconds / 1024**2 if seconds else 0.0,
+        }
+
+
+def run(args, work):
+    from nebula.downloader import (
+        _info_txt,
+        artifactory_resolver,
+        download_matlab_generate_bootbin,
+        downloader,
+        gen_url,
+        url_resolver,
+    )
+
+    results = {}
+    boards = pick_boards(args.boards)
+    with artifactory_standin(os.path.join(work, "server")) as standin:
+        image, xz = populate(standin, boards, args.scale, args.bootbins)
+        template = "http://{}/artifactory/" + REPO + "/boot_partition/{}/{}/{}"
+
+        for name, resolver in [
+            ("gen_url html listings", url_resolver()),
+            ("gen_url storage api", artifactory_resolver()),
+        ]:
+            with stage(standin, results, name):
+                for board in boards:
+                    url = gen_url(
+                        standin.host,
+                        "main",
+                        board,
+                        "BOOT.BIN",
+                        None,
+                        template,
+                        resolver,
+                    )
+                    assert BUILD in url, url
+
+        build_url = f"{standin.artifactory}/test_boot_files/main/HDL_PRs/pr_1/{BUILD}"
+        cache_dir = os.path.join(work, "cache")
+        for name in [
+            "download_boot_files cold cache",
+            "download_boot_files warm cache",
+        ]:
+            # info.txt is memoized per process, start each stage without it
+            _info_txt.clear()
+            with stage(standin, results, name):
+                for board in boards:
+                    d = downloader()
+                    d.cache_dir = cache_dir
+                    d.reference_boot_folder = board
+                    d.output_folder = os.path.join(work, name.split()[1], board)
+                    os.makedirs(d.output_folder, exist_ok=True)
+                    d.download_boot_files(
+                        board,
+                        source="artifactory",
+                        source_root=standin.host,
+                        boot_partition=True,
+                        url_template=build_url,
+                    )
+
+        class standin_downloader(downloader):
+            def releases(self, release="bench"):
+                return {
+                    "imgname": os.path.join(work, "bench.img"),
+                    "xzname": os.path.join(work, "bench.img.xz"),
+                    "link": f"{standin.url}/artifactory/{REPO}/cse/bench.img.xz",
+                    "xzmd5": hashlib.md5(xz).hexdigest(),
+                    "imgmd5": hashlib.md5(image).hexdigest(),
+                }
+
+        with stage(standin, results, "download_sdcard_release"):
+            standin_downloader().download_sdcard_release("bench")
+
+        toolbox, branch, build = MATLAB
+        matlab_dir = os.path.join(work, "matlab")
+        os.makedirs(matlab_dir, exist_ok=True)
+        with stage(standin, results, "MATLAB bootbin flow"):
+            download_matlab_generate_bootbin(
+                "dev",
+                toolbox,
+                branch,
+                build,
+                None,
+                None,
+                matlab_dir,
+                server=standin.url,
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--boards", type=int, default=4)
+    parser.add_argument("--scale", type=float, default=1.0, help="file size factor")
+    parser.add_argument("--bootbins", type=int, default=16)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    os.environ.setdefault("TQDM_DISABLE", "1")
+
+    with tempfile.TemporaryDirectory() as work:
+        # Keep the default artifact cache of download_artifacts off the host
+        os.environ["NEBULA_CACHE_DIR"] = os.path.join(work, "cache")
+        results = run(args, work)
+
+    print(f"{'stage':34s} {'seconds':>8s} {'requests':>8s} {'MB':>8s} {'MB/s':>8s}")
+    for name, r in results.items():
+        print(
+            f"{name:34s} {r['seconds']:8.3f} {r['requests']:8d}"
+            f" {r['bytes'] / 1024**2:8.1f} {r['mb_per_s']:8.1f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,17 @@
 import platform
 
 from nebula.builder import builder
+from nebula.cache import artifact_cache
 from nebula.common import LINUX_DEFAULT_PATH, utils
 from nebula.coverage import coverage
 from nebula.downloader import downloader
 from nebula.driver import driver
 from nebula.helper import helper
+from nebula.integrity import multi_hash
 from nebula.jtag import jtag
 from nebula.manager import manager
+from nebula.manifest import manifest
+from nebula.mirror import mirror
 from nebula.netbox import NetboxDevice, NetboxDevices, netbox
 from nebula.netconsole import netconsole
 from nebula.network import network
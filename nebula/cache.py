@@ -0,0 +1,297 @@
+"""Persistent local cache for downloaded artifacts."""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from nebula.integrity import hash_file
+
+try:
+    import fcntl
+except ImportError:  # Windows, locks only cover threads of this process
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "nebula")
+DEFAULT_CACHE_SIZE = 10 * 1024**3
+
+
+class artifact_cache:
+    """Content addressed, size bounded artifact cache
+
+    Files are stored once under objects/ by their sha256. An index maps each
+    source URL to its object together with the ETag and Last-Modified
+    validators the server sent, so later fetches of the same URL can be
+    revalidated with a conditional GET and served as hard links.
+
+    Hard linked output files share their inode with the cached object, so
+    they are read-only (0444) and count towards max_size rather than disk
+    space of their own. Set hardlinks to False to get independent, writable
+    copies instead.
+
+    Attributes
+    ----------
+    cache_dir
+        Root folder of the cache. Defaults to NEBULA_CACHE_DIR or ~/.cache/nebula
+    max_size
+        Maximum size in bytes of all cached objects. Least recently used
+        entries are evicted once exceeded
+    hardlinks
+        Hard link cached objects into output folders. Copied otherwise, or
+        when cache_dir is on another filesystem
+    """
+
+    def __init__(self, cache_dir=None, max_size=None, hardlinks=True):
+        if not cache_dir:
+            cache_dir = os.environ.get("NEBULA_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.cache_dir = cache_dir
+        self.max_size = int(max_size) if max_size else DEFAULT_CACHE_SIZE
+        self.hardlinks = hardlinks
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.index_file = os.path.join(cache_dir, "index.json")
+        self._lock = threading.RLock()
+        self._index_fd = None
+        self._url_locks = {}
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def _object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the index across threads and, with a flock on index.lock,
+        across processes sharing cache_dir. Reentrant within a thread"""
+        with self._lock:
+            if fcntl is None or self._index_fd is not None:
+                yield
+                return
+            with open(os.path.join(self.cache_dir, "index.lock"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                self._index_fd = f
+                try:
+                    yield
+                finally:
+                    self._index_fd = None
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load_index(self):
+        if not os.path.isfile(self.index_file):
+            return {}
+        try:
+            with open(self.index_file, "r") as f:
+                return json.load(f)
+        except ValueError:
+            log.warning("Corrupt cache index, starting from scratch")
+            return {}
+
+    def _save_index(self, index):
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.index_file)
+
+    def lookup(self, url):
+        """Return index entry for url or None if not cached"""
+        with self._locked():
+            entry = self._load_index().get(url)
+        if entry and self._intact(entry):
+            return entry
+        return None
+
+    def _intact(self, entry):
+        # Objects are hard linked into output folders, so a file modified in
+        # place there changes the object too. They are read-only, but root
+        # writes anyway, so the sha256 is checked again once the object's
+        # mtime differs from the one recorded when it was stored
+        obj = self._object_path(entry["sha256"])
+        try:
+            st = os.stat(obj)
+        except FileNotFoundError:
+            return False
+        if st.st_size != entry["size"]:
+            return False
+        if st.st_mtime_ns == entry.get("mtime_ns"):
+            return True
+        return hash_file(obj)["sha256"] == entry["sha256"]
+
+    def validators(self, url):
+        """Build conditional request headers for a cached url"""
+        entry = self.lookup(url)
+        headers = {}
+        if not entry:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def partfile(self, url):
+        """Staging file for a download of url, kept across runs for resuming"""
+        partial = os.path.join(self.cache_dir, "partial")
+        os.makedirs(partial, exist_ok=True)
+        name = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(partial, name + ".part")
+
+    def _meta_path(self, kind, key):
+        name = hashlib.sha256(key.encode()).hexdigest() + ".json"
+        return os.path.join(self.cache_dir, "meta", kind, name)
+
+    def load_meta(self, kind, key):
+        """Cached metadata of kind stored under key, or None"""
+        try:
+            with open(self._meta_path(kind, key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store_meta(self, kind, key, value):
+        """Persist JSON serializable metadata, such as properties of a build
+        folder, next to the cached objects"""
+        path = self._meta_path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp, path)
+
+    @contextlib.contextmanager
+    def single_flight(self, url):
+        """Serialize downloads of url across threads and processes sharing
+        cache_dir. The holder of the lock leaves an in-progress marker naming
+        itself so waiting processes can report who they are waiting for.
+        """
+        locks = os.path.join(self.cache_dir, "locks")
+        os.makedirs(locks, exist_ok=True)
+        name = os.path.join(locks, hashlib.sha256(url.encode()).hexdigest())
+        marker = name + ".inprogress"
+        if fcntl is None:
+            with self._lock:
+                lock = self._url_locks.setdefault(url, threading.Lock())
+            with lock:
+                yield
+            return
+        with open(name + ".lock", "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                try:
+                    with open(marker) as m:
+                        owner = m.read().strip()
+                except OSError:
+                    owner = "another download"
+                log.info(f"Waiting for {owner} to finish {url}")
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                with open(marker, "w") as m:
+                    m.write(f"{socket.gethostname()}:{os.getpid()}")
+                yield
+            finally:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(marker)
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def store(self, url, filename, sha256, headers=None):
+        """Move a fully downloaded file into the cache and index it under url"""
+        headers = headers or {}
+        obj = self._object_path(sha256)
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        with self._locked():
+            index = self._load_index()
+            known = {"sha256": sha256, "size": os.path.getsize(filename)}
+            for entry in index.values():
+                if entry["sha256"] == sha256:
+                    known = entry
+                    break
+            if self._intact(known):
+                os.remove(filename)
+            else:
+                os.replace(filename, obj)
+                # Objects are shared through hard links, keep them read-only
+                # so writing to an output file cannot change the object
+                os.chmod(obj, 0o444)
+            st = os.stat(obj)
+            index[url] = {
+                "sha256": sha256,
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "atime": time.time(),
+                "stored": time.time(),
+            }
+            self._save_index(index)
+            self.evict(keep=sha256)
+        return obj
+
+    def link(self, url, dest):
+        """Materialize cached url at dest, hard linking when possible
+
+        Returns the sha256 of the linked file, or None if url is no longer
+        cached, for example because it was evicted by another process.
+        """
+        # Held until dest exists so evict and purge cannot remove the object
+        # in between
+        with self._locked():
+            index = self._load_index()
+            entry = index.get(url)
+            obj = self._object_path(entry["sha256"]) if entry else None
+            if not entry or not os.path.isfile(obj):
+                return None
+            entry["atime"] = time.time()
+            self._save_index(index)
+            if os.path.lexists(dest):
+                os.remove(dest)
+            try:
+                if not self.hardlinks:
+                    raise OSError("hard links disabled")
+                os.link(obj, dest)
+            except OSError:
+                shutil.copyfile(obj, dest)
+        return entry["sha256"]
+
+    def purge(self, url):
+        """Drop url from the index, and its object unless other URLs share it"""
+        with self._locked():
+            index = self._load_index()
+            entry = index.pop(url, None)
+            if entry is None:
+                return
+            if not any(e["sha256"] == entry["sha256"] for e in index.values()):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._object_path(entry["sha256"]))
+            self._save_index(index)
+
+    def evict(self, keep=None):
+        """Drop least recently used objects until cache fits in max_size"""
+        with self._locked():
+            index = self._load_index()
+            objects = {}
+            for url, entry in index.items():
+                sha = entry["sha256"]
+                atime = max(objects.get(sha, (0, 0))[0], entry["atime"])
+                objects[sha] = (atime, entry["size"])
+            total = sum(size for _, size in objects.values())
+            if total <= self.max_size:
+                return
+            for sha, (_, size) in sorted(objects.items(), key=lambda o: o[1][0]):
+                if total <= self.max_size:
+                    break
+                if sha == keep:
+                    continue
+                log.info(f"Evicting {sha} from artifact cache")
+                try:
+                    os.remove(self._object_path(sha))
+                except FileNotFoundError:
+                    pass
+                index = {u: e for u, e in index.items() if e["sha256"] != sha}
+                total -= size
+            self._save_index(index)
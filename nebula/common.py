@@ -1,8 +1,15 @@
 import logging
 import os
+import shutil
+import threading
 
 import yaml
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 import nebula.errors as ne
 
 LINUX_DEFAULT_PATH = "/etc/default/nebula"
@@ -42,6 +49,148 @@ def multi_device_check(configs, board_name):
     raise Exception("Selected board not found in configuration")
 
 
+# ioctl request cloning a file on btrfs, xfs and other CoW filesystems
+FICLONE = 0x40049409
+
+COPY_STRATEGIES = ["reflink", "hardlink", "copy_file_range", "sendfile", "copy"]
+
+
+def _reflink(src, dst):
+    if fcntl is None:
+        raise OSError("reflinks not supported")
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def _kernel_copy(src, dst, call):
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        remaining = os.fstat(s.fileno()).st_size
+        while remaining > 0:
+            sent = call(s.fileno(), d.fileno(), remaining)
+            if sent == 0:
+                raise OSError("short kernel copy")
+            remaining -= sent
+
+
+def _copy_file_range(src, dst):
+    if not hasattr(os, "copy_file_range"):
+        raise OSError("copy_file_range not supported")
+    _kernel_copy(src, dst, lambda s, d, n: os.copy_file_range(s, d, n))
+
+
+def _sendfile(src, dst):
+    if not hasattr(os, "sendfile"):
+        raise OSError("sendfile not supported")
+    _kernel_copy(src, dst, lambda s, d, n: os.sendfile(d, s, None, n))
+
+
+def fast_copy(src, dst, strategies=None):
+    """Copy file src to dst with the cheapest method the filesystem allows
+
+    Tries a reflink, a hard link, copy_file_range and sendfile before a plain
+    byte copy. Note a hard linked dst shares its data with src, so dst must
+    be replaced rather than modified in place. dst is replaced atomically.
+    Returns the name of the strategy used.
+    """
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    folder = os.path.dirname(os.path.abspath(dst))
+    methods = {
+        "reflink": _reflink,
+        "hardlink": os.link,
+        "copy_file_range": _copy_file_range,
+        "sendfile": _sendfile,
+        "copy": shutil.copyfile,
+    }
+    for strategy in strategies or COPY_STRATEGIES:
+        tmp = os.path.join(
+            folder, f".{os.path.basename(dst)}.{os.getpid()}.{threading.get_ident()}"
+        )
+        try:
+            methods[strategy](src, tmp)
+        except OSError as e:
+            log.debug(f"{strategy} of {src} failed: {e}")
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            continue
+        if strategy != "hardlink":
+            shutil.copymode(src, tmp)
+        os.replace(tmp, dst)
+        return strategy
+    raise Exception(f"Could not copy {src} to {dst}")
+
+
+BOARD_TABLE = os.path.join(os.path.dirname(__file__), "resources", "board_table.yaml")
+
+# Carrier names used by MATLAB bootbin artifacts that differ from board_table
+CARRIER_ALIASES = {
+    "ccbob_cmos": "ADRV1CRR-BOB",
+    "ccbob_lvds": "ADRV1CRR-BOB",
+    "ccpackrf_lvds": "ADRV-PACKRF",
+    "ccfmc_lvds": "ADRV1CRR-FMC",
+}
+
+
+class board_index:
+    """Parsed board_table.yaml with boards grouped by normalized carrier
+
+    Reference design lookups only scan the boards of the requested carrier
+    and their results are memoized per (fmc, carrier) pair.
+    """
+
+    def __init__(self, filename=BOARD_TABLE):
+        with open(filename) as f:
+            self.configs = yaml.load(f, Loader=yaml.FullLoader)
+        self.by_carrier = {}
+        for board, details in self.configs.items():
+            carrier = details["carrier"].lower().strip()
+            addons = [a.lower() for a in details.get("addons") or []]
+            has_addons = "addons" in details
+            self.by_carrier.setdefault(carrier, []).append(
+                (board, board.lower(), has_addons, addons)
+            )
+        self._designs = {}
+        self._lock = threading.Lock()
+
+    def carrier(self, fpga):
+        """Normalized carrier name with MATLAB aliases applied"""
+        fpga = fpga.lower().strip()
+        return CARRIER_ALIASES.get(fpga, fpga).lower()
+
+    def reference_design(self, fmc, fpga):
+        """Board of board_table matching fmc on carrier fpga, or None"""
+        key = (fmc.lower(), self.carrier(fpga))
+        with self._lock:
+            if key in self._designs:
+                return self._designs[key]
+        fmc_l, carrier = key
+        found = None
+        for board, board_l, has_addons, addons in self.by_carrier.get(carrier, []):
+            if fmc_l.strip() in board_l:
+                found = board
+                break
+            if has_addons and any(fmc_l in addon for addon in addons):
+                found = board
+                break
+        with self._lock:
+            self._designs[key] = found
+        return found
+
+
+_board_index = None
+_board_index_lock = threading.Lock()
+
+
+def get_board_index():
+    """Process wide board_index, built on first use"""
+    global _board_index
+    if _board_index is None:
+        with _board_index_lock:
+            if _board_index is None:
+                _board_index = board_index()
+    return _board_index
+
+
 class utils:
     def update_defaults_from_yaml(
         self, filename, configname=None, board_name=None, attr=None
@@ -1,5 +1,7 @@
+import contextlib
 import csv
 import hashlib
+import json
 import logging
 import lzma
 import ntpath
@@ -8,6 +10,9 @@ import pathlib
 import re
 import shutil
 import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 
@@ -15,18 +20,22 @@ import requests
 import yaml
 from artifactory import ArtifactoryPath
 from bs4 import BeautifulSoup
-from github import Github
 from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import ProtocolError, ReadTimeoutError
 from requests.packages.urllib3.util.retry import Retry
 from tqdm import tqdm
 
-from nebula.common import utils
+import nebula.errors as ne
+from nebula.cache import artifact_cache
+from nebula.common import fast_copy, get_board_index, multi_device_check, utils
+from nebula.integrity import hash_file, multi_hash, update_from_file
+from nebula.manifest import manifest_session, record_fields, record_file, start_manifest
 
 log = logging.getLogger(__name__)
 
 
-def listFD(url):
-    page = requests.get(url).text
+def listFD(url, session=None):
+    page = (session or requests).get(url).text
     soup = BeautifulSoup(page, "html.parser")
     return [url + "/" + node.get("href") for node in soup.find_all("a")]
 
@@ -60,7 +69,7 @@ def get_latest_release(links):
     return latest
 
 
-def get_newest_folder(links):
+def get_newest_folder(links, lister=listFD):
     dates = []
     for link in links:
         folder = link.split("/")[-2]
@@ -80,86 +89,423 @@ def get_newest_folder(links):
         if re.search(k, links[-1]):
             n = v
 
-    if len(listFD(links[-1])) < n:
+    if len(lister(links[-1])) < n:
         return dates[-2]
     else:
         return dates[-1]
 
 
-def get_gitsha(url, daily=False, linux=False, hdl=False, build_info=None):
-    dest = "outs"
-    if not os.path.isdir(dest):
-        os.mkdir(dest)
-    file = os.path.join(dest, "properties.yaml")
-    with open(file, "a+") as f:
-        path = ArtifactoryPath(str(url))
-        props = path.properties
-        exp = "20[1-2][0-9]_[0-1][0-9]_[0-3][0-9][-_][0-2][0-9]_[0-5][0-9](?:_[0-5][0-9])?"
+BUILD_FOLDER_RE = (
+    "20[1-2][0-9]_[0-1][0-9]_[0-3][0-9][-_][0-2][0-9]_[0-5][0-9](?:_[0-5][0-9])?"
+)
 
-        if build_info:
-            if build_info["Triggered by"] == "hdl":
-                props["linux_git_sha"] = ["NA"]
-                props["hdl_git_sha"] = [build_info["COMMIT SHA"]]
-            elif build_info["Triggered by"] == "linux":
-                props["linux_git_sha"] = [build_info["COMMIT SHA"]]
-                props["hdl_git_sha"] = ["NA"]
 
-        try:
-            if not daily:
-                bootpartition = {
+def build_folder(url):
+    """URL of the timestamped build folder containing url, or None"""
+    match = re.search(BUILD_FOLDER_RE, url)
+    return url[: match.end()] if match else None
+
+
+def get_gitsha(
+    url, daily=False, linux=False, hdl=False, build_info=None, resolver=None
+):
+    """Build folder and git SHAs of the artifact at url. Properties come from
+    the batched build folder query of resolver when available and from a
+    per file lookup otherwise."""
+    props = resolver.properties(url) if resolver else None
+    if props is None:
+        props = ArtifactoryPath(str(url)).properties
+    props = dict(props)
+    exp = BUILD_FOLDER_RE
+
+    if build_info:
+        if build_info["Triggered by"] == "hdl":
+            props["linux_git_sha"] = ["NA"]
+            props["hdl_git_sha"] = [build_info["COMMIT SHA"]]
+        elif build_info["Triggered by"] == "linux":
+            props["linux_git_sha"] = [build_info["COMMIT SHA"]]
+            props["hdl_git_sha"] = ["NA"]
+
+    recorded = {}
+    try:
+        if not daily:
+            recorded.update(
+                {
                     "bootpartition_folder": re.findall(exp, url)[0],
                     "linux_git_sha": props["linux_git_sha"][0],
                     "hdl_git_sha": props["hdl_git_sha"][0],
                 }
-                yaml.dump(bootpartition, f)
-            else:
-                if hdl:
-                    hdl_props = {
+            )
+        else:
+            if hdl:
+                recorded.update(
+                    {
                         "hdl_folder": re.findall(exp, url)[0],
                         "hdl_git_sha": props["git_sha"][0],
                     }
-                    yaml.dump(hdl_props, f)
-                if linux:
-                    linux_props = {
+                )
+            if linux:
+                recorded.update(
+                    {
                         "linux_folder": re.findall(exp, url)[0],
                         "linux_git_sha": props["git_sha"][0],
                     }
-                    yaml.dump(linux_props, f)
+                )
+    except Exception:
+        # TODO: fetch info.txt and get linux or hdl gitsha from there
+        recorded = {
+            "bootpartition_folder": re.findall(exp, url)[0],
+            "linux_git_sha": "NA",
+            "hdl_git_sha": "NA",
+        }
+    return recorded
+
+
+def write_properties(properties, build_info=None, dest="outs"):
+    """Write the merged properties of a download session to properties.yaml
+    and the manifest of dest"""
+    os.makedirs(dest, exist_ok=True)
+    with open(os.path.join(dest, "properties.yaml"), "w") as f:
+        yaml.dump(properties, f)
+    fields = {"properties": properties}
+    if build_info:
+        fields["build_info"] = build_info
+    record_fields(dest, **fields)
+
+
+class url_resolver:
+    """Resolve folder listings and newest build folders of the file server
+
+    Parsed listings and resolved build folders are cached for ttl seconds so
+    every file of a download session, or of several boards sharing a build,
+    triggers a single directory scrape per folder.
+    """
+
+    def __init__(self, ttl=300, session=None):
+        self.ttl = ttl
+        self.session = session
+        self._listings = {}
+        self._newest = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, store, key, func):
+        with self._lock:
+            hit = store.get(key)
+        if hit and time.monotonic() - hit[0] < self.ttl:
+            return hit[1]
+        value = func()
+        with self._lock:
+            store[key] = (time.monotonic(), value)
+        return value
+
+    def list(self, url):
+        """Cached listFD"""
+        return self._cached(
+            self._listings, url, lambda: listFD(url, session=self.session)
+        )
+
+    def newest_folder(self, url):
+        """Cached get_newest_folder of the listing at url"""
+        return self._cached(
+            self._newest,
+            url,
+            lambda: get_newest_folder(self.list(url), lister=self.list),
+        )
+
+    def checksum(self, url):
+        """Server side sha256 of url if known"""
+        return None
+
+    def properties(self, url):
+        """Server side properties of url if known"""
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+            self._newest.clear()
+
+
+class artifactory_resolver(url_resolver):
+    """Resolve folders through the Artifactory storage API
+
+    Listings come from the JSON storage API instead of scraping the HTML
+    index pages. A deep listing of a folder returns size and sha256 of every
+    file in one query, which is used to verify downloads. With credentials
+    on the session, properties of all files of a build folder come from a
+    single AQL query. AQL is not open to anonymous users, so without them
+    each file's properties come from the storage API. As build folders do
+    not change, properties are kept in the artifact cache if one is given.
+    Servers or URLs the API cannot handle fall back to listFD.
+    """
+
+    def __init__(self, ttl=300, session=None, cache=None):
+        super().__init__(ttl, session)
+        self.cache = cache
+        self._files = {}
+        self._props = {}
+        self._unsupported = set()
+        self._no_search = set()
+
+    @staticmethod
+    def _split(url):
+        """Split url into Artifactory base and repo path"""
+        if "/artifactory/" not in url:
+            return None, None
+        base, path = url.split("/artifactory/", 1)
+        path = re.sub("/+", "/", path).strip("/")
+        return base + "/artifactory", path
+
+    def _storage(self, url, params=""):
+        base, path = self._split(url)
+        if not base or base in self._unsupported:
+            raise ValueError("Storage API not available for " + url)
+        resp = (self.session or requests).get(f"{base}/api/storage/{path}{params}")
+        if resp.status_code == 404:
+            raise FileNotFoundError(url)
+        try:
+            resp.raise_for_status()
+            return resp.json()
+        except Exception:
+            log.info(f"Storage API not available on {base}, using index pages")
+            with self._lock:
+                self._unsupported.add(base)
+            raise
+
+    def _list_storage(self, url):
+        # Same shape as listFD of the index page, including its ../ entry,
+        # as get_newest_folder's completeness thresholds count those links
+        children = self._storage(url).get("children", [])
+        children.sort(key=lambda c: c["uri"])
+        url = url.rstrip("/")
+        links = [url + "/../"]
+        links += [url + c["uri"] + ("/" if c.get("folder") else "") for c in children]
+        return links
+
+    def list(self, url):
+        """Folder listing in listFD format, from the storage API if possible"""
+        try:
+            return self._cached(self._listings, url, lambda: self._list_storage(url))
+        except FileNotFoundError:
+            return []
         except Exception:
-            # TODO: fetch info.txt and get linux or hdl gitsha from there
-            bootpartition = {
-                "bootpartition_folder": re.findall(exp, url)[0],
-                "linux_git_sha": "NA",
-                "hdl_git_sha": "NA",
+            return super().list(url)
+
+    def folder_files(self, url):
+        """Map of file url to size and sha256 of every file under folder url"""
+
+        def query():
+            files = self._storage(url, "?list&deep=1").get("files", [])
+            root = url.rstrip("/")
+            return {
+                root + f["uri"]: {"size": f.get("size"), "sha256": f.get("sha2")}
+                for f in files
+                if not f.get("folder")
+            }
+
+        return self._cached(self._files, url, query)
+
+    def checksum(self, url):
+        try:
+            files = self.folder_files(url.rsplit("/", 1)[0])
+        except Exception:
+            return None
+        entry = files.get(url.rstrip("/"))
+        return entry["sha256"] if entry else None
+
+    def _folder_properties(self, folder):
+        if self.cache:
+            props = self.cache.load_meta("properties", folder)
+            if props is not None:
+                return props
+        base, path = self._split(folder)
+        if not base:
+            raise ValueError("Not an Artifactory URL " + folder)
+        repo, _, path = path.partition("/")
+        query = (
+            "items.find({"
+            f'"repo": {json.dumps(repo)}, "$or": [{{"path": {json.dumps(path)}}}, '
+            f'{{"path": {{"$match": {json.dumps(path + "/*")}}}}}]'
+            '}).include("repo", "path", "name", "property")'
+        )
+        resp = (self.session or requests).post(
+            f"{base}/api/search/aql",
+            data=query,
+            headers={"Content-Type": "text/plain"},
+        )
+        resp.raise_for_status()
+        props = {}
+        for item in resp.json().get("results", []):
+            values = {}
+            for prop in item.get("properties", []):
+                values.setdefault(prop["key"], []).append(prop.get("value"))
+            props[f"{base}/{item['repo']}/{item['path']}/{item['name']}"] = values
+        if self.cache:
+            self.cache.store_meta("properties", folder, props)
+        return props
+
+    def _file_properties(self, url):
+        if self.cache:
+            props = self.cache.load_meta("properties", url)
+            if props is not None:
+                return props
+        try:
+            props = self._storage(url, "?properties").get("properties", {})
+        except FileNotFoundError:
+            # Artifactory answers 404 for files without properties
+            props = {}
+        if self.cache:
+            self.cache.store_meta("properties", url, props)
+        return props
+
+    def _has_credentials(self):
+        session = self.session
+        return session is not None and bool(
+            getattr(session, "auth", None) or "Authorization" in session.headers
+        )
+
+    def properties(self, url):
+        """Properties of url, from one query for its whole build folder when
+        the session can use AQL"""
+        folder = build_folder(url)
+        base, path = self._split(url)
+        if not folder or not base or base in self._no_search:
+            return None
+        url = f"{base}/{path}"
+        try:
+            if not self._has_credentials():
+                return self._cached(
+                    self._props, url, lambda: self._file_properties(url)
+                )
+            props = self._cached(
+                self._props, folder, lambda: self._folder_properties(folder)
+            )
+        except Exception as e:
+            log.info(f"Property search not available on {base}: {e}")
+            with self._lock:
+                self._no_search.add(base)
+            return None
+        return props.get(url)
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self._files.clear()
+            self._props.clear()
+
+
+GITHUB_API = "https://api.github.com"
+
+# Release assets are addressed by tag and never change once published
+RELEASE_ASSET_RE = re.compile(r"^https://github\.com/[^/]+/[^/]+/releases/download/")
+
+
+class github_resolver:
+    """Resolve the newest release of GitHub repositories
+
+    Tags are kept for ttl seconds in memory and, if a cache is given, in the
+    artifact cache so separate processes share them. Expired entries are
+    revalidated with their ETag, which GitHub answers with 304 without
+    counting it against the rate limit. When the API is not reachable or
+    the rate limit is exhausted, the last known tag is used.
+
+    Attributes
+    ----------
+    token
+        GitHub token raising the rate limit. Defaults to GITHUB_TOKEN
+    """
+
+    def __init__(self, ttl=300, session=None, cache=None, token=None):
+        self.ttl = ttl
+        self.session = session
+        self.cache = cache
+        self.token = token or os.environ.get("GITHUB_TOKEN")
+        self._releases = {}
+        self._lock = threading.Lock()
+
+    def _load(self, repo):
+        with self._lock:
+            entry = self._releases.get(repo)
+        if not entry and self.cache:
+            entry = self.cache.load_meta("github_releases", repo)
+        return entry
+
+    def _store(self, repo, entry):
+        with self._lock:
+            self._releases[repo] = entry
+        if self.cache:
+            self.cache.store_meta("github_releases", repo, entry)
+
+    def latest_release(self, repo):
+        """Tag name of the newest release of repo, given as owner/name"""
+        entry = self._load(repo)
+        if entry and time.time() - entry["checked"] < self.ttl:
+            return entry["tag"]
+        headers = {"Accept": "application/vnd.github+json"}
+        if self.token:
+            headers["Authorization"] = "Bearer " + self.token
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        try:
+            resp = (self.session or requests).get(
+                f"{GITHUB_API}/repos/{repo}/releases",
+                params={"per_page": 1},
+                headers=headers,
+            )
+        except requests.RequestException as e:
+            if not entry:
+                raise
+            log.warning(f"GitHub not reachable ({e}), using {entry['tag']}")
+            return entry["tag"]
+        if resp.status_code == 304:
+            entry = dict(entry, checked=time.time())
+        elif resp.ok and resp.json():
+            entry = {
+                "tag": resp.json()[0]["tag_name"],
+                "etag": resp.headers.get("ETag"),
+                "checked": time.time(),
             }
-            yaml.dump(bootpartition, f)
+        elif entry:
+            log.warning(
+                f"Releases of {repo} not available ({resp.status_code}),"
+                f" using {entry['tag']}"
+            )
+            return entry["tag"]
+        else:
+            raise Exception(f"Releases of {repo} not available ({resp.status_code})")
+        self._store(repo, entry)
+        return entry["tag"]
+
+    def clear(self):
+        with self._lock:
+            self._releases.clear()
 
 
-def gen_url(ip, branch, folder, filename, addl, url_template):
+def gen_url(ip, branch, folder, filename, addl, url_template, resolver=None):
+    if resolver is None:
+        resolver = url_resolver()
     if branch == "main":
         if bool(re.search("boot_partition", url_template)):
             url = url_template.format(ip, branch, "", "")
             # folder = BUILD_DATE/PROJECT_FOLDER
-            folder = (
-                get_newest_folder(listFD(url[:-1])) + "/boot_partition/" + str(folder)
-            )
+            folder = resolver.newest_folder(url[:-1]) + "/boot_partition/" + str(folder)
             return url_template.format(ip, branch, folder, filename)
         elif bool(re.search("hdl", url_template)):
             url = url_template.format(ip, addl, "", "")
-            folder = get_newest_folder(listFD(url[:-1])) + "/" + str(folder)
+            folder = resolver.newest_folder(url[:-1]) + "/" + str(folder)
             return url_template.format(ip, addl, folder, filename)
         else:
             url = url_template.format(ip, "", "")
             # folder = BUILD_DATE/PROJECT_FOLDER
-            folder = get_newest_folder(listFD(url[:-1])) + "/" + str(folder)
+            folder = resolver.newest_folder(url[:-1]) + "/" + str(folder)
             return url_template.format(ip, folder, filename)
     else:
         url = url_template.format(ip, "", "", "")
         if branch == "release" or branch == "release_latest":
             if bool(re.search("hdl", url_template)):
-                release_folder = get_latest_release(listFD(url)) + "/" + addl
+                release_folder = get_latest_release(resolver.list(url)) + "/" + addl
             else:
-                release_folder = get_latest_release(listFD(url))
+                release_folder = get_latest_release(resolver.list(url))
         else:
             if bool(re.search("boot_partition", url_template)):
                 release_folder = branch.lower()
@@ -169,7 +515,7 @@ def gen_url(ip, branch, folder, filename, addl, url_template):
                 release_folder = branch.upper()
         url = url_template.format(ip, release_folder, "", "")
         # folder = BUILD_DATE/PROJECT_FOLDER
-        folder = get_newest_folder(listFD(url[:-1])) + "/" + str(folder)
+        folder = resolver.newest_folder(url[:-1]) + "/" + str(folder)
         return url_template.format(ip, release_folder, folder, filename)
 
 
@@ -179,10 +525,15 @@ def list_files_in_remote_folder(url):
     return path.listdir()
 
 
-def get_artifact_paths(toolbox, branch, build, ext, root="dev"):
+ARTIFACTORY_SERVER = "https://artifactory.analog.com"
+
+
+def get_artifact_paths(
+    toolbox, branch, build, ext, root="dev", server=ARTIFACTORY_SERVER
+):
     log.info(f"Getting {ext} files from {branch} build {build} in {toolbox}")
     path = ArtifactoryPath(
-        f"https://artifactory.analog.com/artifactory/sdg-generic-development/{toolbox}/{root}/{branch}/{build}"
+        f"{server}/artifactory/sdg-generic-development/{toolbox}/{root}/{branch}/{build}"
     )
     filename_urls = []
     for path in path.iterdir():
@@ -211,42 +562,562 @@ def filter_boards(paths, fmc, fpga):
     return filtered_paths, rd_names
 
 
-def download_artifact(path, output_folder):
-    if not os.path.isdir(output_folder):
-        os.mkdir(output_folder)
+def download_artifact(
+    path, output_folder, cache=None, resolver=None, session=None, bar=None
+):
+    """Download ArtifactoryPath path into output_folder. The download is
+    skipped when the file is already present with the sha256 reported by
+    resolver. Returns the sha256 of the file.
+    """
+    os.makedirs(output_folder, exist_ok=True)
     out_filename = os.path.join(output_folder, path.name)
+    reference = resolver.checksum(str(path)) if resolver else None
+    if (
+        reference
+        and os.path.isfile(out_filename)
+        and hash_file(out_filename)["sha256"] == reference
+    ):
+        log.info(f"{out_filename} is up to date, skipping download")
+        return reference
     log.info(f"Downloading {out_filename} from {str(path)}")
-    with path.open() as fd, open(out_filename, "wb") as out:
-        out.write(fd.read())
+    if cache is None:
+        cache = artifact_cache()
+    return fetch_file(
+        str(path),
+        out_filename,
+        session=session or path.session,
+        cache=cache,
+        bar=bar,
+        expected_sha256=reference,
+    )
 
 
-def translate_to_reference_design_name(fmc, fpga):
-    path = pathlib.Path(__file__).parent.absolute()
-    res = os.path.join(path, "resources", "board_table.yaml")
-    with open(res) as f:
-        board_configs = yaml.load(f, Loader=yaml.FullLoader)
-
-    if fpga.lower().strip() == "CCBOB_CMOS".lower():
-        fpga = "ADRV1CRR-BOB"
-    if fpga.lower().strip() == "CCBOB_LVDS".lower():
-        fpga = "ADRV1CRR-BOB"
-    if fpga.lower().strip() == "CCPACKRF_LVDS".lower():
-        fpga = "ADRV-PACKRF"
-    if fpga.lower().strip() == "CCFMC_LVDS".lower():
-        fpga = "ADRV1CRR-FMC"
-
-    for board in board_configs:
-        if board_configs[board]["carrier"].lower().strip() == fpga.lower().strip() and (
-            "addons" in board_configs[board] or fmc.lower().strip() in board.lower()
-        ):
-            if fmc.lower().strip() in board.lower():
-                return board
-            for addon in board_configs[board]["addons"]:
-                if fmc.lower() in addon.lower():
-                    return board
+def download_artifacts(paths, output_folder, workers=4, cache=None, resolver=None):
+    """Download ArtifactoryPaths into output_folder with a bounded thread pool.
+    Files are streamed to disk in chunks, so memory use does not depend on
+    artifact size. Checksums of all files in a folder come from a single
+    storage API query.
+    """
+    if not paths:
+        return []
+    if cache is None:
+        cache = artifact_cache()
+    session = paths[0].session
+    if resolver is None:
+        resolver = artifactory_resolver(session=session)
+    workers = max(1, min(int(workers), len(paths)))
+    with tqdm(
+        desc=f"Downloading {len(paths)} files",
+        total=0,
+        unit="iB",
+        unit_scale=True,
+        unit_divisor=1024,
+    ) as bar, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                download_artifact, path, output_folder, cache, resolver, session, bar
+            )
+            for path in paths
+        ]
+        return [future.result() for future in futures]
+
+
+class bandwidth_limiter:
+    """Token bucket capping the combined rate of the transfers sharing it
+
+    Attributes
+    ----------
+    rate
+        Maximum transfer rate in bytes per second
+    """
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self._tokens = self.rate
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, size):
+        """Account for size transferred bytes, sleeping when over the rate"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= size
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+# Read sizes of the download writer and the minimum seconds between
+# progress bar updates
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+PROGRESS_INTERVAL = 0.1
+
+
+def _progress(desc, total, bar=None):
+    if bar is None:
+        return tqdm(
+            desc=desc,
+            total=total,
+            unit="iB",
+            unit_scale=True,
+            unit_divisor=1024,
+        )
+    # Shared progress bar of a download plan
+    with bar.get_lock():
+        bar.total += total
+        bar.refresh()
+    return contextlib.nullcontext(bar)
+
+
+def _preallocate(file, size):
+    """Reserve size bytes for file up front where the platform supports it"""
+    if not size or not hasattr(os, "posix_fallocate"):
+        file.truncate(size)
+        return
+    try:
+        os.posix_fallocate(file.fileno(), 0, size)
+    except OSError:
+        file.truncate(size)
+
+
+def _chunks(resp):
+    """Yield the body of a streamed response as views into one reused buffer.
+    Reads start at MIN_CHUNK and double up to MAX_CHUNK while they come back
+    full, so fast links need few Python level iterations and slow ones still
+    report progress."""
+    raw = getattr(resp, "raw", None)
+    if (
+        not hasattr(raw, "readinto")
+        or resp.headers.get("content-encoding", "identity") != "identity"
+    ):
+        # Compressed bodies have to be decoded by requests
+        yield from resp.iter_content(chunk_size=MAX_CHUNK)
+        return
+    view = memoryview(bytearray(MAX_CHUNK))
+    size = MIN_CHUNK
+    try:
+        while True:
+            n = raw.readinto(view[:size])
+            if not n:
+                return
+            yield view[:n]
+            if n == size and size < MAX_CHUNK:
+                size *= 2
+    except ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+    except ReadTimeoutError as e:
+        raise requests.ConnectionError(e)
+
+
+def _copy_response(resp, file, hasher=None, bar=None, limiter=None):
+    """Write the body of resp to file, updating bar at most every
+    PROGRESS_INTERVAL seconds. Returns the number of bytes written"""
+    written = pending = 0
+    last = time.monotonic()
+    for data in _chunks(resp):
+        file.write(data)
+        if hasher:
+            hasher.update(data)
+        if limiter:
+            limiter.consume(len(data))
+        written += len(data)
+        pending += len(data)
+        now = time.monotonic()
+        if bar is not None and now - last >= PROGRESS_INTERVAL:
+            bar.update(pending)
+            pending = 0
+            last = now
+    if bar is not None:
+        bar.update(pending)
+    return written
+
+
+def _write_response(resp, fname, desc=None, bar=None, offset=0, limiter=None):
+    total = int(resp.headers.get("content-length", 0))
+    if offset:
+        # Resumed transfer, account for the bytes already on disk
+        sha256_hash = update_from_file(multi_hash(), fname, offset)
+        mode = "ab"
+    else:
+        sha256_hash = multi_hash()
+        mode = "wb"
+    with open(fname, mode) as file, _progress(desc or fname, total, bar) as bar:
+        if not offset and total:
+            _preallocate(file, total)
+        try:
+            _copy_response(resp, file, sha256_hash, bar, limiter)
+        finally:
+            # Drop the preallocated tail so an interrupted transfer resumes
+            # from the bytes actually received
+            file.truncate(file.tell())
+    return sha256_hash.hexdigest()
+
+
+def _range_segment(
+    session, url, fname, start, end, validator, bar, retries, limiter=None
+):
+    headers = {"Range": f"bytes={start}-{end}"}
+    if validator:
+        headers["If-Range"] = validator
+    for attempt in range(retries + 1):
+        try:
+            resp = session.get(url, stream=True, headers=headers)
+            if resp.status_code != 206:
+                raise Exception(f"Range request not honored for {url}")
+            with open(fname, "r+b") as file:
+                file.seek(start)
+                _copy_response(resp, file, bar=bar, limiter=limiter)
+            return
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            if attempt == retries:
+                raise
+            log.warning(f"Range {start}-{end} of {url} interrupted, retrying")
+
+
+def _fetch_ranges(
+    session, url, fname, total, parallel, validator, desc, bar, retries, limiter=None
+):
+    """Download url with parallel range requests, reassembled in place in fname"""
+    with open(fname, "wb") as file:
+        _preallocate(file, total)
+    step = -(-total // parallel)
+    ranges = [(start, min(start + step, total) - 1) for start in range(0, total, step)]
+    with _progress(desc, total, bar) as bar, ThreadPoolExecutor(parallel) as pool:
+        futures = [
+            pool.submit(
+                _range_segment,
+                session,
+                url,
+                fname,
+                s,
+                e,
+                validator,
+                bar,
+                retries,
+                limiter,
+            )
+            for s, e in ranges
+        ]
+        for future in as_completed(futures):
+            future.result()
+    return hash_file(fname)["sha256"]
+
+
+def fetch_file(
+    url,
+    fname,
+    session=None,
+    cache=None,
+    bar=None,
+    parallel=1,
+    retries=3,
+    limiter=None,
+    immutable=False,
+    expected_sha256=None,
+):
+    """Download url to fname, going through the artifact cache if given.
+    Cached entries are revalidated with a conditional GET and, when unchanged,
+    hard linked into place instead of transferred again. A shared tqdm bar
+    can be passed to report progress of several concurrent downloads.
+
+    Data is staged in a .part file. Interrupted transfers, including ones
+    from previous runs, resume from the partial file with HTTP Range
+    requests guarded by If-Range. With parallel > 1, servers accepting range
+    requests are fetched with that many concurrent range requests.
+
+    With a cache, concurrent fetches of url by other threads or processes
+    sharing the cache directory are single-flighted: one transfers the file
+    while the others wait and then hard link the result. A bandwidth_limiter
+    caps the transfer rate. Cached copies of immutable URLs, such as release
+    assets of a tag, are linked without asking the server.
+
+    With expected_sha256, a download not matching it raises an exception
+    before it reaches the cache, and cached copies not matching it are
+    purged and downloaded again.
+
+    Returns the sha256 of the file.
+    """
+    args = (session, cache, bar, parallel, retries, limiter, expected_sha256)
+    if cache is None:
+        return _fetch_file(url, fname, *args)
+    if immutable and cache.lookup(url):
+        log.info(f"{os.path.basename(fname)} found in cache")
+        sha256 = _link_cached(cache, url, fname, expected_sha256)
+        if sha256:
+            return sha256
+    before = cache.lookup(url)
+    with cache.single_flight(url):
+        after = cache.lookup(url)
+        if after and (not before or after.get("stored") != before.get("stored")):
+            log.info(f"{os.path.basename(fname)} fetched concurrently, linking it")
+            sha256 = _link_cached(cache, url, fname, expected_sha256)
+            if sha256:
+                return sha256
+        return _fetch_file(url, fname, *args)
+
+
+def _link_cached(cache, url, fname, expected_sha256=None):
+    """Link the cached copy of url to fname. None is returned when it is
+    gone from the cache, and a copy not matching expected_sha256 is purged
+    from the cache"""
+    sha256 = cache.link(url, fname)
+    if not sha256:
+        log.info(f"{os.path.basename(fname)} dropped from cache, downloading it")
+        return None
+    if not expected_sha256 or sha256 == expected_sha256:
+        return sha256
+    log.warning(f"Cached copy of {url} does not match its checksum, dropping it")
+    cache.purge(url)
+    os.remove(fname)
     return None
 
 
+def _request_part(session, url, part, validator_file, headers):
+    """GET url, resuming part with If-Range when its validator is known.
+    Returns the response and the offset the part file continues from"""
+    while True:
+        offset = os.path.getsize(part) if os.path.isfile(part) else 0
+        validator = None
+        if offset and os.path.isfile(validator_file):
+            with open(validator_file) as f:
+                validator = f.read().strip()
+        req_headers = dict(headers)
+        if validator:
+            req_headers["Range"] = f"bytes={offset}-"
+            req_headers["If-Range"] = validator
+        resp = session.get(url, stream=True, headers=req_headers)
+        if resp.status_code != 416:
+            return resp, offset
+        # Partial file does not match the remote file anymore
+        resp.close()
+        os.remove(part)
+
+
+def _save_validator(resp, validator_file):
+    """Keep the ETag or Last-Modified of resp next to its part file"""
+    validator = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+    if validator:
+        with open(validator_file, "w") as f:
+            f.write(validator)
+    elif os.path.isfile(validator_file):
+        os.remove(validator_file)
+    return validator
+
+
+def _fetch_file(
+    url, fname, session, cache, bar, parallel, retries, limiter, expected_sha256=None
+):
+    session = session or requests.Session()
+    part = cache.partfile(url) if cache else fname + ".part"
+    validator_file = part + ".validator"
+    headers = cache.validators(url) if cache else {}
+    attempt = 0
+    while True:
+        resp, offset = _request_part(session, url, part, validator_file, headers)
+        if cache and resp.status_code == 304:
+            resp.close()
+            log.info(f"{os.path.basename(fname)} unchanged, using cached copy")
+            sha256 = _link_cached(cache, url, fname, expected_sha256)
+            if sha256:
+                return sha256
+            headers = {}
+            continue
+        if not resp.ok:
+            raise Exception(os.path.basename(fname) + " - File not found!")
+        if resp.status_code == 206:
+            log.info(f"Resuming {os.path.basename(fname)} from byte {offset}")
+        else:
+            offset = 0
+        new_validator = _save_validator(resp, validator_file)
+
+        total = int(resp.headers.get("content-length", 0))
+        try:
+            if (
+                parallel > 1
+                and not offset
+                and total
+                and resp.headers.get("Accept-Ranges") == "bytes"
+            ):
+                resp.close()
+                sha256 = _fetch_ranges(
+                    session,
+                    url,
+                    part,
+                    total,
+                    parallel,
+                    new_validator,
+                    fname,
+                    bar,
+                    retries,
+                    limiter,
+                )
+            else:
+                sha256 = _write_response(resp, part, fname, bar, offset, limiter)
+            break
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            attempt += 1
+            if attempt > retries:
+                raise
+            log.warning(f"Download of {url} interrupted, resuming")
+
+    if os.path.isfile(validator_file):
+        os.remove(validator_file)
+    if expected_sha256 and sha256 != expected_sha256:
+        os.remove(part)
+        raise Exception(f"{os.path.basename(fname)} - Checksum mismatch for {url}")
+    if cache and os.path.getsize(part) <= cache.max_size:
+        cache.store(url, part, sha256, resp.headers)
+        linked = _link_cached(cache, url, fname)
+        if linked:
+            return linked
+        # Evicted by another process right after storing it
+        return _fetch_file(url, fname, session, None, bar, parallel, retries, limiter)
+    # Replace instead of writing through an existing hard link into the cache
+    if os.path.lexists(fname):
+        os.remove(fname)
+    shutil.move(part, fname)
+    return sha256
+
+
+def stream_xz_image(
+    url,
+    session=None,
+    xz_md5=None,
+    img_md5=None,
+    tee=None,
+    chunk_size=1024 * 1024,
+    retries=3,
+):
+    """Download and decompress an .xz image in a single pass.
+
+    Yields the decompressed image in chunks. The md5 of the compressed and
+    of the decompressed data are computed as the bytes go by and checked
+    against xz_md5 and img_md5 once the stream is exhausted. Dropped
+    connections are resumed with range requests without restarting the
+    decompressor. If tee is set the compressed data is also saved there,
+    staged in a .part file like fetch_file does, so a later run resumes
+    an interrupted download.
+    """
+    return decompress_xz(
+        _stream_xz(url, session, tee, chunk_size, retries),
+        os.path.basename(url),
+        xz_md5,
+        img_md5,
+    )
+
+
+def _stream_xz(url, session, tee, chunk_size, retries):
+    if not tee:
+        yield from _download_chunks(url, session, chunk_size, retries)
+        return
+    part = tee + ".part"
+    validator_file = part + ".validator"
+    offset = 0
+    validator = None
+    if os.path.isfile(part) and os.path.isfile(validator_file):
+        with open(validator_file) as f:
+            validator = f.read().strip()
+        offset = os.path.getsize(part)
+        log.info(f"Resuming {os.path.basename(url)} from byte {offset}")
+        with open(part, "rb") as f:
+            yield from iter(lambda: f.read(chunk_size), b"")
+    with open(part, "ab" if offset else "wb") as tee_file:
+        for data in _download_chunks(
+            url, session, chunk_size, retries, offset, validator, validator_file
+        ):
+            tee_file.write(data)
+            yield data
+    if os.path.isfile(validator_file):
+        os.remove(validator_file)
+    os.replace(part, tee)
+
+
+def _request_from(session, url, offset, validator):
+    headers = {}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        if validator:
+            headers["If-Range"] = validator
+    resp = session.get(url, stream=True, headers=headers)
+    if not resp.ok:
+        raise Exception(os.path.basename(url) + " - File not found!")
+    return resp
+
+
+def _download_chunks(
+    url, session, chunk_size, retries, offset=0, validator=None, validator_file=None
+):
+    """Yield the bytes of url from offset on, resuming dropped connections
+    with range requests. The validator of a fresh download is saved to
+    validator_file, if given, so a later run can resume it"""
+    session = session or requests.Session()
+    attempt = 0
+    bar = None
+    try:
+        while True:
+            resp = _request_from(session, url, offset, validator)
+            if offset and resp.status_code != 206:
+                if validator_file and os.path.isfile(validator_file):
+                    os.remove(validator_file)
+                raise Exception(f"Cannot resume {url}, remote file changed")
+            if bar is None:
+                if not offset:
+                    validator = resp.headers.get("ETag") or resp.headers.get(
+                        "Last-Modified"
+                    )
+                    if validator_file:
+                        _save_validator(resp, validator_file)
+                bar = _progress(
+                    "Downloading: " + os.path.basename(url),
+                    offset + int(resp.headers.get("content-length", 0)),
+                )
+                bar.update(offset)
+            try:
+                for data in resp.iter_content(chunk_size=chunk_size):
+                    offset += len(data)
+                    bar.update(len(data))
+                    yield data
+                return
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                attempt += 1
+                if attempt > retries:
+                    raise
+                log.warning(f"Download of {url} interrupted, resuming")
+    finally:
+        if bar is not None:
+            bar.close()
+
+
+def decompress_xz(chunks, name, xz_md5=None, img_md5=None):
+    """Decompress an iterator over .xz data, yielding the decompressed chunks.
+    The md5 of both sides is checked against xz_md5 and img_md5 at the end,
+    raising MD5CheckFailed on a mismatch.
+    """
+    decompressor = lzma.LZMADecompressor()
+    xz_hash = hashlib.md5()
+    img_hash = hashlib.md5()
+    for data in chunks:
+        xz_hash.update(data)
+        result = decompressor.decompress(data)
+        if result:
+            img_hash.update(result)
+            yield result
+
+    if not decompressor.eof:
+        raise Exception("Truncated xz stream: " + name)
+    if xz_md5 and xz_hash.hexdigest() != xz_md5:
+        raise ne.MD5CheckFailed(name)
+    if img_md5 and img_hash.hexdigest() != img_md5:
+        raise ne.MD5CheckFailed("decompressed image")
+
+
+def translate_to_reference_design_name(fmc, fpga):
+    return get_board_index().reference_design(fmc, fpga)
+
+
 def interpret_bootbin(filename):
     parts = filename.split("(")
     if len(parts) != 2:
@@ -279,16 +1150,17 @@ def download_matlab_generate_bootbin(
     target_fpga,
     download_folder,
     skip_download=False,
+    workers=4,
+    server=ARTIFACTORY_SERVER,
 ):
-    paths = get_artifact_paths(toolbox, branch, build, ".BIN", root)
+    paths = get_artifact_paths(toolbox, branch, build, ".BIN", root, server)
     # paths = [path.name for path in paths]
     # paths, rd_names = filter_boards(paths, target_fmc, target_fpga)
     rd_names = []
     if len(paths) == 0:
         raise ValueError("No artifacts found that meet criteria")
     if not skip_download:
-        for path in paths:
-            download_artifact(path, download_folder)
+        download_artifacts(paths, download_folder, workers=workers)
     return paths, rd_names
 
 
@@ -300,36 +1172,66 @@ def sanitize_artifactory_url(url):
     return url
 
 
-def get_info_txt(url):
-    art_path = ArtifactoryPath(sanitize_artifactory_url(url))
-    info_txt_path = None
-    for p in art_path:
-        if "info.txt" in str(p):
-            info_txt_path = p
-            break
-
-    if not info_txt_path:
-        raise Exception("Missing info.txt")
-
-    log.info("Parsing info.txt")
+def parse_info_txt(content):
+    """Parse the text of a build info.txt into a dict"""
     build_info = {"built_projects": []}
-    with info_txt_path.open() as fd:
-        with open("info.txt", "wb") as out:
-            content = fd.read()
-            out.write(content)
-            info_txt = content.decode("utf-8").split("\n")
-            for line in info_txt:
-                match = re.match(r"[\s-]*(.+):(.+)", line)
-                if match:
-                    build_info.update({match.group(1).strip(): match.group(2).strip()})
-                else:
-                    match = re.match(r"\s+-\s([-\w]+)", line)
-                    if match:
-                        build_info["built_projects"].append(match.group(1))
-
+    for line in content.split("\n"):
+        match = re.match(r"[\s-]*(.+):(.+)", line)
+        if match:
+            build_info.update({match.group(1).strip(): match.group(2).strip()})
+        else:
+            match = re.match(r"\s+-\s([-\w]+)", line)
+            if match:
+                build_info["built_projects"].append(match.group(1))
     return build_info
 
 
+_info_txt = {}
+_info_txt_lock = threading.Lock()
+
+
+def _fetch_info_txt(folder, session=None, lister=None):
+    resp = (session or requests).get(folder + "/info.txt")
+    if resp.ok:
+        return resp.content.decode("utf-8")
+    # info.txt not at the expected path, look for it in the folder listing
+    lister = lister or (lambda url: listFD(url, session=session))
+    for link in lister(folder + "/"):
+        if link.rstrip("/").endswith("info.txt"):
+            resp = (session or requests).get(link)
+            resp.raise_for_status()
+            return resp.content.decode("utf-8")
+    raise Exception("Missing info.txt")
+
+
+def get_info_txt(url, resolver=None, cache=None, save_to=None):
+    """Parsed info.txt of the build folder at url
+
+    info.txt is fetched straight from the root of the build folder, using the
+    folder listing only if it is not there. Results are kept per build folder
+    for the life of the process and, if cache is given, in the artifact cache.
+    With save_to the raw file is also written to that path.
+    """
+    folder = sanitize_artifactory_url(url).rstrip("/")
+    with _info_txt_lock:
+        text = _info_txt.get(folder)
+    if text is None and cache:
+        text = cache.load_meta("info_txt", folder)
+    if text is None:
+        log.info(f"Fetching info.txt of {folder}")
+        session = resolver.session if resolver else None
+        lister = resolver.list if resolver else None
+        text = _fetch_info_txt(folder, session, lister)
+        if cache:
+            cache.store_meta("info_txt", folder, text)
+    with _info_txt_lock:
+        _info_txt[folder] = text
+    if save_to:
+        with open(save_to, "wb") as out:
+            out.write(text.encode("utf-8"))
+    return parse_info_txt(text)
+
+
 class downloader(utils):
     def __init__(self, http_server_ip=None, yamlfilename=None, board_name=None):
         self.reference_boot_folder = None
@@ -338,6 +1240,7 @@ class downloader(utils):
         self.hdl_folder = None
         self.http_server_ip = http_server_ip
         self.url = None
+        self.output_folder = "outs"
         # rpi fields
         self.devicetree = None
         self.devicetree_overlay = None
@@ -345,6 +1248,34 @@ class downloader(utils):
         self.modules = None
         self.no_os_project = None
         self.platform = None
+        # artifact cache
+        self.use_cache = True
+        self.cache_dir = None
+        self.cache_max_size = None
+        # output files are read-only hard links into the cache unless disabled
+        self.cache_hardlinks = True
+        self._cache = None
+        self._cache_lock = threading.Lock()
+        # build folder resolution
+        self.listing_ttl = 300
+        self.resolver_backend = "artifactory"
+        self._resolver = None
+        self.github_token = None
+        self._github = None
+        # concurrent download plan
+        self.download_threads = 4
+        self.parallel_ranges = 1
+        self.bandwidth_limit = None
+        self._limiter = None
+        # local mirror kept up to date by nebula.mirror, and the seconds
+        # after which a mirrored build not checked by it is not trusted
+        self.mirror_dir = None
+        self.mirror_max_age = 3600
+        self._plan = None
+        self._shared = None
+        # properties of the current download session
+        self._properties = None
+        self._build_info = None
         # update from config
         self.update_defaults_from_yaml(
             yamlfilename, __class__.__name__, board_name=board_name
@@ -364,12 +1295,9 @@ class downloader(utils):
             if not release:
                 # Get latest
                 log.info("Release not set. Checking github for latest")
-                g = Github()
-                repo = g.get_repo("analogdevicesinc/{}-fw".format(dev))
-                rel = repo.get_releases()
-                p = rel.get_page(0)
-                r = p[0]
-                release = r.tag_name
+                release = self.github.latest_release(
+                    "analogdevicesinc/{}-fw".format(dev)
+                )
             log.info("Using release: " + release)
 
             matched = re.match("v[0-1].[0-9][0-9]", release)
@@ -379,23 +1307,23 @@ class downloader(utils):
             url = "https://github.com/analogdevicesinc/{dev}-fw/releases/download/{rel}/{dev}-fw-{rel}.zip".format(
                 dev=dev, rel=release
             )
-            dest = "outs"
+            dest = self.output_folder
             if not os.path.isdir(dest):
                 os.mkdir(dest)
             filename = os.path.join(dest, dev + "-fw-" + release + ".zip")
         elif source == "artifactory":
             url_template = "https://artifactory.analog.com/artifactory/sdg-generic-development/m2k_and_pluto/{}-fw/{}/{}"
             url = url_template.format(dev, "", "")
-            build_date = get_newest_folder(listFD(url))
+            build_date = self.resolver.newest_folder(url)
             url = url_template.format(dev, build_date, "")
             # get version
-            ver = get_firmware_version(listFD(url))
+            ver = get_firmware_version(self.resolver.list(url))
             url = url_template.format(dev, build_date, ver)
-            dest = "outs"
+            dest = self.output_folder
             if not os.path.isdir(dest):
                 os.mkdir(dest)
             filename = os.path.join(dest, ver)
-        self.download(url, filename)
+        self._queue_download(url, filename)
 
     def _get_file(
         self,
@@ -406,30 +1334,41 @@ class downloader(utils):
         branch,
         addl=None,
         url_template=None,
+        fallback=None,
     ):
         if source == "artifactory":
             self._get_artifactory_file(
-                filename, design_source_root, source_root, branch, addl, url_template
+                filename,
+                design_source_root,
+                source_root,
+                branch,
+                addl,
+                url_template,
+                fallback,
             )
         elif source == "local_fs":
-            self._get_local_file(filename, design_source_root)
+            try:
+                self._get_local_file(filename, design_source_root)
+            except Exception:
+                if not fallback:
+                    raise
+                self._get_local_file(fallback, design_source_root)
         else:
             raise Exception("Unknown file source")
 
     def _get_local_file(self, filename, source_root):
-        dest = "outs"
+        dest = self.output_folder
         if not os.path.isdir(dest):
             os.mkdir(dest)
         src = os.path.join(source_root, filename)
         if os.path.isfile(src):
-            shutil.copy(src, dest)
+            strategy = fast_copy(src, dest)
+            log.info(f"Staged {filename} from {source_root} using {strategy}")
+            record_fields(dest, local_copies={os.path.basename(src): strategy})
         else:
             raise Exception("File not found: " + src)
 
-    def _get_artifactory_file(self, filename, folder, ip, branch, addl, url_template):
-        dest = "outs"
-        if not os.path.isdir(dest):
-            os.mkdir(dest)
+    def _artifactory_url(self, filename, folder, ip, branch, addl, url_template):
         if not ip:
             ip = self.http_server_ip
         if not ip:
@@ -448,29 +1387,34 @@ class downloader(utils):
                 new_flow = True
 
         if new_flow:
-            url = url_template.format(folder, filename)
-        else:
-            # get url template base
-            url = gen_url(ip, branch, folder, filename, addl, url_template)
+            return url_template.format(folder, filename)
+        # get url template base
+        return gen_url(ip, branch, folder, filename, addl, url_template, self.resolver)
+
+    def _get_artifactory_file(
+        self, filename, folder, ip, branch, addl, url_template, fallback=None
+    ):
+        dest = self.output_folder
+        if not os.path.isdir(dest):
+            os.mkdir(dest)
+        url = self._artifactory_url(filename, folder, ip, branch, addl, url_template)
         self.url = url
-        filename = os.path.join(dest, filename)
         log.info("URL: " + url)
-        self.download(url, filename)
 
+        # Linux device trees are saved under their generic boot file name
         if bool(re.search("linux", url)) and bool(re.search(".dtb", url)):
-            is_generic = filename == ("system.dtb" or "devicetree.dtb")
-            if not is_generic:
-                old_fname = filename
-                if bool(re.search("/arm/", url)):
-                    new_fname = os.path.join(dest, "devicetree.dtb")
-                elif bool(re.search("/arm64/", url)):
-                    new_fname = os.path.join(dest, "system.dtb")
-
-                try:
-                    os.rename(old_fname, new_fname)
-                except WindowsError:
-                    os.remove(new_fname)
-                    os.rename(old_fname, new_fname)
+            if bool(re.search("/arm/", url)):
+                filename = "devicetree.dtb"
+            elif bool(re.search("/arm64/", url)):
+                filename = "system.dtb"
+
+        alternative = None
+        if fallback:
+            alt_url = self._artifactory_url(
+                fallback, folder, ip, branch, addl, url_template
+            )
+            alternative = (alt_url, os.path.join(dest, fallback))
+        self._queue_download(url, os.path.join(dest, filename), alternative)
 
     def _get_files_boot_partition(
         self,
@@ -543,11 +1487,21 @@ class downloader(utils):
         if source == "artifactory":
             # check if info_txt is present
             try:
-                build_info = get_info_txt(url_template)
+                build_info = get_info_txt(
+                    url_template, resolver=self.resolver, cache=self.cache
+                )
             except Exception as e:
                 log.warn(e)
                 build_info = None
-            get_gitsha(self.url, daily=False, build_info=build_info)
+            self._record_properties(
+                get_gitsha(
+                    self.url,
+                    daily=False,
+                    build_info=build_info,
+                    resolver=self.resolver,
+                ),
+                build_info,
+            )
 
     def _get_files_hdl(self, hdl_folder, source, source_root, branch, hdl_output=False):
         design_source_root = hdl_folder
@@ -564,26 +1518,16 @@ class downloader(utils):
 
         if hdl_output:
             log.info("Getting xsa/hdf file")
-            try:
-                self._get_file(
-                    "system_top.xsa",
-                    source,
-                    design_source_root,
-                    source_root,
-                    branch,
-                    output,
-                    url_template,
-                )
-            except Exception:
-                self._get_file(
-                    "system_top.hdf",
-                    source,
-                    design_source_root,
-                    source_root,
-                    branch,
-                    output,
-                    url_template,
-                )
+            self._get_file(
+                "system_top.xsa",
+                source,
+                design_source_root,
+                source_root,
+                branch,
+                output,
+                url_template,
+                fallback="system_top.hdf",
+            )
         else:
             # Get BOOT.BIN
             log.info("Getting BOOT.BIN")
@@ -610,7 +1554,9 @@ class downloader(utils):
             )
 
         if source == "artifactory":
-            get_gitsha(self.url, daily=True, hdl=True)
+            self._record_properties(
+                get_gitsha(self.url, daily=True, hdl=True, resolver=self.resolver)
+            )
 
     def _get_files_linux(
         self,
@@ -679,7 +1625,9 @@ class downloader(utils):
             )
 
         if source == "artifactory":
-            get_gitsha(self.url, daily=True, linux=True)
+            self._record_properties(
+                get_gitsha(self.url, daily=True, linux=True, resolver=self.resolver)
+            )
 
     def _get_files_rpi(
         self,
@@ -691,7 +1639,7 @@ class downloader(utils):
         devicetree_overlay,
         modules,
     ):
-        dest = "outs"
+        dest = self.output_folder
         if not os.path.isdir(dest):
             os.mkdir(dest)
         # download properties.txt
@@ -701,12 +1649,12 @@ class downloader(utils):
                 "https://{}/artifactory/sdg-generic-development/linux_rpi/{}/{}"
             )
             url = url_template.format(source_root, branch, "")
-            build_date = get_newest_folder(listFD(url))
+            build_date = self.resolver.newest_folder(url)
             url = url_template.format(
                 source_root, branch, build_date + "/" + arch + "/version_rpi.txt"
             )
             file = os.path.join(dest, "properties.txt")
-            self.download(url, file)
+            self._queue_download(url, file)
 
         url_template = url_template.format(source_root, branch, "{}/" + arch + "/{}")
 
@@ -716,7 +1664,7 @@ class downloader(utils):
             log.info("Getting device tree " + devicetree)
             url = url_template.format(build_date, devicetree)
             file = os.path.join(dest, devicetree)
-            self.download(url, file)
+            self._queue_download(url, file)
 
         if devicetree_overlay:
             if "dtbo" not in devicetree_overlay:
@@ -725,7 +1673,7 @@ class downloader(utils):
             log.info("Getting overlay " + devicetree_overlay)
             url = url_template.format(build_date, overlay_f)
             file = os.path.join(dest, devicetree_overlay)
-            self.download(url, file)
+            self._queue_download(url, file)
 
         if not kernel:
             kernel = ["kernel.img", "kernel7.img", "kernel7l.img"]
@@ -741,13 +1689,14 @@ class downloader(utils):
             log.info("Get kernel " + k)
             url = url_template.format(build_date, k)
             file = os.path.join(dest, k)
-            self.download(url, file)
+            self._queue_download(url, file)
 
         tar_file = "rpi_modules_32bit.tar.gz"
         log.info("Get modules " + tar_file)
         url = url_template.format(build_date, tar_file)
         file = os.path.join(dest, tar_file)
-        self.download(url, file)
+        self._queue_download(url, file)
+        self._flush_downloads()
 
         with tarfile.open(file) as tf:
             if modules:
@@ -764,7 +1713,7 @@ class downloader(utils):
             tf.extractall(path=dest, members=module_files)
 
     def _get_files_noos(self, source, source_root, branch, project, platform):
-        dest = "outs"
+        dest = self.output_folder
         if not os.path.isdir(dest):
             os.mkdir(dest)
         if source == "artifactory":
@@ -772,13 +1721,14 @@ class downloader(utils):
                 "https://{}/artifactory/sdg-generic-development/no-OS/{}/{}/{}/{}"
             )
             url = url_template.format(source_root, branch, "", "", "")
-            build_date = get_newest_folder(listFD(url))
+            build_date = self.resolver.newest_folder(url)
             url = url_template.format(
                 source_root, branch, build_date, platform, project + ".zip"
             )
             log.info(url)
             file = os.path.join(dest, project + ".zip")
-            self.download(url, file)
+            self._queue_download(url, file)
+            self._flush_downloads()
             # unzip the files
             shutil.unpack_archive(file, dest)
 
@@ -947,10 +1897,7 @@ class downloader(utils):
         Returns:
             A folder with name outs is created with the downloaded boot files
         """
-        path = pathlib.Path(__file__).parent.absolute()
-        res = os.path.join(path, "resources", "board_table.yaml")
-        with open(res) as f:
-            board_configs = yaml.load(f, Loader=yaml.FullLoader)
+        board_configs = get_board_index().configs
 
         if "-v" in design_name:
             design_name = design_name.split("-v")[0]
@@ -982,37 +1929,111 @@ class downloader(utils):
         if noos or microblaze or rpi:
             folder = None
 
-        # get files from boot partition folder
-        self._get_files(
-            design_name,
-            reference_boot_folder,
-            devicetree_subfolder,
-            boot_subfolder,
-            hdl_folder,
-            board_configs[design_name],
-            source,
-            source_root,
-            branch,
-            devicetree,
-            devicetree_overlay,
-            kernel,
-            modules,
-            noos_project,
-            platform,
-            folder,
-            firmware,
-            noos,
-            microblaze,
-            rpi,
-            url_template,
+        if self.mirror_dir and self._link_from_mirror(
+            design_name, source, branch, folder, source_root, url_template
+        ):
+            return
+
+        os.makedirs(self.output_folder, exist_ok=True)
+        with manifest_session(self.output_folder):
+            start_manifest(
+                self.output_folder,
+                design_name,
+                source=source,
+                branch=branch,
+                folder=folder,
+            )
+
+            # get files from boot partition folder. Files are collected into a
+            # download plan first and then fetched concurrently
+            self._plan = []
+            self._properties = {}
+            self._build_info = None
+            try:
+                self._get_files(
+                    design_name,
+                    reference_boot_folder,
+                    devicetree_subfolder,
+                    boot_subfolder,
+                    hdl_folder,
+                    board_configs[design_name],
+                    source,
+                    source_root,
+                    branch,
+                    devicetree,
+                    devicetree_overlay,
+                    kernel,
+                    modules,
+                    noos_project,
+                    platform,
+                    folder,
+                    firmware,
+                    noos,
+                    microblaze,
+                    rpi,
+                    url_template,
+                )
+                self._flush_downloads()
+                if self._properties:
+                    write_properties(
+                        self._properties, self._build_info, self.output_folder
+                    )
+            finally:
+                self._plan = None
+                self._properties = None
+
+    def stream_sdcard_release(self, release="2019_R1", tee=None):
+        """Iterator over the decompressed chunks of a release image.
+        Download, decompression and md5 verification happen in one pass.
+        With parallel_ranges > 1 the .xz file is fetched with concurrent
+        range requests first and decompressed from disk.
+        """
+        rel = self.releases(release)
+        if int(self.parallel_ranges) > 1:
+            return self._decompress_fetched_xz(rel, tee)
+        return stream_xz_image(
+            rel["link"],
+            self.retry_session(),
+            xz_md5=rel["xzmd5"],
+            img_md5=rel["imgmd5"],
+            tee=tee,
         )
 
-    def download_sdcard_release(self, release="2019_R1"):
+    def _decompress_fetched_xz(self, rel, tee=None):
+        xzname = tee or rel["xzname"]
+        fetch_file(
+            rel["link"],
+            xzname,
+            session=self.retry_session(),
+            parallel=int(self.parallel_ranges),
+        )
+        try:
+            with open(xzname, "rb") as f:
+                yield from decompress_xz(
+                    iter(lambda: f.read(1024 * 1024), b""),
+                    os.path.basename(xzname),
+                    rel["xzmd5"],
+                    rel["imgmd5"],
+                )
+        finally:
+            if not tee:
+                os.remove(xzname)
+
+    def download_sdcard_release(self, release="2019_R1", keep_xz=True):
         rel = self.releases(release)
-        self.download(rel["link"], rel["xzname"])
-        self.check(rel["xzname"], rel["xzmd5"])
-        self.extract(rel["xzname"], rel["imgname"])
-        self.check(rel["imgname"], rel["imgmd5"])
+        tee = rel["xzname"] if keep_xz else None
+        try:
+            with open(rel["imgname"], "wb") as file:
+                for chunk in self.stream_sdcard_release(release, tee=tee):
+                    file.write(chunk)
+        except ne.MD5CheckFailed:
+            print("MD5 Check: FAILED")
+            os.remove(rel["imgname"])
+            raise
+        except Exception:
+            os.remove(rel["imgname"])
+            raise
+        print("MD5 Check: PASSED")
         print("Image file available:", rel["imgname"])
 
     def releases(self, release="2019_R1"):
@@ -1038,6 +2059,7 @@ class downloader(utils):
         backoff_factor=0.3,
         status_forcelist=(429, 500, 502, 504),
         session=None,
+        pool_maxsize=10,
     ):
         session = session or requests.Session()
         retry = Retry(
@@ -1047,48 +2069,183 @@ class downloader(utils):
             backoff_factor=backoff_factor,
             status_forcelist=status_forcelist,
         )
-        adapter = HTTPAdapter(max_retries=retry)
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
         session.mount("http://", adapter)
         session.mount("https://", adapter)
         return session
 
-    def download(self, url, fname):
-        resp = self.retry_session().get(url, stream=True)
-        if not resp.ok:
-            raise Exception(os.path.basename(fname) + " - File not found!")
-        total = int(resp.headers.get("content-length", 0))
-        sha256_hash = hashlib.sha256()
-        with open(fname, "wb") as file, tqdm(
-            desc=fname,
-            total=total,
+    @property
+    def cache(self):
+        """Local artifact cache or None if disabled through use_cache"""
+        if not self.use_cache:
+            return None
+        with self._cache_lock:
+            if not self._cache:
+                self._cache = artifact_cache(
+                    self.cache_dir, self.cache_max_size, self.cache_hardlinks
+                )
+        return self._cache
+
+    @property
+    def limiter(self):
+        """bandwidth_limiter shared by all downloads, None if unlimited"""
+        if self.bandwidth_limit and not self._limiter:
+            self._limiter = bandwidth_limiter(self.bandwidth_limit)
+        return self._limiter
+
+    @property
+    def resolver(self):
+        """Folder listing resolver shared by all downloads of this instance"""
+        if not self._resolver:
+            if self.resolver_backend == "artifactory":
+                self._resolver = artifactory_resolver(
+                    ttl=self.listing_ttl, cache=self.cache
+                )
+            elif self.resolver_backend == "html":
+                self._resolver = url_resolver(ttl=self.listing_ttl)
+            else:
+                raise Exception("Unknown resolver backend " + self.resolver_backend)
+        return self._resolver
+
+    @resolver.setter
+    def resolver(self, resolver):
+        self._resolver = resolver
+
+    @property
+    def github(self):
+        """Release resolver for firmware hosted on GitHub"""
+        if not self._github:
+            self._github = github_resolver(
+                ttl=self.listing_ttl, cache=self.cache, token=self.github_token
+            )
+        return self._github
+
+    def _link_from_mirror(
+        self, design_name, source, branch, folder, source_root=None, url_template=None
+    ):
+        """Hard link the files of design_name from the local mirror into the
+        output folder if it has the requested build, mirrored from the same
+        server and checked within mirror_max_age. Returns True if so"""
+        from nebula.mirror import ready_entry
+
+        entry = ready_entry(
+            self.mirror_dir,
+            design_name,
+            source,
+            branch,
+            folder,
+            source_root,
+            url_template,
+            None if self.mirror_max_age is None else float(self.mirror_max_age),
+        )
+        if not entry:
+            return False
+        log.info(f"Using mirrored files of {design_name} from {entry['path']}")
+        # Only downloaded artifacts are linked, metadata is copied so it can
+        # be updated without touching the mirror
+        for root, _, files in os.walk(entry["path"]):
+            dest = os.path.join(
+                self.output_folder, os.path.relpath(root, entry["path"])
+            )
+            os.makedirs(dest, exist_ok=True)
+            for name in files:
+                target = os.path.join(dest, name)
+                if os.path.lexists(target):
+                    os.remove(target)
+                source_file = os.path.join(root, name)
+                if root != entry["path"] or name not in entry["files"]:
+                    shutil.copyfile(source_file, target)
+                    continue
+                try:
+                    os.link(source_file, target)
+                except OSError:
+                    shutil.copyfile(source_file, target)
+        return True
+
+    def _record_properties(self, properties, build_info=None):
+        """Collect properties of the current download session, written out
+        once by download_boot_files, or write them now outside a session"""
+        if self._properties is None:
+            write_properties(properties, build_info, self.output_folder)
+            return
+        self._properties.update(properties)
+        if build_info:
+            self._build_info = build_info
+
+    def _queue_download(self, url, fname, fallback=None):
+        """Add file to the active download plan, or fetch it now if none is active"""
+        if self._plan is None:
+            self._download_entry((url, fname, fallback))
+        elif (url, fname, fallback) not in self._plan:
+            self._plan.append((url, fname, fallback))
+
+    def _flush_downloads(self):
+        """Fetch all files queued in the download plan concurrently.
+        A single session is shared so connections are pooled across files.
+        """
+        if not self._plan:
+            return
+        plan = self._plan
+        self._plan = []
+        if self._shared:
+            self._shared.fetch(self, plan)
+            return
+        workers = max(1, min(int(self.download_threads), len(plan)))
+        session = self.retry_session(pool_maxsize=workers)
+        with tqdm(
+            desc=f"Downloading {len(plan)} files",
+            total=0,
             unit="iB",
             unit_scale=True,
             unit_divisor=1024,
-        ) as bar:
-            for data in resp.iter_content(chunk_size=1024):
-                size = file.write(data)
-                sha256_hash.update(data)
-                bar.update(size)
-        hash = sha256_hash.hexdigest()
-        with open(os.path.join(os.path.dirname(fname), "hashes.txt"), "a") as h:
-            h.write(f"{os.path.basename(fname)},{hash}\n")
+        ) as bar, ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(self._download_entry, entry, session, bar) for entry in plan
+            ]
+            for future in as_completed(futures):
+                future.result()
+
+    def _download_entry(self, entry, session=None, bar=None):
+        """Download a plan entry. Returns the url and file name actually
+        used, which differ from the entry when the fallback was taken, and
+        the sha256 of the file."""
+        url, fname, fallback = entry
+        try:
+            return url, fname, self.download(url, fname, session, bar)
+        except Exception:
+            if not fallback:
+                raise
+            log.info(f"{os.path.basename(fname)} not found, trying {fallback[0]}")
+            return (
+                fallback[0],
+                fallback[1],
+                self.download(fallback[0], fallback[1], session, bar),
+            )
+
+    def download(self, url, fname, session=None, bar=None):
+        hash = fetch_file(
+            url,
+            fname,
+            session=session or self.retry_session(),
+            cache=self.cache,
+            bar=bar,
+            parallel=int(self.parallel_ranges),
+            limiter=self.limiter,
+            immutable=bool(RELEASE_ASSET_RE.match(url)),
+            expected_sha256=self.resolver.checksum(url),
+        )
+        record_file(os.path.dirname(fname), os.path.basename(fname), hash, url)
+        return hash
 
     def check(self, fname, ref):
-        hash_md5 = hashlib.md5()
-        tlfile = pathlib.Path(fname)
-        total = os.path.getsize(tlfile)
-        with open(fname, "rb") as f, tqdm(
+        with tqdm(
             desc="Hashing: " + fname,
-            total=total,
+            total=os.path.getsize(fname),
             unit="iB",
             unit_scale=True,
             unit_divisor=1024,
         ) as bar:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-                size = len(chunk)
-                bar.update(size)
-        h = hash_md5.hexdigest()
+            h = hash_file(fname, ["md5"], bar=bar)["md5"]
         if h == ref:
             print("MD5 Check: PASSED")
         else:
@@ -1115,3 +2272,142 @@ class downloader(utils):
                         size = file.write(result)
                         bar.update(size)
                     data = ifile.read(1024)
+
+
+class shared_downloads:
+    """Download plans of several downloader instances fetched as one
+
+    Each unique URL is downloaded once by a common thread pool into the
+    folder of the first board requesting it. Boards requesting the same URL
+    later get a hard link to that file.
+    """
+
+    def __init__(self, session, workers=8):
+        self.session = session
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.bar = tqdm(
+            desc="Downloading shared files",
+            total=0,
+            unit="iB",
+            unit_scale=True,
+            unit_divisor=1024,
+        )
+
+    def fetch(self, owner, plan):
+        waiting = []
+        for entry in plan:
+            url, fname, fallback = entry
+            key = (url, fallback[0] if fallback else None)
+            with self._lock:
+                future = self._futures.get(key)
+                first = future is None
+                if first:
+                    future = self._pool.submit(
+                        owner._download_entry, entry, self.session, self.bar
+                    )
+                    self._futures[key] = future
+            waiting.append((entry, future, first))
+        for entry, future, first in waiting:
+            used_url, src, hash = future.result()
+            if first:
+                continue
+            url, fname, fallback = entry
+            dest = fname if used_url == url else fallback[1]
+            if os.path.lexists(dest):
+                os.remove(dest)
+            try:
+                os.link(src, dest)
+            except OSError:
+                shutil.copyfile(src, dest)
+            record_file(os.path.dirname(dest), os.path.basename(dest), hash, used_url)
+
+    def close(self):
+        self._pool.shutdown()
+        self.bar.close()
+
+
+def boards_in_yaml(yamlfilename):
+    """Board names of all board-config sections of a nebula YAML file"""
+    with open(yamlfilename, "r") as stream:
+        configs = yaml.safe_load(stream)
+    try:
+        multi_device_check(configs, None)
+        configs = {"single": configs}
+    except ne.MultiDevFound:
+        pass
+    names = []
+    for config in configs.values():
+        for c in config.get("board-config", []):
+            if "board-name" in c:
+                names.append(c["board-name"])
+    return names
+
+
+def download_boot_files_bulk(
+    board_names=None,
+    yamlfilename=None,
+    output_folder="outs",
+    workers=8,
+    bandwidth_limit=None,
+    strict=True,
+    **kwargs,
+):
+    """Download boot files of several boards, fetching shared artifacts once
+
+    Parameters:
+        board_names: List of board names. Defaults to all boards of yamlfilename
+        yamlfilename: nebula YAML file holding the downloader config of the boards
+        output_folder: Files of each board are placed in output_folder/<board>
+        workers: Number of files downloaded in parallel
+        bandwidth_limit: Combined transfer rate limit in bytes per second
+        strict: Raise if any board fails. Otherwise failed boards are only
+            logged and left out of the result
+        kwargs: Passed on to downloader.download_boot_files
+
+    Returns:
+        Dict mapping board names to their output folders
+    """
+    if not board_names:
+        if not yamlfilename:
+            raise Exception("Board names or a nebula YAML file are required")
+        board_names = boards_in_yaml(yamlfilename)
+    board_names = list(dict.fromkeys(board_names))
+
+    boards = {}
+    for board in board_names:
+        d = downloader(yamlfilename=yamlfilename, board_name=board)
+        d.output_folder = os.path.join(output_folder, board)
+        os.makedirs(d.output_folder, exist_ok=True)
+        boards[board] = d
+    first = boards[board_names[0]]
+    if bandwidth_limit:
+        first.bandwidth_limit = bandwidth_limit
+    shared = shared_downloads(first.retry_session(pool_maxsize=workers), workers)
+    for d in boards.values():
+        d._cache = first.cache
+        d.resolver = first.resolver
+        d._limiter = first.limiter
+        d._shared = shared
+
+    failed = {}
+    try:
+        with ThreadPoolExecutor(max_workers=len(boards)) as pool:
+            futures = {
+                pool.submit(d.download_boot_files, board, **kwargs): board
+                for board, d in boards.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    log.error(f"Download for {futures[future]} failed: {e}")
+                    failed[futures[future]] = e
+    finally:
+        shared.close()
+    if failed and strict:
+        raise Exception("Download failed for " + ", ".join(failed))
+    return {
+        board: d.output_folder for board, d in boards.items() if board not in failed
+    }
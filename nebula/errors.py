@@ -57,3 +57,10 @@ class SSHError(Error):
     """SSH transaction failed"""
 
     pass
+
+
+class MD5CheckFailed(Error):
+    """MD5 hash check failed"""
+
+    def __init__(self, what):
+        Exception.__init__(self, f"{self.__doc__} for {what}")
@@ -10,7 +10,7 @@ import click
 import yaml
 
 import nebula.errors as ne
-from nebula.common import multi_device_check
+from nebula.common import get_board_index, multi_device_check
 from nebula.netbox import NetboxDevice, NetboxDevices, netbox
 
 LINUX_DEFAULT_PATH = "/etc/default/nebula"
@@ -82,10 +82,7 @@ class helper:
         pass
 
     def list_supported_boards(self, filter=None):
-        path = pathlib.Path(__file__).parent.absolute()
-        res = os.path.join(path, "resources", "board_table.yaml")
-        with open(res) as f:
-            board_configs = yaml.load(f, Loader=yaml.FullLoader)
+        board_configs = get_board_index().configs
         for config in board_configs:
             if filter in config or not filter:
                 print(config)
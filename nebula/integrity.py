@@ -0,0 +1,104 @@
+"""Single pass file hashing for integrity checks of boot artifacts."""
+
+import hashlib
+import logging
+import mmap
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+class multi_hash:
+    """Compute several digests of the same data in one pass
+
+    Supports every hashlib algorithm plus crc32, which u-boot reports for
+    images it loads. crc32 digests are 8 lowercase hex digits.
+
+    Attributes
+    ----------
+    algorithms
+        Names of the digests computed, sha256 by default
+    """
+
+    def __init__(self, algorithms=("sha256",)):
+        if isinstance(algorithms, str):
+            algorithms = [algorithms]
+        self.algorithms = list(algorithms)
+        self._hashes = {
+            name: hashlib.new(name) for name in self.algorithms if name != "crc32"
+        }
+        self._crc = 0
+
+    def update(self, data):
+        for h in self._hashes.values():
+            h.update(data)
+        if "crc32" in self.algorithms:
+            self._crc = zlib.crc32(data, self._crc)
+
+    def hexdigests(self):
+        """Map of algorithm name to hex digest"""
+        digests = {name: h.hexdigest() for name, h in self._hashes.items()}
+        if "crc32" in self.algorithms:
+            digests["crc32"] = f"{self._crc & 0xFFFFFFFF:08x}"
+        return digests
+
+    def hexdigest(self, algorithm=None):
+        """Hex digest of algorithm, the first one computed if not given"""
+        return self.hexdigests()[algorithm or self.algorithms[0]]
+
+
+def update_from_file(hasher, fname, length=None, bar=None):
+    """Feed the first length bytes of fname (whole file if None) to hasher
+
+    Regular files are mapped into memory and hashed in BLOCK_SIZE slices
+    without copying. Files that cannot be mapped, like block devices, are
+    read into a reused buffer instead.
+    """
+    with open(fname, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size and (length is None or length <= size):
+            end = size if length is None else length
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                view = memoryview(m)
+                try:
+                    for start in range(0, end, BLOCK_SIZE):
+                        with view[start : min(start + BLOCK_SIZE, end)] as block:
+                            hasher.update(block)
+                            if bar is not None:
+                                bar.update(len(block))
+                finally:
+                    view.release()
+            return hasher
+        view = memoryview(bytearray(BLOCK_SIZE))
+        while length is None or length > 0:
+            want = BLOCK_SIZE if length is None else min(BLOCK_SIZE, length)
+            n = f.readinto(view[:want])
+            if not n:
+                break
+            hasher.update(view[:n])
+            if bar is not None:
+                bar.update(n)
+            if length is not None:
+                length -= n
+    return hasher
+
+
+def hash_file(fname, algorithms=("sha256",), length=None, bar=None):
+    """Digests of fname in a single pass, as a map of algorithm to hex digest"""
+    return update_from_file(multi_hash(algorithms), fname, length, bar).hexdigests()
+
+
+def hash_files(fnames, algorithms=("sha256",), workers=4):
+    """Digests of several files hashed in parallel, as a map of file name to
+    the result of hash_file. hashlib releases the GIL on large blocks, so the
+    threads hash on separate cores."""
+    fnames = list(fnames)
+    if not fnames:
+        return {}
+    with ThreadPoolExecutor(max(1, min(workers, len(fnames)))) as pool:
+        results = pool.map(lambda f: hash_file(f, algorithms), fnames)
+        return dict(zip(fnames, results))
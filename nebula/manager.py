@@ -11,6 +11,7 @@ import nebula.errors as ne
 import nebula.helper as helper
 from nebula.driver import driver
 from nebula.jtag import jtag
+from nebula.manifest import find_manifests
 from nebula.netconsole import netconsole
 from nebula.network import network
 from nebula.pdu import pdu
@@ -921,7 +922,7 @@ class manager:
 
     def shutdown_powerdown_board(self):
         self.monitor[0].print_to_console = False
-        ret = self.monitor[0].get_uart_command_for_linux("\r\n", "root@analog")
+        ret = self.monitor[0].get_uart_command_for_linux("whoami", "root")
         try:
             if ret:
                 self.monitor[0]._write_data("shutdown now")
@@ -939,28 +940,56 @@ class manager:
 
     def verify_checksum(self, folder):
         log.info(f"Verifying bootfiles checksum for {self.board_name}")
-        # find hashes.txt on the folder
-        hash_file = None
-        for root, dirs, files in os.walk(folder):
-            if "hashes.txt" in files:
-                hash_file = os.path.join(root, "hashes.txt")
-
-        if not hash_file:
-            log.warning("Hash file not found, will not proceed with verification")
+        # keyed by the path of each file so files of different manifests
+        # under folder cannot replace each other
+        hashes = {}
+        manifests = find_manifests(folder)
+        if manifests:
+            # The manifest sha256 is the reference, it was checked when the
+            # file was downloaded. A local copy whose size no longer matches
+            # changed since then and cannot be trusted
+            changed = []
+            for entry in manifests:
+                for fname, info in entry.files.items():
+                    path = os.path.join(entry.folder, fname)
+                    try:
+                        size = os.path.getsize(path)
+                    except OSError:
+                        size = None
+                    if info.get("size") is not None and size != info["size"]:
+                        changed.append(path)
+                    hashes[path] = info["sha256"]
+            if changed:
+                raise Exception(
+                    "Boot files changed since download: " + ", ".join(sorted(changed))
+                )
+        else:
+            # legacy hashes.txt written by older downloads
+            for root, dirs, files in os.walk(folder):
+                if "hashes.txt" in files:
+                    with open(os.path.join(root, "hashes.txt"), "r") as file:
+                        for line in file:
+                            fname, hash = line.strip().split(",")
+                            hashes[os.path.join(root, fname)] = hash
+
+        if not hashes:
+            log.warning("Manifest not found, will not proceed with verification")
             return
 
-        with open(hash_file, "r") as file:
-            for line in file:
-                fname, hash = line.strip().split(",")
-                # exclude some files
-                if fname in ["bootgen_sysfiles.tgz"]:
-                    continue
-                if ".dtb" in fname:
-                    fname = (
-                        "system.dtb"
-                        if "zynqmp" in self.board_name
-                        else "devicetree.dtb"
-                    )
-                self.net.verify_checksum(
-                    file_path=os.path.join("/boot", fname), reference=hash
+        references = {}
+        for path, hash in sorted(hashes.items()):
+            fname = os.path.basename(path)
+            # exclude some files
+            if fname in ["bootgen_sysfiles.tgz"]:
+                continue
+            if ".dtb" in fname:
+                fname = (
+                    "system.dtb" if "zynqmp" in self.board_name else "devicetree.dtb"
+                )
+            target = os.path.join("/boot", fname)
+            if references.get(target, hash) != hash:
+                raise Exception(
+                    f"Different references for {target} found under {folder}"
                 )
+            references[target] = hash
+        self.net.verify_checksums(references)
@@ -0,0 +1,146 @@
+"""Manifest of boot artifacts downloaded into a folder."""
+
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+log = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+_lock = threading.Lock()
+_sessions = {}
+
+
+class manifest:
+    """JSON manifest describing the boot artifacts of one folder
+
+    Records the board, build folder and git SHAs of the download session
+    together with name, size, sha256 and source URL of every file. The file
+    is rewritten atomically on each update, or once at the end of a
+    manifest_session, and entries of files no longer present in the folder
+    are dropped when it is loaded.
+
+    Attributes
+    ----------
+    folder
+        Folder holding the artifacts and the manifest.json file
+    data
+        Parsed content of the manifest
+    """
+
+    def __init__(self, folder):
+        self.folder = folder or "."
+        self.filename = os.path.join(self.folder, MANIFEST_NAME)
+        self.data = self._load()
+
+    def _empty(self):
+        return {"board": None, "properties": {}, "build_info": None, "files": {}}
+
+    def _load(self):
+        if not os.path.isfile(self.filename):
+            return self._empty()
+        try:
+            with open(self.filename, "r") as f:
+                data = json.load(f)
+        except ValueError:
+            log.warning(f"Ignoring corrupt manifest {self.filename}")
+            return self._empty()
+        data["files"] = {
+            name: entry
+            for name, entry in data.get("files", {}).items()
+            if os.path.isfile(os.path.join(self.folder, name))
+        }
+        return data
+
+    @property
+    def board(self):
+        return self.data.get("board")
+
+    @property
+    def files(self):
+        return self.data["files"]
+
+    def save(self):
+        os.makedirs(self.folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.filename)
+
+
+def start_manifest(dest, board, **fields):
+    """Begin a new manifest for a download session of board into dest"""
+
+    def change(m):
+        m.data = m._empty()
+        m.data["board"] = board
+        m.data.update(fields)
+
+    return _update(dest, change)
+
+
+@contextlib.contextmanager
+def manifest_session(dest):
+    """Batch the record_file and record_fields updates of dest in memory and
+    write the manifest once when the block exits"""
+    key = os.path.abspath(dest or ".")
+    with _lock:
+        _sessions[key] = manifest(dest)
+    try:
+        yield _sessions[key]
+    finally:
+        with _lock:
+            _sessions.pop(key).save()
+
+
+def _update(dest, change):
+    """Apply change to the manifest of dest, saving it unless a session
+    batches the updates"""
+    with _lock:
+        m = _sessions.get(os.path.abspath(dest or "."))
+        if m is not None:
+            change(m)
+            return m
+        m = manifest(dest)
+        change(m)
+        m.save()
+    return m
+
+
+def record_file(dest, name, sha256, url=None):
+    """Add or replace the entry of a downloaded file in the manifest of dest"""
+    size = os.path.getsize(os.path.join(dest or ".", name))
+
+    def change(m):
+        m.files[name] = {"size": size, "sha256": sha256, "url": url}
+
+    _update(dest, change)
+
+
+def record_fields(dest, **fields):
+    """Merge session level fields into the manifest of dest. Dict values are
+    merged key by key"""
+
+    def change(m):
+        for key, value in fields.items():
+            if isinstance(value, dict) and isinstance(m.data.get(key), dict):
+                m.data[key].update(value)
+            else:
+                m.data[key] = value
+
+    _update(dest, change)
+
+
+def find_manifests(root, board=None):
+    """Find manifests under root, optionally only those of board"""
+    found = []
+    for path, _, files in os.walk(root):
+        if MANIFEST_NAME in files:
+            m = manifest(path)
+            if board is None or m.board == board:
+                found.append(m)
+    return found
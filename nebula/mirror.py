@@ -0,0 +1,262 @@
+"""Background mirror of the newest boot files of configured boards."""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import nebula.errors as ne
+from nebula.cache import DEFAULT_CACHE_DIR
+from nebula.common import utils
+from nebula.downloader import (
+    artifactory_resolver,
+    boards_in_yaml,
+    build_folder,
+    download_boot_files_bulk,
+)
+from nebula.manifest import manifest
+
+log = logging.getLogger(__name__)
+
+READY_INDEX = "ready.json"
+
+_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+
+
+def parse_rate(value):
+    """Bytes per second from a number or a string like 10M"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    value = value.strip().upper().rstrip("/S").rstrip("B")
+    unit = value[-1] if value and value[-1] in _UNITS else ""
+    return float(value[: len(value) - len(unit)]) * _UNITS[unit]
+
+
+def default_mirror_dir():
+    return os.path.join(os.environ.get("NEBULA_CACHE_DIR", DEFAULT_CACHE_DIR), "mirror")
+
+
+def load_ready_index(mirror_dir):
+    """Ready index of a mirror, mapping board names to published folders"""
+    try:
+        with open(os.path.join(mirror_dir, READY_INDEX)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def ready_entry(
+    mirror_dir,
+    board,
+    source,
+    branch,
+    folder,
+    source_root=None,
+    url_template=None,
+    max_age=None,
+):
+    """Published mirror entry of board for the given download, or None
+
+    Entries mirrored from another server or URL template, and entries not
+    confirmed to be the newest build within max_age seconds, as happens
+    when the mirror stopped polling, are not used.
+    """
+    entry = load_ready_index(mirror_dir).get(board)
+    if not entry or not os.path.isdir(entry["path"]):
+        return None
+    wanted = (source, branch, folder, source_root, url_template)
+    mirrored = tuple(
+        entry.get(k)
+        for k in ["source", "branch", "folder", "source_root", "url_template"]
+    )
+    if mirrored != wanted:
+        return None
+    if max_age is not None and time.time() - entry.get("checked", 0) > max_age:
+        log.info(f"Mirrored build of {board} was not checked recently, ignoring it")
+        return None
+    return entry
+
+
+class mirror(utils):
+    """Prefetch the boot files of configured boards into a local mirror
+
+    Every poll_interval seconds the newest build folders of all boards are
+    resolved and their files fetched through the artifact cache, sharing
+    files common to several boards and staying within bandwidth_limit.
+    Complete board folders are published in ready.json of mirror_dir. A
+    downloader with the same mirror_dir links files from there instead of
+    downloading them.
+
+    Attributes
+    ----------
+    mirror_dir
+        Folder holding mirrored boards and ready.json. Defaults to mirror/
+        inside the artifact cache folder
+    source_root
+        Domain name of the Artifactory server
+    branch
+        Branch to mirror
+    filetype
+        boot_partition or hdl_linux
+    poll_interval
+        Seconds between checks for new builds
+    bandwidth_limit
+        Transfer rate limit in bytes per second, K/M/G suffixes allowed
+    download_threads
+        Number of files fetched in parallel
+    """
+
+    def __init__(self, yamlfilename=None, board_names=None):
+        self.mirror_dir = None
+        self.source = "artifactory"
+        self.source_root = "artifactory.analog.com"
+        self.branch = "main"
+        self.filetype = "boot_partition"
+        self.poll_interval = 600
+        self.bandwidth_limit = None
+        self.download_threads = 4
+        self.yamlfilename = yamlfilename
+        self.board_names = board_names
+        try:
+            self.update_defaults_from_yaml(yamlfilename, __class__.__name__)
+        except ne.MultiDevFound:
+            # mirror-config is optional in multi device files
+            pass
+        if not self.mirror_dir:
+            self.mirror_dir = default_mirror_dir()
+        self.resolver = artifactory_resolver()
+
+    def _publish(self, published):
+        index = load_ready_index(self.mirror_dir)
+        index.update(published)
+        fd, tmp = tempfile.mkstemp(dir=self.mirror_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(tmp, os.path.join(self.mirror_dir, READY_INDEX))
+        return index
+
+    def _prune(self, *indexes):
+        """Drop generations not referenced by any of the given indexes"""
+        used = {
+            os.path.dirname(entry["path"])
+            for index in indexes
+            for entry in index.values()
+        }
+        for name in os.listdir(self.mirror_dir):
+            path = os.path.abspath(os.path.join(self.mirror_dir, name))
+            if name.startswith("gen-") and path not in used:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _unchanged(self, entry):
+        """Whether entry was mirrored with the current settings from what is
+        still the newest build folder, with the same sha256 of every file"""
+        folder = "boot_partition" if self.filetype == "boot_partition" else "hdl_linux"
+        current = (self.source, self.branch, folder, self.source_root, None)
+        mirrored = tuple(
+            entry.get(k)
+            for k in ["source", "branch", "folder", "source_root", "url_template"]
+        )
+        urls = entry.get("urls") or {}
+        if mirrored != current or not all(urls.values()):
+            return False
+        if not urls or set(urls) != set(entry["files"]):
+            return False
+        if not os.path.isdir(entry["path"]):
+            return False
+        try:
+            for name, url in urls.items():
+                newest = build_folder(url)
+                if not newest:
+                    return False
+                listing, build = newest.rsplit("/", 1)
+                if self.resolver.newest_folder(listing) != build:
+                    return False
+                if self.resolver.checksum(url) != entry["files"][name]:
+                    return False
+        except Exception as e:
+            log.info(f"Could not check mirrored build: {e}")
+            return False
+        return True
+
+    def sync(self):
+        """Fetch the newest builds of all boards once and publish new ones
+
+        Boards whose published build is still the newest one are not
+        downloaded again. Returns the names of boards whose published build
+        changed.
+        """
+        boards = self.board_names or boards_in_yaml(self.yamlfilename)
+        os.makedirs(self.mirror_dir, exist_ok=True)
+        previous = load_ready_index(self.mirror_dir)
+        self.resolver.clear()
+        published = {}
+        for board in boards:
+            if board in previous and self._unchanged(previous[board]):
+                published[board] = dict(previous[board], checked=time.time())
+        boards = [b for b in boards if b not in published]
+        if not boards:
+            self._publish(published)
+            return []
+        generation = tempfile.mkdtemp(prefix="gen-", dir=self.mirror_dir)
+        folders = download_boot_files_bulk(
+            boards,
+            self.yamlfilename,
+            generation,
+            int(self.download_threads),
+            bandwidth_limit=parse_rate(self.bandwidth_limit),
+            strict=False,
+            source=self.source,
+            source_root=self.source_root,
+            branch=self.branch,
+            boot_partition=self.filetype == "boot_partition",
+        )
+        changed = []
+        for board, folder in folders.items():
+            m = manifest(folder)
+            files = {name: entry["sha256"] for name, entry in m.files.items()}
+            old = previous.get(board)
+            urls = {name: entry.get("url") for name, entry in m.files.items()}
+            if old and old["files"] == files and os.path.isdir(old["path"]):
+                published[board] = dict(
+                    old,
+                    source_root=self.source_root,
+                    url_template=None,
+                    urls=urls,
+                    checked=time.time(),
+                )
+                continue
+            log.info(f"Mirrored new build of {board}")
+            changed.append(board)
+            published[board] = {
+                "path": os.path.abspath(folder),
+                "source": m.data.get("source"),
+                "source_root": self.source_root,
+                "url_template": None,
+                "branch": m.data.get("branch"),
+                "folder": m.data.get("folder"),
+                "properties": m.data.get("properties", {}),
+                "files": files,
+                "urls": urls,
+                "updated": time.time(),
+                "checked": time.time(),
+            }
+        index = self._publish(published)
+        # Keep the previous generation for jobs still linking from it
+        self._prune(index, previous)
+        return changed
+
+    def run(self, once=False):
+        """Poll for new builds until interrupted"""
+        while True:
+            try:
+                changed = self.sync()
+                log.info(f"Mirror sync done, {len(changed)} boards updated")
+            except Exception as e:
+                if once:
+                    raise
+                log.error(f"Mirror sync failed: {e}")
+            if once:
+                return
+            time.sleep(float(self.poll_interval))
@@ -422,3 +422,31 @@ class network(utils):
                     f"Checksum does not match for {file_path}:\
                          Ref: {reference} Actual: {result.stdout.strip()}"
                 )
+
+    def verify_checksums(self, references):
+        """Verify sha256 of several files on target with a single SSH command
+
+        Parameters:
+            references: dict mapping target file paths to expected sha256
+        """
+        if not references:
+            return
+        paths = sorted(references)
+        ssh_command = 'python -c "import hashlib, os, sys;'
+        ssh_command += " [print(p, hashlib.sha256(open(p, 'rb').read()).hexdigest()"
+        ssh_command += " if os.path.isfile(p) else 'missing') for p in sys.argv[1:]]\" "
+        ssh_command += " ".join(paths)
+        result = self.run_ssh_command(
+            command=ssh_command, print_result_to_file=False, show_log=False
+        )
+        actual = {}
+        for line in result.stdout.strip().splitlines():
+            path, _, hash = line.strip().partition(" ")
+            actual[path] = hash
+        mismatched = [
+            f"{p}: Ref: {references[p]} Actual: {actual.get(p, 'missing')}"
+            for p in paths
+            if actual.get(p) != references[p]
+        ]
+        if mismatched:
+            raise Exception("Checksum does not match for " + ", ".join(mismatched))
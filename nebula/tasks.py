@@ -60,6 +60,33 @@ def usbmux_write_sdcard_image(
     mux.write_img_file_to_sdcard(img_filename)
 
 
+@task(
+    help={
+        "release": "Name of release to download. Default is 2019_R1",
+        "target_mux": "SD card mux to use (default: use first mux found)",
+        "verify": "Read the card back after writing and compare checksums",
+        "yamlfilename": "Path to yaml config file. Default: /etc/default/nebula",
+        "board_name": "Name of DUT design (Ex: zynq-zc706-adv7511-fmcdaq2). Require for multi-device config files",
+    },
+)
+def usbmux_write_sdcard_release(
+    c,
+    release="2019_R1",
+    target_mux=None,
+    verify=False,
+    yamlfilename="/etc/default/nebula",
+    board_name=None,
+):
+    """Download release image and stream it directly to SD card connected to MUX"""
+    mux = nebula.usbmux(
+        yamlfilename=yamlfilename,
+        board_name=board_name,
+        target_mux=target_mux,
+    )
+    d = nebula.downloader()
+    mux.write_img_stream_to_sdcard(d.stream_sdcard_release(release), verify=verify)
+
+
 @task(
     help={
         "bootbin_filename": "The BOOT.BIN file (full path) to write to the SD card",
@@ -288,6 +315,7 @@ def usbmux_backup_bootfiles(
 
 usbsdmux = Collection("usbsdmux")
 usbsdmux.add_task(usbmux_write_sdcard_image, "write_sdcard_image")
+usbsdmux.add_task(usbmux_write_sdcard_release, "write_sdcard_release")
 usbsdmux.add_task(usbmux_update_bootfiles_on_sdcard, "update_bootfiles_on_sdcard")
 usbsdmux.add_task(usbmux_update_bootfiles, "update_bootfiles")
 usbsdmux.add_task(usbmux_update_modules, "update_modules")
@@ -391,11 +419,13 @@ cov.add_task(kernel_cov, "kernel")
 @task(
     help={
         "release": "Name of release to download. Default is 2019_R1",
+        "parallel": "Number of parallel range requests used to fetch the image. Default is 1",
     },
 )
-def download_sdcard(c, release="2019_R1"):
+def download_sdcard(c, release="2019_R1", parallel=1):
     """Download, verify, and decompress SD card image"""
     d = nebula.downloader()
+    d.parallel_ranges = int(parallel)
     d.download_sdcard_release(release)
 
 
@@ -456,6 +486,108 @@ def download_boot_files(
     )
 
 
+@task(
+    help={
+        "board_names": "Comma separated board configuration names. Default: all boards of yamlfilename",
+        "source": "Boot file download source. Options are: local_fs, artifactory, remote.\nDefault: local_fs",
+        "source_root": "Location of source boot files. Dependent on source.\nFor artifactory sources this is the domain name",
+        "branch": "Name of branches to get related files. Default: release",
+        "yamlfilename": "Path to yaml config file. Default: /etc/default/nebula",
+        "filetype": "Selects type of related files to be downloaded. Same options as dl.bootfiles. Default: boot_partition",
+        "url_template": "Custom URL template for Artifactory sources",
+        "output_folder": "Files of each board are placed in output_folder/<board>. Default: outs",
+        "threads": "Number of files downloaded in parallel. Default: 8",
+    },
+)
+def download_boot_files_bulk(
+    c,
+    board_names=None,
+    source="local_fs",
+    source_root=None,
+    branch="release",
+    yamlfilename="/etc/default/nebula",
+    filetype="boot_partition",
+    url_template=None,
+    output_folder="outs",
+    threads=8,
+):
+    """Download bootfiles of several boards, fetching shared files once"""
+    from nebula.downloader import download_boot_files_bulk
+
+    file = {
+        "firmware": None,
+        "boot_partition": None,
+        "hdl_linux": None,
+        "hdl_linux_ci": None,
+        "noos": None,
+        "microblaze": None,
+        "rpi": None,
+    }
+    if filetype not in file:
+        raise Exception("Filetype no supported.")
+    file[filetype] = True
+
+    folders = download_boot_files_bulk(
+        board_names.split(",") if board_names else None,
+        yamlfilename,
+        output_folder,
+        int(threads),
+        source=source,
+        source_root=source_root,
+        branch=branch,
+        firmware=file["firmware"],
+        boot_partition=file["boot_partition"],
+        noos=file["noos"],
+        microblaze=file["microblaze"],
+        rpi=file["rpi"],
+        url_template=url_template,
+    )
+    for board, folder in folders.items():
+        print(board, " | ", folder)
+
+
+@task(
+    help={
+        "yamlfilename": "Path to yaml config file. Default: /etc/default/nebula",
+        "board_names": "Comma separated board configuration names. Default: all boards of yamlfilename",
+        "branch": "Name of branch to mirror. Default: from mirror-config or main",
+        "source_root": "Domain name of the Artifactory server. Default: from mirror-config or artifactory.analog.com",
+        "mirror_dir": "Folder of the mirror and its ready.json index. Default: mirror inside the artifact cache",
+        "interval": "Seconds between checks for new builds. Default: from mirror-config or 600",
+        "bandwidth": "Transfer rate limit in bytes per second, K/M/G suffixes allowed. Default: unlimited",
+        "once": "Sync once and exit instead of polling",
+    },
+)
+def download_mirror(
+    c,
+    yamlfilename="/etc/default/nebula",
+    board_names=None,
+    branch=None,
+    source_root=None,
+    mirror_dir=None,
+    interval=None,
+    bandwidth=None,
+    once=False,
+):
+    """Keep a local mirror of the newest boot files of configured boards"""
+    from nebula.mirror import mirror
+
+    m = mirror(
+        yamlfilename=yamlfilename,
+        board_names=board_names.split(",") if board_names else None,
+    )
+    for attr, value in [
+        ("branch", branch),
+        ("source_root", source_root),
+        ("mirror_dir", mirror_dir),
+        ("poll_interval", interval),
+        ("bandwidth_limit", bandwidth),
+    ]:
+        if value is not None:
+            setattr(m, attr, value)
+    m.run(once=once)
+
+
 @task(
     help={
         "toolbox": "Name of toolbox to download",
@@ -466,6 +598,7 @@ def download_boot_files(
         "download_folder": "Name of folder to download files to. Default: ml_bootbins",
         "root": "Name of root folder to download files to. Default: dev",
         "skip_download": "If True, skip downloading files. Default: False",
+        "threads": "Number of files downloaded in parallel. Default: 4",
     },
 )
 def download_generate_matlab_bootbins(
@@ -478,6 +611,7 @@ def download_generate_matlab_bootbins(
     download_folder="ml_bootbins",
     root="dev",
     skip_download=False,
+    threads=4,
 ):
     """Download MATLAB generated bootfiles for a specific development system"""
     from nebula.downloader import download_matlab_generate_bootbin
@@ -491,6 +625,7 @@ def download_generate_matlab_bootbins(
         target_fpga,
         download_folder,
         skip_download,
+        int(threads),
     )
     print("Downloaded files:")
     for rd_name, filename in zip(rd_names, filenames):
@@ -537,7 +672,7 @@ def download_info_txt(
     """Download info.txt and print value to console"""
     from nebula.downloader import get_info_txt
 
-    build_info = get_info_txt(url)
+    build_info = get_info_txt(url, save_to="info.txt")
     to_show = build_info
     if field:
         if field in build_info.keys():
@@ -561,6 +696,8 @@ def download_info_txt(
 dl = Collection("dl")
 dl.add_task(download_sdcard, "sdcard")
 dl.add_task(download_boot_files, "bootfiles")
+dl.add_task(download_boot_files_bulk, "bulk_bootfiles")
+dl.add_task(download_mirror, "mirror")
 dl.add_task(download_generate_matlab_bootbins, "matlab_bootbins")
 dl.add_task(download_generate_bootbin_map_file, "bootbin_map")
 dl.add_task(download_info_txt, "info_txt")
@@ -970,7 +1107,7 @@ def restart_board_uart(
         #     print(addr)
         # else:
         #     print("Address not found")
-        del u
+        u.close()
     except Exception as ex:
         print(ex)
 
@@ -990,7 +1127,7 @@ def get_ip(c, address="auto", yamlfilename="/etc/default/nebula", board_name=Non
     u = nebula.uart(address=address, yamlfilename=yamlfilename, board_name=board_name)
     u.print_to_console = False
     addr = u.get_ip_address()
-    del u
+    u.close()
     if addr:
         print(addr)
     else:
@@ -1062,7 +1199,7 @@ def set_local_nic_ip_from_usbdev(
             c.run(cmd)
 
         print("Local IP Set:", ipaddrs, "Remote:", ipaddr)
-        del u
+        u.close()
     except Exception as ex:
         raise ex
 
@@ -1089,14 +1226,14 @@ def get_carriername(
         if addr:
             if addr[-1] == "#":
                 addr = addr[:-1]
-            addr = addr.split("\x00")
-            if "@" in addr[-1]:
+            addr = [a for a in addr.split("\x00") if a]
+            if addr and "@" in addr[-1]:
                 addr = addr[:-1]
-            addr = "-".join(addr)
-            print(addr)
+        if addr:
+            print("-".join(addr))
         else:
-            print("Address not found")
-        del u
+            print("Carrier name not found")
+        u.close()
     except Exception as ex:
         print(ex)
 
@@ -1126,7 +1263,7 @@ def get_mezzanine(
             print(addr)
         else:
             print("Address not found")
-        del u
+        u.close()
     except Exception as ex:
         print(ex)
 
@@ -1148,6 +1285,7 @@ def get_uart_log(
         address=address, yamlfilename=yamlfilename, board_name=board_name, period=period
     )
     u.get_uart_boot_message()
+    u.close()
 
 
 @task(
@@ -1169,7 +1307,7 @@ def set_dhcp(
         )
         u.print_to_console = False
         u.request_ip_dhcp()
-        del u
+        u.close()
     except Exception as ex:
         print(ex)
 
@@ -1199,7 +1337,7 @@ def set_static_ip(
         )
         u.print_to_console = False
         u.set_ip_static(ip, nic)
-        del u
+        u.close()
     except Exception as ex:
         print(ex)
 
@@ -1237,6 +1375,7 @@ def update_boot_files_uart(
         kernel_filename=uimagepath,
         devtree_filename=devtreepath,
     )
+    u.close()
 
 
 uart = Collection("uart")
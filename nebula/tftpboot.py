@@ -1,8 +1,7 @@
 import logging
-import shutil
 import subprocess
 
-from nebula.common import utils
+from nebula.common import fast_copy, utils
 
 log = logging.getLogger(__name__)
 
@@ -49,8 +48,8 @@ class tftpboot(utils):
             dir = self.default_target
         print("Updating boot files for: " + dir)
         src = self.boot_files_share + dir + "/BOOT.BIN"
-        shutil.copyfile(src, self.boot_files_share)
+        fast_copy(src, self.boot_files_share)
         src = self.boot_files_share + dir + "/devicetree.dtb"
-        shutil.copyfile(src, self.boot_files_share)
+        fast_copy(src, self.boot_files_share)
         src = self.boot_files_share + "zynq-common/uImage"
-        shutil.copyfile(src, self.boot_files_share)
+        fast_copy(src, self.boot_files_share)
@@ -1,11 +1,16 @@
+import atexit
+import contextlib
 import datetime
 import glob
 import ipaddress
 import logging
 import os
+import queue
 import re
 import threading
 import time
+import uuid
+import weakref
 
 import serial
 import xmodem
@@ -17,6 +22,8 @@ log = logging.getLogger(__name__)
 
 LINUX_SERIAL_FOLDER = "/dev/serial"
 LOG_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+READ_TIMEOUT = 0.5
+COMMAND_TIMEOUT = 10
 
 
 def escape_ansi(line):
@@ -24,12 +31,273 @@ def escape_ansi(line):
     return ansi_escape.sub("", line)
 
 
+_open_writers = weakref.WeakSet()
+
+
+@atexit.register
+def _close_writers():
+    # Writer threads are daemons, flush what they still buffer before exit
+    for writer in list(_open_writers):
+        writer.close()
+
+
+class log_writer:
+    """Buffered writer of console lines to a log file
+
+    Lines are queued by the thread reading the console and written in
+    batches by a background thread holding the only handle of the file, so
+    readers never block on disk I/O or reopen the file. The file is flushed
+    at least every flush_interval seconds, on close and at interpreter exit.
+
+    Attributes
+    ----------
+    filename
+        Log file to write
+    flush_interval
+        Maximum seconds written lines stay buffered
+    """
+
+    _STOP = object()
+
+    def __init__(self, filename, append=True, flush_interval=0.5, max_queue=10000):
+        self.filename = filename
+        self.flush_interval = float(flush_interval)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file = open(filename, "a" if append else "w")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        _open_writers.add(self)
+
+    def write(self, line):
+        """Queue line for writing, blocking only while the queue is full"""
+        self._queue.put(line + "\n")
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+            while batch and batch[-1] is not self._STOP:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = bool(batch) and batch[-1] is self._STOP
+            if stop:
+                batch.pop()
+            if batch:
+                self._file.writelines(batch)
+            if stop:
+                break
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self._file.flush()
+                last_flush = time.monotonic()
+        self._file.close()
+
+    def close(self):
+        """Write all queued lines and close the file"""
+        _open_writers.discard(self)
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+
+
+class pattern_matcher:
+    """Incremental search for several strings in a stream of console bytes
+
+    All patterns are compiled into one alternation wrapped in a lookahead,
+    so a single regex scan reports every pattern starting at each position,
+    including overlapping ones. The last bytes of each chunk are kept so
+    matches spanning chunk boundaries are found as well.
+
+    Attributes
+    ----------
+    patterns
+        Strings searched for, in the order given
+    found
+        Patterns seen so far
+    """
+
+    def __init__(self, patterns):
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        self.patterns = list(patterns)
+        encoded = sorted({p.encode() for p in self.patterns}, key=len, reverse=True)
+        self._regex = re.compile(
+            b"(?=(" + b"|".join(re.escape(p) for p in encoded) + b"))"
+        )
+        self._keep = max(len(p) for p in encoded) - 1
+        self._tail = b""
+        self.found = set()
+
+    def _matches(self, data, start=0):
+        for m in self._regex.finditer(data):
+            text = m.group(1)
+            for p in self.patterns:
+                if text.startswith(p.encode()) and m.start() + len(p) > start:
+                    yield p
+
+    def search(self, text):
+        """Patterns contained in text, without touching the stream state"""
+        if isinstance(text, str):
+            text = text.encode(errors="replace")
+        return {p for p in self._matches(text)}
+
+    def feed(self, data):
+        """Scan the next chunk of the stream. Returns the patterns it
+        completed that were not seen before"""
+        buf = self._tail + data
+        new = []
+        for p in self._matches(buf, len(self._tail)):
+            if p not in self.found:
+                self.found.add(p)
+                new.append(p)
+        self._tail = buf[-self._keep :] if self._keep else b""
+        return new
+
+
+class console_stream:
+    """Console bytes queued for a blocking reader
+
+    Subscribed to the reader thread of a uart, it keeps what arrived until
+    it is read, like the input buffer of the port does, so output sent in
+    reply to a command is not missed when the read starts late.
+
+    Attributes
+    ----------
+    max_size
+        Most bytes kept unread, older bytes are dropped beyond that
+    """
+
+    def __init__(self, max_size=1024 * 1024):
+        self.max_size = max_size
+        self._data = bytearray()
+        self._cond = threading.Condition()
+
+    def __call__(self, data):
+        if not data:
+            return
+        with self._cond:
+            self._data += data
+            if len(self._data) > self.max_size:
+                del self._data[: -self.max_size]
+            self._cond.notify_all()
+
+    def read(self, timeout=0):
+        """All unread bytes, waiting up to timeout seconds for some to arrive"""
+        with self._cond:
+            if timeout and timeout > 0:
+                self._cond.wait_for(lambda: self._data, timeout)
+            data = bytes(self._data)
+            self._data.clear()
+        return data
+
+    def clear(self):
+        with self._cond:
+            self._data.clear()
+
+
+class console_state:
+    """State of the console followed from the live byte stream
+
+    Subscribed to the reader thread of a uart, it looks for prompts and
+    reboot messages. The last one seen sets the state, so callers know
+    whether a shell is logged in without probing the console.
+
+    Attributes
+    ----------
+    state
+        One of UNKNOWN, UBOOT, LOGIN, PASSWORD or SHELL
+    changes
+        Number of prompts and reboot messages seen so far
+    """
+
+    UNKNOWN = "unknown"
+    UBOOT = "u-boot"
+    LOGIN = "login"
+    PASSWORD = "password"
+    SHELL = "shell"
+
+    REBOOT_STRINGS = [
+        "U-Boot ",
+        "Starting kernel",
+        "Booting Linux",
+        "reboot: Restarting system",
+    ]
+
+    def __init__(self, uboot_prompts=("zynq-uboot>", "Zynq>", "ZynqMP>")):
+        if isinstance(uboot_prompts, str):
+            uboot_prompts = [uboot_prompts]
+        groups = [
+            (self.UNKNOWN, [re.escape(s.encode()) for s in self.REBOOT_STRINGS]),
+            (self.UBOOT, [re.escape(p.encode()) for p in uboot_prompts]),
+            # The login prompt starts a line with the host name, unlike the
+            # "Last login: ..." banner printed once logged in
+            (self.LOGIN, [rb"^(?!Last )[\w.-]+ login: ", rb"Login incorrect"]),
+            (self.PASSWORD, [rb"[Pp]assword:"]),
+            # user@host:path prompts, and the bare one of Pluto and M2K
+            (self.SHELL, [rb"[\w.-]+@[\w.-]+:[^\r\n#$]*[#$] ", rb"^[#$] "]),
+        ]
+        self._names = {f"s{i}": state for i, (state, _) in enumerate(groups)}
+        self._regex = re.compile(
+            b"|".join(
+                b"(?P<s%d>%s)" % (i, b"|".join(patterns))
+                for i, (_, patterns) in enumerate(groups)
+            ),
+            re.MULTILINE,
+        )
+        self._cond = threading.Condition()
+        self.changes = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the state, when the console was not watched for a while"""
+        with self._cond:
+            self.state = self.UNKNOWN
+            self._tail = b""
+
+    def __call__(self, data):
+        if not data:
+            return
+        buf = self._tail + data
+        start = len(self._tail)
+        with self._cond:
+            for m in self._regex.finditer(buf):
+                # Matches within the tail were counted with the last chunk
+                if m.end() > start:
+                    self.state = self._names[m.lastgroup]
+                    self.changes += 1
+            self._tail = buf[-128:]
+            self._cond.notify_all()
+
+    def wait(self, states=None, timeout=None, since=0):
+        """Wait for a prompt or reboot message after the first since ones,
+        leaving the console in one of states (any if None). Returns the
+        state, or None if timeout seconds passed"""
+
+        def reached():
+            return self.changes > since and (states is None or self.state in states)
+
+        with self._cond:
+            if self._cond.wait_for(reached, timeout):
+                return self.state
+        return None
+
+
 class uart(utils):
     """UART Interface Handler
         This class enables monitoring and sending commands
         over a UART interface. Monitoring is done using
         threads so monitor will not block.
 
+        A single reader thread per port hands every chunk of console
+        bytes to the subscribers: the log sink, the unread stream that
+        waits and command reads consume, and any callback registered
+        with subscribe. The thread keeps running across commands, it is
+        only stopped by stop_log or to use the port directly.
+
     Attributes
     ----------
     address
@@ -44,6 +312,9 @@ class uart(utils):
         Baudrate of UART interface in bits per second (default is 115200)
     print_to_console
         Print output of UART console. Output will appear in log file as well
+    log_flush_interval
+        Maximum seconds console output stays buffered before reaching the
+        log file
     """
 
     def __init__(
@@ -60,6 +331,8 @@ class uart(utils):
         period=30,
     ):
         self.com = []  # Preset in case __del__ is called before set
+        self._reader = None
+        self._log_lock = threading.RLock()
         self.tftpserverip = tftpserverip
         self.address = address
         self.fmc = fmc
@@ -73,9 +346,17 @@ class uart(utils):
         self.max_read_time = period
         self.fds_to_skip = ["Digilent"]
         self.uboot_done_string = ["zynq-uboot>", "Zynq>", "ZynqMP>"]
+        self.log_flush_interval = 0.5
+        self._log = None
+        self._log_partial = b""
+        self._unread = console_stream()
+        self._subscribers = []
+        self._reader_run = False
+        self._holds = 0
         self.update_defaults_from_yaml(
             yamlfilename, __class__.__name__, board_name=board_name
         )
+        self.console_state = console_state(self.uboot_done_string)
         if not self.address:
             raise Exception(
                 "UART address must be defined (under uart-config in yaml is one option)"
@@ -90,6 +371,12 @@ class uart(utils):
 
     def __del__(self):
         log.info("Closing UART")
+        self.close()
+
+    def close(self):
+        """Stop the reader thread, flush the log and release the port"""
+        self._stop_reader()
+        self._close_log()
         if self.com:
             self.com.close()
 
@@ -99,9 +386,13 @@ class uart(utils):
     def reinitialize_uart(self):
         log.info("Reinitializing UART")
         if self.com:
+            reading = self._stop_reader()
             self.com.close()
             self.com = serial.Serial(self.address, self.baudrate, timeout=5)
             self.com.reset_input_buffer()
+            self._unread.clear()
+            if reading:
+                self._start_reader()
 
     def _auto_set_address(self):
         """Try to set yaml automatically"""
@@ -136,8 +427,8 @@ class uart(utils):
             log.info("Launching UART listening thread")
             if not self.print_to_console:
                 log.info("UART console saving to file: " + self.logfilename)
-            self.thread = threading.Thread(target=self._listen, args=(logappend,))
-            self.thread.start()
+            self._open_log(logappend)
+            self._start_reader()
         else:
             log.info("UART console is already running... Skipping setting on")
 
@@ -146,55 +437,165 @@ class uart(utils):
         if self.listen_thread_run or force:
             self.listen_thread_run = False
             log.info("Waiting for UART reading thread")
-            self.thread.join()
+            self._stop_reader()
             log.info("UART reading thread joined")
+            self._close_log()
         else:
             log.info("UART logging thread not running. Skipping setting off")
 
+    def subscribe(self, callback):
+        """Call callback with every chunk of bytes read from the console
+
+        An empty chunk is passed when the port stayed idle for its timeout.
+        Callbacks run on the reader thread, so they must not block. The
+        reader is started if needed. Returns callback, to unsubscribe it.
+        """
+        self._subscribers = self._subscribers + [callback]
+        self._start_reader()
+        return callback
+
+    def unsubscribe(self, callback):
+        self._subscribers = [s for s in self._subscribers if s is not callback]
+
+    def _start_reader(self):
+        """Start the thread reading the port, unless it is running"""
+        if self._reader and self._reader.is_alive():
+            return
+        # Anything may have happened while nobody was reading
+        self.console_state.reset()
+        self._reader_run = True
+        self._reader = threading.Thread(
+            target=self._read_loop, args=(weakref.ref(self),), daemon=True
+        )
+        self.thread = self._reader
+        self._reader.start()
+
+    def _stop_reader(self):
+        """Stop the reader thread. Returns True if it was running"""
+        reader, self._reader = getattr(self, "_reader", None), None
+        self._reader_run = False
+        if not reader or not reader.is_alive():
+            return False
+        if reader is not threading.current_thread():
+            reader.join()
+        return True
+
+    @contextlib.contextmanager
+    def _direct_port(self):
+        """Pause the reader while the port is used directly, like by XMODEM"""
+        reading = self._stop_reader()
+        try:
+            yield self.com
+        finally:
+            if reading:
+                self._start_reader()
+
+    @contextlib.contextmanager
+    def _console(self):
+        """Interact with the console through the unread stream
+
+        While the log is running nobody consumes the unread stream, so
+        output received before the outermost section starts is dropped,
+        as the listener thread used to read it away. Nested sections keep
+        everything, including replies to commands written before a wait.
+        """
+        self._start_reader()
+        if self.listen_thread_run and not self._holds:
+            self._unread.clear()
+        self._holds += 1
+        try:
+            yield
+        finally:
+            self._holds -= 1
+
+    @staticmethod
+    def _read_loop(ref):
+        log.info("UART reading thread started")
+        while True:
+            self = ref()
+            if self is None:
+                return
+            if not self._reader_run or not self._read_once():
+                break
+            # Hold the uart only while reading, so dropping the last
+            # reference to it still runs __del__ and releases the port
+            del self
+        self._log_bytes(b"")
+        log.info("UART reading thread closing")
+
+    def _read_once(self):
+        """Read one chunk and hand it to the subscribers. Returns False once
+        the port can no longer be read"""
+        try:
+            # Returns as soon as a byte arrives, or after the port timeout
+            data = self.com.read(max(1, self.com.in_waiting))
+        except (serial.SerialException, OSError, TypeError, ValueError) as ex:
+            if self._reader_run:
+                log.warning("UART reading stopped: " + str(ex))
+            return False
+        builtin = [self._log_bytes, self._unread, self.console_state]
+        for callback in builtin + self._subscribers:
+            try:
+                callback(data)
+            except Exception as ex:
+                log.warning("UART subscriber failed: " + str(ex))
+        return True
+
+    def _open_log(self, logappend=True):
+        """(Re)open the log sink, truncating the log file unless logappend"""
+        with self._log_lock:
+            self._close_log()
+            self._log = log_writer(self.logfilename, logappend, self.log_flush_interval)
+            return self._log
+
+    def _close_log(self):
+        with self._log_lock:
+            log_sink, self._log = getattr(self, "_log", None), None
+            if log_sink:
+                log_sink.close()
+
     def pipe_to_log_file(self, data, logappend=True, force=False):
         """Write data to log file"""
-        ws = "w"
-        if logappend:
-            ws = "a"
-        if not self.listen_thread_run or force:
-            with open(self.logfilename, ws) as file:
-                file.writelines(data + "\n")
-
-    def _listen(self, logappend=False):
-        ws = "w"
-        if logappend:
-            ws = "a"
-        with open(self.logfilename, ws) as file:
-            while self.listen_thread_run:
-                data = self._read_until_stop()
-                for d in data:
-                    file.writelines(d + "\n")
-        log.info("UART listening thread closing")
+        with self._log_lock:
+            if not logappend:
+                self._open_log(logappend=False)
+            (self._log or self._open_log()).write(data)
+
+    def _log_bytes(self, data):
+        """Log subscriber. Partial lines are written once the port is idle"""
+        if data:
+            self._log_partial = self._log_stream(self._log_partial + data)
+        elif self._log_partial:
+            self.pipe_to_log_file(self._log_partial.decode("ASCII", errors="replace"))
+            self._log_partial = b""
 
     def _read_until_stop(self):
-        buffer = []
-        while self.com.in_waiting > 0:
-            try:
-                data = self.com.readline()
-                data = str(data[:-1].decode("ASCII"))
-                self.pipe_to_log_file(str(data))
-            except Exception as ex:
-                log.warning("Exception occurred during data decode")
-                log.warning(str(ex))
-                continue
-            # if self.print_to_console:
-            #     print(data)
-            buffer.append(data)
-        return buffer
+        """Lines received and not consumed yet
 
-    def _write_data(self, data):
+        Waits for bytes still pending on the port and, up to READ_TIMEOUT,
+        for the end of a partial last line.
+        """
+        self._start_reader()
+        deadline = time.monotonic() + READ_TIMEOUT
+        data = self._unread.read(timeout=0.01)
+        while self.com.in_waiting or (data and not data.endswith(b"\n")):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            data += self._unread.read(timeout=remaining)
+        lines = data.split(b"\n")
+        if not lines[-1]:
+            lines.pop()
+        return [line.decode("ASCII", errors="replace") for line in lines]
+
+    def _write_data(self, data, wait=1):
         data = data + "\n"
         bdata = data.encode()
         log.info("--------Sending Data-----------")
         log.info(bdata)
         log.info("-------------------------------")
         self.com.write(bdata)
-        time.sleep(1)
+        time.sleep(wait)
 
     def _send_file(self, filename, address):
         self._write_data("\r\n")
@@ -209,8 +610,7 @@ class uart(utils):
             unit="iB",
             unit_scale=True,
             unit_divisor=1024,
-        ) as bar:
-            ser = self.com
+        ) as bar, self._direct_port() as ser:
 
             def putc(data, timeout=1):
                 return ser.write(data)
@@ -272,19 +672,13 @@ class uart(utils):
         """Using reference files"""
         if not done_string:
             done_string = self.uboot_done_string
-        if self.listen_thread_run:
-            restart = True
-            self.stop_log()
-        else:
-            restart = False
-        cmd = "fatload mmc 0 0x8000000 {}".format(reference)
-        self._write_data(cmd)
-        self._read_until_done(done_string)
-        cmd = "fatwrite mmc 0 0x8000000 " + target + " ${filesize}"
-        self._write_data(cmd)
-        self._read_until_done(done_string)
-        if restart:
-            self.start_log(logappend=True)
+        with self._console():
+            cmd = "fatload mmc 0 0x8000000 {}".format(reference)
+            self._write_data(cmd)
+            self._read_until_done(done_string)
+            cmd = "fatwrite mmc 0 0x8000000 " + target + " ${filesize}"
+            self._write_data(cmd)
+            self._read_until_done(done_string)
 
     def load_system_uart_copy_to_sdcard(
         self, bootbin, devtree_filename, kernel_filename
@@ -292,167 +686,161 @@ class uart(utils):
         """Load complete system (BOOT.BIN, devtree, kernel) during uboot from UART (XMODEM)
         and to SD card
         """
-        if self.listen_thread_run:
-            restart = True
-            self.stop_log()
-        else:
-            restart = False
         if "uImage" in str(kernel_filename):
             filenames = ["BOOT.BIN", "uImage", "devicetree.dtb"]
         else:
             filenames = ["BOOT.BIN", "Image", "system.dtb"]
         done_string = self.uboot_done_string
         source_fn = [bootbin, kernel_filename, devtree_filename]
-        for i, target in enumerate(filenames):
-            log.info("Copying over: " + source_fn[i])
-            self._send_file(source_fn[i], "0x8000000")
-            self._read_until_done(done_string)
-            log.info("Writing over: " + target)
-            cmd = "fatwrite mmc 0 0x8000000 " + target + " ${filesize}"
-            self._write_data(cmd)
-            self._read_until_done(done_string)
-        if restart:
-            self.start_log(logappend=True)
+        with self._console():
+            for i, target in enumerate(filenames):
+                log.info("Copying over: " + source_fn[i])
+                self._send_file(source_fn[i], "0x8000000")
+                self._read_until_done(done_string)
+                log.info("Writing over: " + target)
+                cmd = "fatwrite mmc 0 0x8000000 " + target + " ${filesize}"
+                self._write_data(cmd)
+                self._read_until_done(done_string)
 
     def _attemp_login(self, username, password):
-        # Do login
-        logged_in = False
-        cmd = username
-        self._write_data(cmd)
-        data = self._read_for_time(period=5)
+        shell = self.console_state
+        since = shell.changes
+        self._write_data(username, wait=0)
         # using root username automatically responded with Login Incorrect
-        for d in data:
-            if isinstance(d, list):
-                for c in d:
-                    c = c.replace("\r", "")
-                    if "Login incorrect" in c or "login:" in c:
-                        log.info("Login attempt incorrect")
-                        return False
-            else:
-                c = d.replace("\r", "")
-                if "Login incorrect" in c or "login:" in c:
-                    log.info("Login attempt incorrect")
-                    return False
-        cmd = password
-        self._write_data(cmd)
-        data = self._read_for_time(period=2)
-        # Check
-        cmd = ""
-        self._write_data(cmd)
-        data = self._read_for_time(period=1)
-        for d in data:
-            if isinstance(d, list):
-                for c in d:
-                    c = c.replace("\r", "")
-                    if username + "@" in c or "#" in c:
-                        log.info("Logged in success")
-                        logged_in = True
-        return logged_in
+        state = shell.wait([shell.PASSWORD, shell.SHELL, shell.LOGIN], 5, since)
+        if state == shell.PASSWORD:
+            since = shell.changes
+            self._write_data(password, wait=0)
+            state = shell.wait([shell.SHELL, shell.LOGIN], 10, since)
+        if state == shell.SHELL:
+            log.info("Logged in success")
+            return True
+        log.info("Login attempt incorrect")
+        return False
+
+    def _probe_console(self, timeout=2):
+        """Send an empty line and wait for the prompt it brings up"""
+        since = self.console_state.changes
+        self._write_data("", wait=0)
+        return self.console_state.wait(timeout=timeout, since=since)
 
     def _check_for_login(self):
-        logged_in = False
+        """Make sure a shell is logged in on the console
+
+        The state tracked from the console stream is used as is when it
+        shows a shell or login prompt. The console is only probed when the
+        state is unknown, like after a reboot message.
+        """
+        shell = self.console_state
+        self._start_reader()
         try:
+            state = shell.state
             for _ in range(2):  # Check at least twice
-                cmd = ""
-                self._write_data(cmd)
-                data = self._read_for_time(period=1)
-                needs_login = False
-                for d in data:
-                    if isinstance(d, list):
-                        for c in d:
-                            c = c.replace("\r", "")
-                            log.info(c)
-                            if "login:" in c:
-                                needs_login = True
-
-            if needs_login:
+                if state in [shell.SHELL, shell.LOGIN]:
+                    break
+                state = self._probe_console() or shell.state
+            log.info("Console state: " + state)
+
+            if state == shell.LOGIN:
                 # Do login
                 if self._attemp_login("root", "analog"):
                     return True
                 else:
                     log.info("Attempting to login as analog")
-                    logged_in = self._attemp_login("analog", "analog")
-            else:
-                return True
+                    return self._attemp_login("analog", "analog")
+            return True
         except serial.serialutil.SerialTimeoutException as e:
             log.info(str(e))
-        return logged_in
+        return False
 
     def set_ip_static(self, address, nic="eth0"):
-        restart = False
-        if self.listen_thread_run:
-            restart = True
-            self.stop_log()
-        # Check if we need to login to the console
-        if not self._check_for_login():
-            raise Exception("Console inaccessible due to login failure")
-        cmd = "/usr/local/bin/enable_static_ip.sh " + address + " " + nic
-        self._write_data(cmd)
-        if restart:
-            self._read_for_time(period=1)
-            self.start_log(logappend=True)
+        with self._console():
+            # Check if we need to login to the console
+            if not self._check_for_login():
+                raise Exception("Console inaccessible due to login failure")
+            cmd = "/usr/local/bin/enable_static_ip.sh " + address + " " + nic
+            self._run_framed(cmd, timeout=30, check=False)
 
     def request_ip_dhcp(self, nic="eth0"):
-        restart = False
-        if self.listen_thread_run:
-            restart = True
-            self.stop_log()
-        # Check if we need to login to the console
-        if not self._check_for_login():
-            raise Exception("Console inaccessible due to login failure")
-        cmd = "/usr/local/bin/enable_dhcp.sh"
-        self._write_data(cmd)
-        self._read_for_time(period=1)
-        cmd = "dhclient -r " + nic
-        self._write_data(cmd)
-        self._read_for_time(period=1)
-        cmd = "dhclient " + nic
-        self._write_data(cmd)
-        self._read_for_time(period=1)
-        if restart:
-            self.start_log(logappend=True)
-
-    def get_uart_command_for_linux(self, cmd, findstring):
-        """Write command to UART and wait for a specific string"""
-        restart = False
-        if self.listen_thread_run:
-            restart = True
-            self.stop_log()
-        # Check if we need to login to the console
-        if not self._check_for_login():
-            raise Exception("Console inaccessible due to login failure")
-        self._write_data(cmd)
-        data = self._read_for_time(period=1)
-        if isinstance(data, list) and isinstance(data[0], list):
-            data = data[0]
-        data = data[1:]  # Remove command itself
-        if restart:
-            self.start_log(logappend=True)
-        for d in data:
-            if isinstance(d, list):
-                for c in d:
-                    log.info("command response: " + c)
-                    c = c.replace("\r", "")
-                    try:
-                        if len(findstring) == 0:
-                            if (len(c) > 0) and (c != cmd) and (cmd not in c):
-                                return c
-                        elif findstring in c:
-                            log.info("Found substring: " + str(c))
-                            return c
-                    except Exception:
-                        continue
-            else:
-                log.info("command response: " + d)
-                try:
-                    if len(findstring) == 0:
-                        if (len(d) > 0) and (d != cmd) and (cmd not in d):
-                            return d
-                    elif findstring in d:
-                        log.info("Found substring: " + str(d))
-                        return d
-                except Exception:
-                    continue
+        with self._console():
+            # Check if we need to login to the console
+            if not self._check_for_login():
+                raise Exception("Console inaccessible due to login failure")
+            for cmd in [
+                "/usr/local/bin/enable_dhcp.sh",
+                "dhclient -r " + nic,
+                "dhclient " + nic,
+            ]:
+                self._run_framed(cmd, timeout=30, check=False)
+
+    def run_linux_command(self, cmd, timeout=COMMAND_TIMEOUT):
+        """Run cmd on the Linux console and wait for it to finish
+
+        The command is framed by unique begin and end markers, the end one
+        followed by its exit status, so the call returns as soon as the
+        command completes with exactly what it printed. Returns the output
+        without carriage returns and the exit status. Raises TimeoutError
+        if the command does not complete within timeout seconds.
+        """
+        with self._console():
+            # Check if we need to login to the console
+            if not self._check_for_login():
+                raise Exception("Console inaccessible due to login failure")
+            return self._run_framed(cmd, timeout)
+
+    def _run_framed(self, cmd, timeout=COMMAND_TIMEOUT, check=True):
+        """Run cmd between markers on a logged in console. With check False
+        a timeout is logged and (None, None) returned instead of raised"""
+        token = uuid.uuid4().hex[:12]
+        begin = ("NEBULA_BEGIN_" + token).encode()
+        end = re.compile(b"NEBULA_END_" + token.encode() + rb" (\d+)\r?\n")
+        cmd = cmd.strip().rstrip(";") or ":"
+        # The quotes split the markers in the echo of the command line
+        line = f'echo NEBULA_""BEGIN_{token}; {cmd}; echo NEBULA_""END_{token} $?'
+        deadline = time.monotonic() + timeout
+        with self._console():
+            self._write_data(line, wait=0)
+            data = b""
+            match = end.search(data)
+            while not match:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if not check:
+                        log.warning(f"'{cmd}' did not complete in {timeout} s")
+                        return None, None
+                    raise TimeoutError(f"'{cmd}' did not complete in {timeout} s")
+                data += self._unread.read(timeout=remaining)
+                match = end.search(data)
+        out = data[: match.start()]
+        at = out.find(begin)
+        if at >= 0:
+            out = out[at + len(begin) :]
+        out = escape_ansi(out.decode("ASCII", errors="replace").replace("\r", ""))
+        if out.startswith("\n"):
+            out = out[1:]
+        if out.endswith("\n"):
+            out = out[:-1]
+        status = int(match.group(1))
+        log.info(f"'{cmd}' exited with {status}")
+        return out, status
+
+    def get_uart_command_for_linux(self, cmd, findstring, timeout=COMMAND_TIMEOUT):
+        """Run command on Linux over UART and return the first line of its
+        output containing findstring, or the first non-empty line if
+        findstring is empty"""
+        try:
+            out, _ = self.run_linux_command(cmd, timeout)
+        except TimeoutError as ex:
+            log.warning(str(ex))
+            return None
+        for line in out.split("\n"):
+            log.info("command response: " + line)
+            if len(findstring) == 0:
+                if line:
+                    return line
+            elif findstring in line:
+                log.info("Found substring: " + str(line))
+                return line
         return None
 
     def get_local_mac_usbdev(self):
@@ -464,35 +852,18 @@ class uart(utils):
         """Read IP address of DUT using ip command from UART"""
         # cmd = "ip -4 addr | grep -oP '(?<=inet\s)\d+(\.\d+){3}' | grep -v 127"
         cmd = "ip -4 addr | grep -v 127 | awk '$1 == \"inet\" {print $2}' | awk -F'/' '{print $1}'"
-        restart = False
-        if self.listen_thread_run:
-            restart = True
-            self.stop_log()
-        # Check if we need to login to the console
-        if not self._check_for_login():
-            raise Exception("Console inaccessible due to login failure")
-        self._write_data(cmd)
-        data = self._read_for_time(period=1)
-        if restart:
-            self.start_log(logappend=True)
-        for d in data:
-            if isinstance(d, list):
-                for c in d:
-                    c = escape_ansi(c.replace("\r", ""))
-                    try:
-                        ipaddress.ip_address(c)
-                        log.info("Found IP: " + str(c))
-                        return c
-                    except Exception:
-                        continue
-            else:
-                try:
-                    d = escape_ansi(d)
-                    ipaddress.ip_address(d)
-                    log.info("Found IP: " + str(d))
-                    return d
-                except Exception:
-                    continue
+        try:
+            out, _ = self.run_linux_command(cmd)
+        except TimeoutError as ex:
+            log.warning(str(ex))
+            return None
+        for line in out.split("\n"):
+            try:
+                ipaddress.ip_address(line.strip())
+                log.info("Found IP: " + line.strip())
+                return line.strip()
+            except ValueError:
+                continue
         return None
 
     def get_uart_boot_message(self):
@@ -508,213 +879,156 @@ class uart(utils):
             time.sleep(1)
         return data
 
-    def _read_until_done_multi(self, done_strings=["done", "done"], max_time=None):
-        if self.listen_thread_run:
-            restart_log = True
-            self.stop_log()
-        else:
-            restart_log = False
+    def _log_stream(self, data):
+        """Split console bytes into lines for the log. Returns the
+        incomplete last line, to be passed again with the next chunk"""
+        *lines, rest = data.split(b"\n")
+        for line in lines:
+            self.pipe_to_log_file(line.decode("ASCII", errors="replace"))
+        return rest
+
+    def _wait_for_strings(self, strings, max_time=None, until=None):
+        """Read the console until strings are seen or max_time seconds pass
+
+        Bytes are scanned as the reader thread passes them on, so the wait
+        ends as soon as the last needed byte is read. By default any of
+        strings ends the wait, until can be a callable taking the matcher
+        for other conditions.
+        Returns the pattern_matcher, whose found attribute holds the strings
+        seen.
+        """
+        matcher = pattern_matcher(strings)
+        until = until or (lambda m: bool(m.found))
+        deadline = time.monotonic() + (max_time or self.max_read_time)
+        with self._console():
+            while not until(matcher):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Wakes up as soon as the reader thread passes on bytes
+                for p in matcher.feed(self._unread.read(timeout=remaining)):
+                    log.info(p + " found in data")
+        return matcher
 
+    def _read_until_done_multi(self, done_strings=["done", "done"], max_time=None):
         if not isinstance(done_strings, list):
             raise Exception("Expecting done_strings to be a list")
 
-        mt = max_time or self.max_read_time
-
-        # initialize found list
-        found = []
-        for done_string in done_strings:
-            found.append(False)
-
-        for _ in range(mt):
-            data = self._read_until_stop()
-            for index, done_string in enumerate(done_strings, start=0):
-                if self._check_for_string_console(data, done_string, verbose=False):
-                    log.info(done_string + " found in data")
-                    found[index] = True
-            # if all found or last element is found, set all to True
-            if all(found) or found[-1]:
-                found = [True] * len(found)
-                if restart_log:
-                    self.start_log(logappend=True)
-                return found
-            log.info("Still waiting")
-            time.sleep(1)
-
-        if restart_log:
-            self.start_log(logappend=True)
+        # done once all strings or the last one are found
+        matcher = self._wait_for_strings(
+            done_strings,
+            max_time,
+            until=lambda m: done_strings[-1] in m.found
+            or len(m.found) == len(set(done_strings)),
+        )
+        found = [done_string in matcher.found for done_string in done_strings]
+        # if all found or last element is found, set all to True
+        if all(found) or found[-1]:
+            found = [True] * len(found)
+        else:
+            log.info("Not all strings found: " + str(found))
         return found
 
     def _read_until_done(self, done_string="done", max_time=None):
-        if self.listen_thread_run:
-            restart_log = True
-            self.stop_log()
-        else:
-            restart_log = False
-
         if not isinstance(done_string, list):
             done_string_list = [done_string]
         else:
             done_string_list = done_string
 
-        data = []
-        mt = max_time or self.max_read_time
-        for _ in range(mt):
-            data = self._read_until_stop()
-            if isinstance(data, list):
-                for d in data:
-                    for done_string in done_string_list:
-                        if done_string in d:
-                            log.info("done found in data")
-                            if restart_log:
-                                self.start_log(logappend=True)
-                            return True
-            else:
-                for done_string in done_string_list:
-                    if done_string in data:
-                        log.info("done found in data")
-                        if restart_log:
-                            self.start_log(logappend=True)
-                        return True
-            log.info("Still waiting")
-            time.sleep(1)
-        if restart_log:
-            self.start_log(logappend=True)
-        return False
+        done = bool(self._wait_for_strings(done_string_list, max_time).found)
+        if done:
+            log.info("done found in data")
+        return done
 
     def _check_for_string_console(self, console_out, string, verbose=True):
-        if not isinstance(string, list):
-            string_list = [string]
-        else:
-            string_list = string
-
+        matcher = pattern_matcher(string)
         for d in console_out:
             if not isinstance(d, list):
                 d = [d]
-            if isinstance(d, list):
-                for c in d:
-                    c = c.replace("\r", "")
-                    for string in string_list:
-                        if verbose:
-                            log.info("RAW: " + str(c) + " | Looking for: " + string)
-                        if string in c:
-                            return True
+            for c in d:
+                c = c.replace("\r", "")
+                if verbose:
+                    log.info("RAW: " + str(c) + " | Looking for: " + str(string))
+                if matcher.search(c):
+                    return True
         return False
 
     def _wait_for_boot_complete_linaro(self, done_string="Welcome to Linaro 14.04"):
         """Wait for Linux to boot by waiting for Welcome message"""
-        restart = False
-        if self.listen_thread_run:
-            restart = True
-            self.stop_log()
-        out = self._read_until_done(done_string=done_string, max_time=60)
-        if restart:
-            self.start_log(logappend=True)
-        return out
+        return self._read_until_done(done_string=done_string, max_time=60)
 
     def _enter_uboot_menu_from_power_cycle(self):
         log.info("Spamming ENTER to get UART console")
         # stop_at_done = False
-        if self.listen_thread_run:
-            restart = True
-            self.stop_log()
-        else:
-            restart = False
-        for _ in range(30):
-            self._write_data("\r\n")
-            self._write_data("\r\n")
-            data = self._read_for_time(1)
-            # Check uboot console reached
-            if self._check_for_string_console(data, self.uboot_done_string):
-                log.info("u-boot menu reached")
-                if restart:
-                    self.start_log(logappend=True)
-                return True
-            time.sleep(0.1)
+        with self._console():
+            for _ in range(30):
+                self._write_data("\r\n")
+                self._write_data("\r\n")
+                # Check uboot console reached
+                if self._wait_for_strings(self.uboot_done_string, max_time=1).found:
+                    log.info("u-boot menu reached")
+                    return True
+                time.sleep(0.1)
         log.info("u-boot menu not reached")
-        if restart:
-            self.start_log(logappend=True)
         return False
 
     def _enter_linux_prompt_from_power_cycle(self, prompt="root@analog", max_retry=30):
         log.info("Spamming ENTER to get UART console")
         log.info("Finding {} for max retry {}".format(prompt, max_retry))
         # stop_at_done = False
-        if self.listen_thread_run:
-            restart = True
-            self.stop_log()
-        else:
-            restart = False
-        for _ in range(max_retry):
-            self._write_data("\r\n")
-            data = self._read_for_time(2)
-            log.info("Found data {}".format(data))
-            # Check uboot console reached
-            if self._check_for_string_console(data, prompt):
-                log.info("linux prompt reached")
-                if restart:
-                    self.start_log(logappend=True)
-                return True
-            time.sleep(0.1)
+        with self._console():
+            for _ in range(max_retry):
+                self._write_data("\r\n")
+                # Check linux prompt reached
+                if self._wait_for_strings(prompt, max_time=2).found:
+                    log.info("linux prompt reached")
+                    return True
+                time.sleep(0.1)
         log.info("linux prompt not reached")
-        if restart:
-            self.start_log(logappend=True)
         return False
 
     def load_system_uart_from_tftp(self):
         """Load complete system (bitstream, devtree, kernel) during uboot from TFTP"""
 
-        restart = False
-        if self.listen_thread_run:
-            restart = True
-            self.stop_log()
-
-        # Flush
-        self._read_until_stop()
-
-        cmd = "setenv autoload no"
-        self._write_data(cmd)
-        self._read_for_time(period=3)
-        cmd = "dhcp"
-        self._write_data(cmd)
-        self._read_until_done(done_string=self.uboot_done_string)
-        cmd = "echo board IP ${ipaddr}"
-        self._write_data(cmd)
-        self._read_until_done(done_string=self.uboot_done_string)
-        cmd = "setenv serverip 192.168.86.39"
-        self._write_data(cmd)
-        self._read_until_done(done_string=self.uboot_done_string)
+        with self._console():
+            # Flush
+            self._read_until_stop()
 
-        self.update_fpga()
-        time.sleep(1)
-        self.update_dev_tree()
-        time.sleep(1)
-        self.update_kernel()
-        time.sleep(1)
-        self.update_boot_args()
-        time.sleep(1)
-        self.boot()
-        self._read_for_time(period=5)
+            cmd = "setenv autoload no"
+            self._write_data(cmd)
+            self._read_for_time(period=3)
+            cmd = "dhcp"
+            self._write_data(cmd)
+            self._read_until_done(done_string=self.uboot_done_string)
+            cmd = "echo board IP ${ipaddr}"
+            self._write_data(cmd)
+            self._read_until_done(done_string=self.uboot_done_string)
+            cmd = "setenv serverip 192.168.86.39"
+            self._write_data(cmd)
+            self._read_until_done(done_string=self.uboot_done_string)
 
-        if restart:
-            self.start_log(logappend=True)
+            self.update_fpga()
+            time.sleep(1)
+            self.update_dev_tree()
+            time.sleep(1)
+            self.update_kernel()
+            time.sleep(1)
+            self.update_boot_args()
+            time.sleep(1)
+            self.boot()
+            self._read_for_time(period=5)
 
     def load_system_uart(
         self, system_top_bit_filename, devtree_filename, kernel_filename
     ):
         """Load complete system (bitstream, devtree, kernel) during uboot from UART (XMODEM)"""
-        if self.listen_thread_run:
-            restart = True
-            self.stop_log()
-        else:
-            restart = False
-        self._send_file(system_top_bit_filename, "0x1000000")
-        self.update_fpga(skip_tftpload=True)
-        self._send_file(devtree_filename, "0x2A00000")
-        self._send_file(kernel_filename, "0x3000000")
-        self.update_boot_args()
-        self.boot()
-        if restart:
-            self.start_log(logappend=True)
+        with self._console():
+            self._send_file(system_top_bit_filename, "0x1000000")
+            self.update_fpga(skip_tftpload=True)
+            self._send_file(devtree_filename, "0x2A00000")
+            self._send_file(kernel_filename, "0x3000000")
+            self.update_boot_args()
+            self.boot()
 
     def update_boot_files_from_running(
         self, system_top_bit_filename, devtree_filename, kernel_filename
@@ -1,5 +1,7 @@
 """USB SD Card MUX controller class to manage the mux and connected cards."""
+
 import glob
+import hashlib
 import logging
 import os
 import pathlib
@@ -14,10 +16,64 @@ from usbsdmux import usbsdmux
 
 import nebula.helper as helper
 from nebula.common import utils
+from nebula.integrity import hash_file
 
 log = logging.getLogger(__name__)
 
 
+def write_stream_to_device(chunks, device, block_size=4 * 1024 * 1024, verify=False):
+    """Write an iterator of byte chunks to a block device in aligned blocks.
+
+    Args:
+        chunks (iterable): Chunks of the image, e.g. from downloader.stream_sdcard_release
+        device (str): Path of the block device (or file) to write to
+        block_size (int): Size of each write. Must be a multiple of 512
+        verify (bool): Read the written data back and compare its md5
+
+    Returns:
+        str: md5 of the data written
+    """
+    md5 = hashlib.md5()
+    written = 0
+    buf = bytearray()
+    fd = os.open(device, os.O_WRONLY)
+    try:
+        for chunk in chunks:
+            buf += chunk
+            if len(buf) < block_size:
+                continue
+            end = len(buf) - len(buf) % block_size
+            block = memoryview(buf)[:end]
+            md5.update(block)
+            written += _write_all(fd, block)
+            block.release()
+            del buf[:end]
+        if buf:
+            md5.update(buf)
+            written += _write_all(fd, memoryview(buf))
+        os.fsync(fd)
+        if verify and hasattr(os, "posix_fadvise"):
+            # Drop the written pages so the check reads back from the card
+            # and not from the page cache
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    log.info(f"Wrote {written} bytes to {device}")
+
+    if verify:
+        check = hash_file(device, ["md5"], length=written)["md5"]
+        if check != md5.hexdigest():
+            raise Exception(f"Verification of data written to {device} failed")
+    return md5.hexdigest()
+
+
+def _write_all(fd, data):
+    total = 0
+    while total < len(data):
+        total += os.write(fd, data[total:])
+    return total
+
+
 class usbmux(utils):
     """USB SD Card MUX controller and helper methods"""
 
@@ -120,6 +176,32 @@ class usbmux(utils):
         if e != 0:
             raise Exception("Error writing image file to SD card")
 
+    def write_img_stream_to_sdcard(self, chunks, verify=False):
+        """Write a streamed image to the SD card without staging it on disk.
+
+        Args:
+            chunks (iterable): Image data chunks, e.g. from downloader.stream_sdcard_release
+            verify (bool): Read the card back and compare against the written data
+
+        Returns:
+            str: md5 of the data written
+        """
+        if not self._target_sdcard:
+            self.find_muxed_sdcard()
+        self.set_mux_mode("host")
+        time.sleep(5)
+        # Check to make sure SD card is there
+        devs = os.listdir("/dev")
+        if self._target_sdcard not in devs:
+            raise Exception("Target SD card not found")
+        log.warn(
+            f"WARNING: Writing image stream to SD card. Will destroy all data on {self._target_sdcard}"
+        )
+        time.sleep(5)
+        return write_stream_to_device(
+            chunks, f"/dev/{self._target_sdcard}", verify=verify
+        )
+
     def _mount_sd_card(self, include_root_partition=False):
         if not self._target_sdcard:
             self.find_muxed_sdcard()
@@ -1,8 +1,84 @@
+import hashlib
+import io
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
 import pytest
 
 from nebula import pdu, usbmux
 
 
+class ArtifactHandler(SimpleHTTPRequestHandler):
+    """Static file handler with ETag validation and byte ranges, used as a
+    local server stand-in. Setting server.drop_after to a byte count cuts the
+    next file transfer short after that many bytes."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            return super().send_head()
+        with open(path, "rb") as f:
+            content = f.read()
+        etag = '"' + hashlib.md5(content).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return None
+
+        start, end = 0, len(content) - 1
+        ranged = self.headers.get("Range")
+        if ranged and self.headers.get("If-Range", etag) == etag:
+            first, last = ranged.split("=")[1].split("-")
+            start = int(first)
+            end = int(last) if last else end
+            if start >= len(content):
+                self.send_response(416)
+                self.end_headers()
+                return None
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(content)}")
+        else:
+            self.send_response(200)
+        body = content[start : end + 1]
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.end_headers()
+
+        drop_after = getattr(self.server, "drop_after", None)
+        if drop_after is not None:
+            self.server.drop_after = None
+            self.close_connection = True
+            body = body[:drop_after]
+        return io.BytesIO(body)
+
+
+@pytest.fixture()
+def http_server(tmp_path):
+    """Serve tmp_path/www over HTTP on localhost. Requests are recorded"""
+    root = tmp_path / "www"
+    root.mkdir()
+
+    def handler(*args, **kwargs):
+        return ArtifactHandler(*args, directory=str(root), **kwargs)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.requests = []
+    server.root = root
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
 def pytest_addoption(parser):
     # register additional options
     parser.addoption(
@@ -0,0 +1,204 @@
+import os
+import stat
+
+from nebula import downloader
+from nebula.cache import artifact_cache
+from nebula.downloader import fetch_file
+from nebula.manifest import manifest
+
+
+def test_cached_download_hard_links(http_server, tmp_path):
+    (http_server.root / "BOOT.BIN").write_bytes(os.urandom(4096))
+    cache = artifact_cache(str(tmp_path / "cache"))
+    url = http_server.url + "/BOOT.BIN"
+
+    first = tmp_path / "a"
+    second = tmp_path / "b"
+    first.mkdir()
+    second.mkdir()
+    sha_a = fetch_file(url, str(first / "BOOT.BIN"), cache=cache)
+    sha_b = fetch_file(url, str(second / "BOOT.BIN"), cache=cache)
+
+    assert sha_a == sha_b
+    assert os.path.samefile(first / "BOOT.BIN", second / "BOOT.BIN")
+    assert stat.S_IMODE(os.stat(first / "BOOT.BIN").st_mode) == 0o444
+    # Second fetch is a conditional request answered with 304
+    assert "If-None-Match" in http_server.requests[-1][2]
+    assert cache.lookup(url)["sha256"] == sha_a
+
+
+def test_cache_revalidates_changed_file(http_server, tmp_path):
+    src = http_server.root / "uImage"
+    src.write_bytes(b"old" * 100)
+    cache = artifact_cache(str(tmp_path / "cache"))
+    url = http_server.url + "/uImage"
+    out = str(tmp_path / "uImage")
+
+    fetch_file(url, out, cache=cache)
+    src.write_bytes(b"new" * 100)
+    fetch_file(url, out, cache=cache)
+
+    with open(out, "rb") as f:
+        assert f.read() == b"new" * 100
+
+
+def test_cache_lru_eviction(http_server, tmp_path):
+    for name in ["a", "b", "c"]:
+        (http_server.root / name).write_bytes(os.urandom(1000))
+    cache = artifact_cache(str(tmp_path / "cache"), max_size=2500)
+    for name in ["a", "b", "c"]:
+        fetch_file(f"{http_server.url}/{name}", str(tmp_path / name), cache=cache)
+
+    assert cache.lookup(http_server.url + "/a") is None
+    assert cache.lookup(http_server.url + "/b")
+    assert cache.lookup(http_server.url + "/c")
+
+
+def test_downloader_uses_cache(http_server, tmp_path):
+    (http_server.root / "system.dtb").write_bytes(b"dtb")
+    d = downloader()
+    d.cache_dir = str(tmp_path / "cache")
+    out = tmp_path / "outs"
+    out.mkdir()
+    d.download(http_server.url + "/system.dtb", str(out / "system.dtb"))
+
+    assert d.cache.lookup(http_server.url + "/system.dtb")
+    entry = manifest(str(out)).files["system.dtb"]
+    assert entry["url"] == http_server.url + "/system.dtb"
+    assert entry["size"] == 3
+
+
+def test_single_flight_shares_download(http_server, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    (http_server.root / "Image").write_bytes(os.urandom(1 << 20))
+    url = http_server.url + "/Image"
+    outs = [tmp_path / f"outs{i}" for i in range(4)]
+
+    def fetch(out):
+        # Separate cache objects behave like separate processes on one agent
+        out.mkdir()
+        cache = artifact_cache(str(tmp_path / "cache"))
+        return fetch_file(url, str(out / "Image"), cache=cache)
+
+    with ThreadPoolExecutor(len(outs)) as pool:
+        hashes = list(pool.map(fetch, outs))
+
+    assert len(set(hashes)) == 1
+    full = [r for r in http_server.requests if "If-None-Match" not in r[2]]
+    assert len(full) == 1
+    assert all(os.path.samefile(outs[0] / "Image", out / "Image") for out in outs)
+    assert not os.listdir(tmp_path / "cache" / "partial")
+
+
+def test_immutable_url_served_from_cache(http_server, tmp_path):
+    (http_server.root / "plutosdr-fw-v0.38.zip").write_bytes(b"zip")
+    cache = artifact_cache(str(tmp_path / "cache"))
+    url = http_server.url + "/plutosdr-fw-v0.38.zip"
+
+    fetch_file(url, str(tmp_path / "a.zip"), cache=cache, immutable=True)
+    fetch_file(url, str(tmp_path / "b.zip"), cache=cache, immutable=True)
+
+    assert len(http_server.requests) == 1
+    assert os.path.samefile(tmp_path / "a.zip", tmp_path / "b.zip")
+
+
+def test_checksum_mismatch_is_not_cached(http_server, tmp_path):
+    import hashlib
+
+    import pytest
+
+    src = http_server.root / "rootfs.cpio"
+    src.write_bytes(b"good")
+    good = hashlib.sha256(b"good").hexdigest()
+    cache = artifact_cache(str(tmp_path / "cache"))
+    url = http_server.url + "/rootfs.cpio"
+    out = str(tmp_path / "rootfs.cpio")
+
+    src.write_bytes(b"corrupt")
+    with pytest.raises(Exception, match="Checksum mismatch"):
+        fetch_file(url, out, cache=cache, expected_sha256=good)
+    assert cache.lookup(url) is None
+    assert not os.path.exists(out)
+
+    # A cached copy not matching the checksum is dropped and downloaded again
+    fetch_file(url, out, cache=cache, immutable=True)
+    src.write_bytes(b"good")
+    assert (
+        fetch_file(url, out, cache=cache, immutable=True, expected_sha256=good) == good
+    )
+    assert cache.lookup(url)["sha256"] == good
+
+
+def test_modified_object_is_not_served(http_server, tmp_path):
+    (http_server.root / "uImage").write_bytes(b"kernel" * 100)
+    cache = artifact_cache(str(tmp_path / "cache"))
+    url = http_server.url + "/uImage"
+    out = tmp_path / "uImage"
+    fetch_file(url, str(out), cache=cache)
+    assert cache.lookup(url)
+
+    # Writing through the hard link keeps the size but changes the object
+    os.chmod(out, 0o644)
+    with open(out, "r+b") as f:
+        f.write(b"KERNEL")
+    assert cache.lookup(url) is None
+
+    fetch_file(url, str(out), cache=cache)
+    assert out.read_bytes() == b"kernel" * 100
+    assert cache.lookup(url)
+
+
+def test_evicted_object_is_downloaded_again(http_server, tmp_path):
+    (http_server.root / "uImage").write_bytes(b"kernel" * 100)
+    cache = artifact_cache(str(tmp_path / "cache"))
+    url = http_server.url + "/uImage"
+    out = tmp_path / "uImage"
+    sha256 = fetch_file(url, str(out), cache=cache)
+
+    # Another process evicting the object while its index entry is read
+    os.remove(cache._object_path(sha256))
+    assert cache.link(url, str(tmp_path / "other")) is None
+    assert fetch_file(url, str(out), cache=cache, immutable=True) == sha256
+    assert out.read_bytes() == b"kernel" * 100
+
+
+def test_cache_copies_without_hardlinks(http_server, tmp_path):
+    (http_server.root / "BOOT.BIN").write_bytes(b"boot" * 100)
+    cache = artifact_cache(str(tmp_path / "cache"), hardlinks=False)
+    url = http_server.url + "/BOOT.BIN"
+    out = tmp_path / "BOOT.BIN"
+    sha256 = fetch_file(url, str(out), cache=cache)
+
+    assert not os.path.samefile(out, cache._object_path(sha256))
+    out.write_bytes(b"changed")
+    assert cache.lookup(url)
+
+
+def _store_many(cache_dir, worker):
+    cache = artifact_cache(cache_dir)
+    for i in range(20):
+        src = os.path.join(cache_dir, f"src{worker}-{i}")
+        with open(src, "wb") as f:
+            f.write(f"{worker}-{i}".encode())
+        cache.store(f"http://server/{worker}/{i}", src, f"{worker:02d}{i:062d}")
+
+
+def test_index_updates_across_processes(tmp_path):
+    import multiprocessing
+
+    import pytest
+
+    if not hasattr(os, "fork"):
+        pytest.skip("needs fork")
+    ctx = multiprocessing.get_context("fork")
+    cache_dir = str(tmp_path / "cache")
+    artifact_cache(cache_dir)
+    procs = [ctx.Process(target=_store_many, args=(cache_dir, w)) for w in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+    # No process overwrote the index with a copy missing the others' entries
+    assert len(artifact_cache(cache_dir)._load_index()) == 80
@@ -1,11 +1,14 @@
+import hashlib
 import os
 import pathlib
+import re
 import shutil
-from unittest.mock import Mock, patch
+from unittest.mock import MagicMock, Mock, patch
 
 import pytest
 
 from nebula import downloader
+from nebula.manifest import manifest
 
 # Must be connected to analog VPN
 
@@ -78,7 +81,7 @@ def test_boot_downloader(test_downloader, board_name, branch, filetype):
     assert os.path.isfile("outs/BOOT.BIN")
     assert os.path.isfile("outs/bootgen_sysfiles.tgz")
     assert os.path.isfile("outs/properties.yaml")
-    assert os.path.isfile("outs/hashes.txt")
+    assert os.path.isfile("outs/manifest.json")
 
     if board_name == "zynq-zc706-adv7511-fmcomms11":
         assert os.path.isfile("outs/uImage")
@@ -99,7 +102,7 @@ def test_hdl_linux_downloader(test_downloader, board_name, branch, filetype):
     assert os.path.isfile("outs/BOOT.BIN")
     assert os.path.isfile("outs/bootgen_sysfiles.tgz")
     assert os.path.isfile("outs/properties.yaml")
-    assert os.path.isfile("outs/hashes.txt")
+    assert os.path.isfile("outs/manifest.json")
 
     if board_name == "zynq-zc706-adv7511-fmcomms11":
         assert os.path.isfile("outs/uImage")
@@ -116,7 +119,7 @@ def test_noos_downloader(test_downloader, board_name, branch, filetype):
     test_downloader(board_name, branch, filetype)
     file = [_ for _ in os.listdir("outs") if _.endswith(".zip")]
     assert len(file) >= 1
-    assert os.path.isfile("outs/hashes.txt")
+    assert os.path.isfile("outs/manifest.json")
 
 
 @pytest.mark.skip(reason="Not built")
@@ -131,7 +134,7 @@ def test_microblaze_downloader(test_downloader, board_name, branch, filetype):
         assert os.path.isfile("outs/system_top.xsa")
     assert os.path.isfile("outs/simpleImage.kc705_fmcomms4.strip")
     assert os.path.isfile("outs/properties.yaml")
-    assert os.path.isfile("outs/hashes.txt")
+    assert os.path.isfile("outs/manifest.json")
 
 
 @pytest.mark.parametrize("board_name", ["eval-adxrs290-pmdz"])
@@ -142,7 +145,7 @@ def test_rpi_downloader(test_downloader, board_name, branch, filetype):
     assert os.path.isfile("outs/kernel7l.img")
     assert os.path.isfile("outs/rpi-adxrs290.dtbo")
     assert os.path.isfile("outs/properties.txt")
-    assert os.path.isfile("outs/hashes.txt")
+    assert os.path.isfile("outs/manifest.json")
 
 
 @pytest.mark.parametrize("board_name", ["pluto"])
@@ -154,7 +157,7 @@ def test_firmware_downloader(test_downloader, board_name, branch, filetype, sour
     test_downloader(board_name, branch, filetype, source=source)
     file = [_ for _ in os.listdir("outs") if _.endswith(".zip")]
     assert len(file) == 1
-    assert os.path.isfile("outs/hashes.txt")
+    assert os.path.isfile("outs/manifest.json")
 
 
 @pytest.mark.parametrize("board_name", ["zynq-zed-adv7511-ad7768-1-evb"])
@@ -176,7 +179,7 @@ def test_boot_downloader_new_flow(
     assert os.path.isfile("outs/bootgen_sysfiles.tgz")
     assert os.path.isfile("outs/devicetree.dtb")
     assert os.path.isfile("outs/properties.yaml")
-    assert os.path.isfile("outs/hashes.txt")
+    assert os.path.isfile("outs/manifest.json")
 
 
 @pytest.mark.skip(reason="filesize")
@@ -197,7 +200,7 @@ def test_get_info_txt(url):
     from nebula.downloader import get_info_txt
 
     build_info = get_info_txt(url)
-    assert os.path.isfile("info.txt")
+    assert not os.path.isfile("info.txt")
     assert "BRANCH" in build_info.keys()
     assert "PR_ID" in build_info.keys()
     assert "TIMESTAMP" in build_info.keys()
@@ -207,5 +210,590 @@ def test_get_info_txt(url):
     assert "COMMIT_DATE" in build_info.keys()
 
 
+def test_download_plan_concurrent(http_server, tmp_path):
+    names = ["uImage", "BOOT.BIN", "bootgen_sysfiles.tgz", "devicetree.dtb"]
+    for name in names:
+        (http_server.root / name).write_bytes(os.urandom(2048))
+    d = downloader()
+    d.use_cache = False
+    out = tmp_path / "outs"
+    out.mkdir()
+
+    d._plan = []
+    for name in names:
+        d._queue_download(f"{http_server.url}/{name}", str(out / name))
+    assert not any((out / name).exists() for name in names)
+    d._flush_downloads()
+
+    for name in names:
+        assert (out / name).read_bytes() == (http_server.root / name).read_bytes()
+    assert sorted(manifest(str(out)).files) == sorted(names)
+
+
+def test_download_plan_fallback(http_server, tmp_path):
+    (http_server.root / "system_top.hdf").write_bytes(b"hdf")
+    d = downloader()
+    d.use_cache = False
+    d._plan = []
+    xsa = str(tmp_path / "system_top.xsa")
+    hdf = str(tmp_path / "system_top.hdf")
+    d._queue_download(
+        http_server.url + "/system_top.xsa",
+        xsa,
+        (http_server.url + "/system_top.hdf", hdf),
+    )
+    d._flush_downloads()
+    assert not os.path.isfile(xsa)
+    assert os.path.isfile(hdf)
+
+
+def test_url_resolver_memoizes_listings(http_server):
+    from nebula.downloader import gen_url, url_resolver
+
+    for date in ["2024_04_01-10_00_00", "2024_05_01-10_00_00"]:
+        project = http_server.root / "boot_partition" / "main" / date
+        (project / "boot_partition" / "zynq-zc706").mkdir(parents=True)
+    template = "http://{}/boot_partition/{}/{}/{}"
+    ip = http_server.url.split("//")[1]
+    resolver = url_resolver()
+
+    urls = [
+        gen_url(ip, "main", "zynq-zc706", f, None, template, resolver)
+        for f in ["BOOT.BIN", "uImage", "devicetree.dtb"]
+    ]
+
+    assert all("2024_05_01-10_00_00/boot_partition/zynq-zc706/" in u for u in urls)
+    # One scrape of the branch folder plus one of the newest build folder
+    assert len(http_server.requests) == 2
+    resolver.ttl = 0
+    gen_url(ip, "main", "zynq-zc706", "BOOT.BIN", None, template, resolver)
+    assert len(http_server.requests) == 4
+
+
+def test_artifactory_resolver_storage_api():
+    from nebula.downloader import artifactory_resolver
+
+    base = "https://artifactory.example.com/artifactory"
+    responses = {
+        f"{base}/api/storage/repo/boot_partition/main": {
+            "children": [
+                {"uri": "/2024_05_01-10_00_00", "folder": True},
+                {"uri": "/2024_04_01-10_00_00", "folder": True},
+                {"uri": "/latest.txt", "folder": False},
+            ]
+        },
+        f"{base}/api/storage/repo/boot_partition/main/2024_05_01-10_00_00/zc706?list&deep=1": {
+            "files": [{"uri": "/BOOT.BIN", "size": 3, "sha2": "abc", "folder": False}]
+        },
+    }
+
+    def get(url):
+        resp = Mock()
+        resp.status_code = 200 if url in responses else 404
+        resp.json.return_value = responses.get(url)
+        return resp
+
+    resolver = artifactory_resolver(session=Mock(get=Mock(side_effect=get)))
+    folder = f"{base}/repo/boot_partition/main/"
+
+    assert resolver.newest_folder(folder) == "2024_05_01-10_00_00"
+    assert f"{base}/repo/boot_partition/main/latest.txt" in resolver.list(folder)
+    build = f"{base}/repo/boot_partition/main/2024_05_01-10_00_00/zc706"
+    assert resolver.checksum(build + "/BOOT.BIN") == "abc"
+    assert resolver.checksum(build + "/uImage") is None
+    assert resolver.session.get.call_count == 3
+
+
+def test_resolver_backends_list_alike():
+    from nebula.downloader import artifactory_resolver, url_resolver
+
+    base = "https://artifactory.example.com/artifactory"
+    tree = {
+        "repo/linux/main": ["2024_04_01-10_00_00/", "2024_05_01-10_00_00/"],
+        "repo/linux/main/2024_04_01-10_00_00": ["uImage", "zynq.dtb", "zynqmp.dtb"],
+        "repo/linux/main/2024_05_01-10_00_00": ["uImage", "zynq.dtb", "zynqmp.dtb"],
+    }
+
+    def get(url, **kwargs):
+        path = re.sub("/+", "/", url.split("/artifactory/", 1)[1]).strip("/")
+        storage = path.startswith("api/storage/")
+        names = tree[path[len("api/storage/") :] if storage else path]
+        children = [
+            {"uri": "/" + n.rstrip("/"), "folder": n.endswith("/")} for n in names
+        ]
+        links = "".join(f'<a href="{n}">{n}</a>' for n in ["../"] + names)
+        return Mock(status_code=200, json=lambda: {"children": children}, text=links)
+
+    url = f"{base}/repo/linux/main"
+    html = url_resolver(session=Mock(get=get))
+    storage = artifactory_resolver(session=Mock(get=get))
+
+    def names(links):
+        return [link.rstrip("/").rsplit("/", 1)[1] for link in links]
+
+    assert names(storage.list(url)) == names(html.list(url))
+    newest = html.list(url)[-1]
+    assert names(storage.list(newest)) == names(html.list(newest))
+    # The newest build holds as many links as "linux" builds need
+    assert storage.newest_folder(url) == html.newest_folder(url)
+    assert storage.newest_folder(url) == "2024_05_01-10_00_00"
+
+
+def test_artifactory_resolver_falls_back_to_listfd():
+    from nebula.downloader import artifactory_resolver
+
+    resolver = artifactory_resolver(
+        session=Mock(get=Mock(return_value=Mock(status_code=403)))
+    )
+    resolver.session.get.return_value.raise_for_status.side_effect = Exception
+    url = "https://artifactory.example.com/artifactory/repo/main"
+    with patch("nebula.downloader.listFD", return_value=[url + "/a/"]) as lister:
+        assert resolver.list(url) == [url + "/a/"]
+        resolver.list(url + "/a")
+    assert lister.call_count == 2
+    # Storage API is not retried once the server rejected it
+    assert resolver.session.get.call_count == 1
+
+
+def test_github_resolver_shares_cached_release(tmp_path):
+    from nebula.cache import artifact_cache
+    from nebula.downloader import github_resolver
+
+    def response(status, tag=None):
+        resp = Mock(status_code=status, ok=status == 200, headers={"ETag": '"1"'})
+        resp.json.return_value = [{"tag_name": tag}]
+        return resp
+
+    cache = artifact_cache(str(tmp_path / "cache"))
+    session = Mock(get=Mock(return_value=response(200, "v0.38")))
+    first = github_resolver(ttl=300, session=session, cache=cache, token="t")
+    assert first.latest_release("analogdevicesinc/plutosdr-fw") == "v0.38"
+    assert first.latest_release("analogdevicesinc/plutosdr-fw") == "v0.38"
+    assert session.get.call_args[1]["headers"]["Authorization"] == "Bearer t"
+
+    # Another process shares the tag through the cache
+    other = github_resolver(ttl=300, session=session, cache=cache)
+    assert other.latest_release("analogdevicesinc/plutosdr-fw") == "v0.38"
+    assert session.get.call_count == 1
+
+    # Expired entries are revalidated, and kept when rate limited
+    expired = github_resolver(ttl=0, session=session, cache=cache)
+    session.get.return_value = response(304)
+    assert expired.latest_release("analogdevicesinc/plutosdr-fw") == "v0.38"
+    assert session.get.call_args[1]["headers"]["If-None-Match"] == '"1"'
+    session.get.return_value = response(403)
+    assert expired.latest_release("analogdevicesinc/plutosdr-fw") == "v0.38"
+    with pytest.raises(Exception, match="not available"):
+        expired.latest_release("analogdevicesinc/m2k-fw")
+
+
+def test_download_resumes_interrupted_transfer(http_server, tmp_path):
+    from nebula.downloader import fetch_file
+
+    content = os.urandom(20000)
+    (http_server.root / "image.img.xz").write_bytes(content)
+    http_server.drop_after = 5000
+    out = tmp_path / "image.img.xz"
+
+    fetch_file(http_server.url + "/image.img.xz", str(out))
+
+    assert out.read_bytes() == content
+    # Second request picks up after the bytes received before the drop
+    resumed_at = int(http_server.requests[-1][2]["Range"][6:-1])
+    assert 0 < resumed_at <= 5000
+    assert not os.path.exists(str(out) + ".part")
+
+
+def test_download_resumes_partial_file(http_server, tmp_path):
+    from nebula.downloader import fetch_file
+
+    content = os.urandom(20000)
+    (http_server.root / "image.img.xz").write_bytes(content)
+    out = tmp_path / "image.img.xz"
+    (tmp_path / "image.img.xz.part").write_bytes(content[:12000])
+    etag = '"' + hashlib.md5(content).hexdigest() + '"'
+    (tmp_path / "image.img.xz.part.validator").write_text(etag)
+
+    sha = fetch_file(http_server.url + "/image.img.xz", str(out))
+
+    assert sha == hashlib.sha256(content).hexdigest()
+    assert out.read_bytes() == content
+    assert len(http_server.requests) == 1
+
+
+def test_download_parallel_ranges(http_server, tmp_path):
+    from nebula.downloader import fetch_file
+
+    content = os.urandom(100001)
+    (http_server.root / "image.img.xz").write_bytes(content)
+    out = tmp_path / "image.img.xz"
+
+    sha = fetch_file(http_server.url + "/image.img.xz", str(out), parallel=4)
+
+    assert sha == hashlib.sha256(content).hexdigest()
+    assert out.read_bytes() == content
+    ranges = [r[2].get("Range") for r in http_server.requests if "Range" in r[2]]
+    assert len(ranges) == 4
+
+
+def test_write_response_grows_chunks(tmp_path):
+    import io
+
+    from nebula.downloader import MAX_CHUNK, MIN_CHUNK, _chunks, _write_response
+
+    content = os.urandom(10 * 1024 * 1024)
+    resp = Mock(raw=io.BytesIO(content), headers={})
+    sizes = [len(chunk) for chunk in _chunks(resp)]
+    assert sizes[:3] == [MIN_CHUNK, 2 * MIN_CHUNK, 4 * MIN_CHUNK]
+    assert max(sizes) == MAX_CHUNK
+
+    resp = Mock(raw=io.BytesIO(content), headers={"content-length": str(len(content))})
+    bar = MagicMock(total=0)
+    out = tmp_path / "BOOT.BIN"
+    sha = _write_response(resp, str(out), bar=bar)
+    assert sha == hashlib.sha256(content).hexdigest()
+    assert out.read_bytes() == content
+    assert sum(c[0][0] for c in bar.update.call_args_list) == len(content)
+
+
+def test_stream_xz_image_single_pass(http_server, tmp_path):
+    import lzma
+
+    from nebula.downloader import stream_xz_image
+
+    image = os.urandom(300000) + bytes(300000)
+    xz = lzma.compress(image)
+    (http_server.root / "release.img.xz").write_bytes(xz)
+    http_server.drop_after = len(xz) // 2
+    tee = tmp_path / "release.img.xz"
+
+    chunks = stream_xz_image(
+        http_server.url + "/release.img.xz",
+        xz_md5=hashlib.md5(xz).hexdigest(),
+        img_md5=hashlib.md5(image).hexdigest(),
+        tee=str(tee),
+        chunk_size=4096,
+    )
+
+    assert b"".join(chunks) == image
+    assert tee.read_bytes() == xz
+    assert "Range" in http_server.requests[-1][2]
+
+
+def test_stream_xz_image_md5_mismatch(http_server):
+    import lzma
+
+    from nebula.downloader import stream_xz_image
+
+    (http_server.root / "release.img.xz").write_bytes(lzma.compress(b"image"))
+    chunks = stream_xz_image(http_server.url + "/release.img.xz", img_md5="0" * 32)
+    with pytest.raises(Exception, match="MD5 hash check failed"):
+        b"".join(chunks)
+
+
+def test_stream_xz_image_resumes_previous_run(http_server, tmp_path):
+    import lzma
+
+    from nebula.downloader import stream_xz_image
+
+    image = os.urandom(200000)
+    xz = lzma.compress(image)
+    (http_server.root / "release.img.xz").write_bytes(xz)
+    http_server.drop_after = len(xz) // 2
+    tee = tmp_path / "release.img.xz"
+    url = http_server.url + "/release.img.xz"
+
+    with pytest.raises(Exception):
+        b"".join(stream_xz_image(url, tee=str(tee), chunk_size=4096, retries=0))
+    assert os.path.isfile(str(tee) + ".part")
+
+    chunks = stream_xz_image(
+        url, tee=str(tee), img_md5=hashlib.md5(image).hexdigest(), chunk_size=4096
+    )
+    assert b"".join(chunks) == image
+    assert tee.read_bytes() == xz
+    assert http_server.requests[-1][2]["Range"] != "bytes=0-"
+
+
+def test_download_sdcard_release_parallel(http_server, tmp_path, monkeypatch, capsys):
+    import lzma
+
+    image = os.urandom(300000)
+    xz = lzma.compress(image)
+    (http_server.root / "release.img.xz").write_bytes(xz)
+    rel = {
+        "link": http_server.url + "/release.img.xz",
+        "xzname": str(tmp_path / "release.img.xz"),
+        "imgname": str(tmp_path / "release.img"),
+        "xzmd5": hashlib.md5(xz).hexdigest(),
+        "imgmd5": hashlib.md5(image).hexdigest(),
+    }
+    d = downloader()
+    d.parallel_ranges = 4
+    monkeypatch.setattr(d, "releases", lambda release: rel)
+
+    d.download_sdcard_release()
+    assert (tmp_path / "release.img").read_bytes() == image
+    assert (tmp_path / "release.img.xz").read_bytes() == xz
+    assert "MD5 Check: PASSED" in capsys.readouterr().out
+
+    rel["imgmd5"] = "0" * 32
+    with pytest.raises(Exception, match="MD5 hash check failed"):
+        d.download_sdcard_release(keep_xz=False)
+    assert "MD5 Check: FAILED" in capsys.readouterr().out
+    assert not os.path.exists(rel["imgname"])
+
+
+@pytest.mark.parametrize("outs", ["outs", "work/cold/zynq-zc706-adv7511-fmcomms11"])
+def test_download_boot_files_local_fs(tmp_path, monkeypatch, outs):
+    board = "zynq-zc706-adv7511-fmcomms11"
+    src = tmp_path / "src"
+    for name in [
+        "zynq-common/uImage",
+        f"{board}/BOOT.BIN",
+        f"{board}/bootgen_sysfiles.tgz",
+        f"{board}/devicetree.dtb",
+    ]:
+        (src / name).parent.mkdir(parents=True, exist_ok=True)
+        (src / name).write_bytes(name.encode())
+    monkeypatch.chdir(tmp_path)
+    d = downloader()
+    d.reference_boot_folder = str(src / board)
+    # Parents of a nested output folder are created too
+    d.output_folder = outs
+    d.download_boot_files(
+        board, source="local_fs", source_root=str(src), boot_partition=True
+    )
+
+    for name in ["uImage", "BOOT.BIN", "bootgen_sysfiles.tgz", "devicetree.dtb"]:
+        assert os.path.isfile(tmp_path / outs / name)
+    m = manifest(str(tmp_path / outs))
+    assert (m.board, m.data["source"], m.data["folder"]) == (
+        board,
+        "local_fs",
+        "boot_partition",
+    )
+    assert set(m.data["local_copies"].values()) <= {"reflink", "hardlink"}
+
+
+@pytest.mark.parametrize(
+    "fmc, fpga, board",
+    [
+        ("ADRV9361", "CCBOB_CMOS", "zynq-adrv9361-z7035-bob"),
+        ("AD9081", "DK-SOC-10AS066S-A", "socfpga_arria10_socdk_ad9081"),
+        ("fmcomms2", "ZC706", "zynq-zc706-adv7511-ad9361-fmcomms2-3"),
+        ("nothing", "ZC706", None),
+    ],
+)
+def test_translate_to_reference_design_name(fmc, fpga, board):
+    from nebula.common import get_board_index
+    from nebula.downloader import filter_boards
+
+    paths, rd_names = filter_boards([f"{fmc} {fpga} (rx).BIN"] * 3, None, None)
+    assert rd_names == [board] * 3
+    assert get_board_index() is get_board_index()
+
+
+class _artifact:
+    """Minimal stand-in for an ArtifactoryPath of the local server"""
+
+    def __init__(self, url):
+        self.url = url
+        self.name = url.rsplit("/", 1)[1]
+        self.session = None
+
+    def __str__(self):
+        return self.url
+
+
+def test_download_artifacts_skips_matching(http_server, tmp_path):
+    from nebula.cache import artifact_cache
+    from nebula.downloader import download_artifacts
+
+    names = [f"AD9361 ZC706 ({i}).BIN" for i in range(6)]
+    sums = {}
+    for name in names:
+        data = os.urandom(4096)
+        (http_server.root / name).write_bytes(data)
+        sums[f"{http_server.url}/{name}"] = hashlib.sha256(data).hexdigest()
+    resolver = Mock(checksum=lambda url: sums[url])
+    paths = [_artifact(f"{http_server.url}/{name}") for name in names]
+    out = tmp_path / "ml_bootbins"
+    cache = artifact_cache(str(tmp_path / "cache"))
+
+    assert download_artifacts(paths, str(out), 3, cache, resolver) == [
+        sums[p.url] for p in paths
+    ]
+    # Cached objects are read-only, replace the linked output instead
+    os.remove(out / names[2])
+    (out / names[2]).write_bytes(b"corrupt")
+    http_server.requests.clear()
+    download_artifacts(paths, str(out), 3, cache, resolver)
+
+    assert len(http_server.requests) == 1
+    assert (out / names[2]).read_bytes() == (http_server.root / names[2]).read_bytes()
+
+
+def test_build_properties_single_query(tmp_path):
+    import yaml
+
+    from nebula.cache import artifact_cache
+    from nebula.downloader import artifactory_resolver, get_gitsha, write_properties
+
+    folder = "https://server/artifactory/repo/boot_partition/main/2023_10_11-09_02_34"
+    result = {
+        "results": [
+            {
+                "repo": "repo",
+                "path": "boot_partition/main/2023_10_11-09_02_34/zynq",
+                "name": name,
+                "properties": [
+                    {"key": "hdl_git_sha", "value": "abc"},
+                    {"key": "linux_git_sha", "value": "def"},
+                ],
+            }
+            for name in ["BOOT.BIN", "devicetree.dtb"]
+        ]
+    }
+    session = Mock(auth=("user", "api-key"))
+    session.post.return_value = Mock(json=lambda: result)
+    cache = artifact_cache(str(tmp_path / "cache"))
+
+    resolver = artifactory_resolver(session=session, cache=cache)
+    props = get_gitsha(folder + "/zynq/BOOT.BIN", resolver=resolver)
+    assert props == {
+        "bootpartition_folder": "2023_10_11-09_02_34",
+        "hdl_git_sha": "abc",
+        "linux_git_sha": "def",
+    }
+    assert resolver.properties(folder + "/zynq/devicetree.dtb")["hdl_git_sha"] == [
+        "abc"
+    ]
+    # Build folder properties persist in the cache across sessions
+    resolver = artifactory_resolver(session=session, cache=cache)
+    assert resolver.properties(folder + "/zynq/BOOT.BIN")
+    assert session.post.call_count == 1
+
+    out = tmp_path / "outs"
+    write_properties(props, dest=str(out))
+    write_properties(props, dest=str(out))
+    with open(out / "properties.yaml") as f:
+        assert yaml.safe_load(f) == props
+    assert manifest(str(out)).data["properties"] == props
+
+
+def test_build_properties_anonymous(tmp_path):
+    from nebula.cache import artifact_cache
+    from nebula.downloader import artifactory_resolver
+
+    folder = "https://server/artifactory/repo/boot_partition/main/2023_10_11-09_02_34"
+    session = Mock(auth=None, headers={})
+    session.get.return_value = Mock(
+        status_code=200, json=lambda: {"properties": {"hdl_git_sha": ["abc"]}}
+    )
+    cache = artifact_cache(str(tmp_path / "cache"))
+
+    resolver = artifactory_resolver(session=session, cache=cache)
+    assert resolver.properties(folder + "/zynq/BOOT.BIN") == {"hdl_git_sha": ["abc"]}
+    # AQL needs credentials, the storage API does not
+    session.post.assert_not_called()
+    session.get.assert_called_once_with(
+        "https://server/artifactory/api/storage/repo/boot_partition/main/"
+        "2023_10_11-09_02_34/zynq/BOOT.BIN?properties"
+    )
+    resolver = artifactory_resolver(session=session, cache=cache)
+    assert resolver.properties(folder + "/zynq/BOOT.BIN")
+    assert session.get.call_count == 1
+
+
+def test_get_info_txt_direct_and_cached(http_server, tmp_path):
+    from nebula.cache import artifact_cache
+    from nebula.downloader import get_info_txt
+
+    info = "BRANCH: main\nTriggered by: hdl\nCOMMIT SHA: abc123\nbuilt_projects:\n - fmcomms2\n"
+    (http_server.root / "2023_10_11-09_02_34").mkdir()
+    (http_server.root / "2023_10_11-09_02_34" / "info.txt").write_text(info)
+    (http_server.root / "2023_10_12-09_02_34").mkdir()
+    (http_server.root / "2023_10_12-09_02_34" / "build-info.txt").write_text(info)
+    cache = artifact_cache(str(tmp_path / "cache"))
+
+    url = http_server.url + "/2023_10_11-09_02_34/boot_partition/zynq/BOOT.BIN"
+    build_info = get_info_txt(url, cache=cache)
+    assert build_info["COMMIT SHA"] == "abc123"
+    assert build_info["built_projects"] == ["fmcomms2"]
+    assert get_info_txt(url) == build_info
+    assert len(http_server.requests) == 1
+    assert cache.load_meta("info_txt", http_server.url + "/2023_10_11-09_02_34")
+
+    folder = http_server.url + "/2023_10_12-09_02_34"
+    resolver = Mock(session=None)
+    resolver.list.return_value = [folder + "/build-info.txt"]
+    assert get_info_txt(folder, resolver=resolver) == build_info
+    resolver.list.assert_called_once_with(folder + "/")
+    assert not os.path.exists("info.txt")
+
+
+def test_shared_downloads_fetch_once(http_server, tmp_path):
+    from nebula.downloader import boards_in_yaml, shared_downloads
+
+    for name in ["uImage", "system_top.hdf"]:
+        (http_server.root / name).write_bytes(os.urandom(2048))
+    boards = {}
+    for board in [
+        "zynq-zc706-adv7511-fmcomms11",
+        "zynq-zc702-adv7511-ad9361-fmcomms2-3",
+    ]:
+        d = downloader()
+        d.use_cache = False
+        d.output_folder = str(tmp_path / board)
+        os.makedirs(d.output_folder)
+        boards[board] = d
+    shared = shared_downloads(None, workers=2)
+    try:
+        for board, d in boards.items():
+            d._shared = shared
+            d._plan = [
+                (f"{http_server.url}/uImage", f"{d.output_folder}/uImage", None),
+                (
+                    f"{http_server.url}/system_top.xsa",
+                    f"{d.output_folder}/system_top.xsa",
+                    (
+                        f"{http_server.url}/system_top.hdf",
+                        f"{d.output_folder}/system_top.hdf",
+                    ),
+                ),
+            ]
+            d._flush_downloads()
+    finally:
+        shared.close()
+
+    first, second = [d.output_folder for d in boards.values()]
+    assert os.path.samefile(f"{first}/uImage", f"{second}/uImage")
+    assert os.path.samefile(f"{first}/system_top.hdf", f"{second}/system_top.hdf")
+    assert sorted(manifest(second).files) == ["system_top.hdf", "uImage"]
+    paths = [r[1] for r in http_server.requests]
+    assert sorted(paths) == ["/system_top.hdf", "/system_top.xsa", "/uImage"]
+
+    yaml = os.path.join(os.path.dirname(__file__), "nebula_config", "nebula.yaml")
+    assert "pluto" in boards_in_yaml(yaml)
+
+
+@pytest.mark.parametrize("strategies", [None, ["copy_file_range"], ["copy"]])
+def test_fast_copy(tmp_path, strategies):
+    from nebula.common import fast_copy
+
+    src = tmp_path / "BOOT.BIN"
+    src.write_bytes(os.urandom(1 << 16))
+    out = tmp_path / "outs"
+    out.mkdir()
+    (out / "BOOT.BIN").write_bytes(b"stale")
+
+    strategy = fast_copy(str(src), str(out), strategies)
+
+    assert (out / "BOOT.BIN").read_bytes() == src.read_bytes()
+    assert strategy in (strategies or ["reflink", "hardlink"])
+    assert os.listdir(out) == ["BOOT.BIN"]
+
+
 if __name__ == "__main__":
     test_image_downloader()
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import zlib
+
+import pytest
+
+from nebula.integrity import hash_file, hash_files, multi_hash
+
+
+@pytest.mark.parametrize("size", [0, 1, 9 * 1024 * 1024 + 7])
+def test_hash_file_single_pass(tmp_path, size):
+    data = os.urandom(size)
+    fname = tmp_path / "BOOT.BIN"
+    fname.write_bytes(data)
+
+    digests = hash_file(str(fname), ["md5", "sha256", "crc32"])
+
+    assert digests == {
+        "md5": hashlib.md5(data).hexdigest(),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "crc32": f"{zlib.crc32(data):08x}",
+    }
+    half = hash_file(str(fname), "sha256", length=size // 2)
+    assert half["sha256"] == hashlib.sha256(data[: size // 2]).hexdigest()
+
+
+def test_hash_files_parallel(tmp_path):
+    files = {}
+    for name in ["BOOT.BIN", "uImage", "devicetree.dtb"]:
+        files[str(tmp_path / name)] = os.urandom(100000)
+        (tmp_path / name).write_bytes(files[str(tmp_path / name)])
+
+    digests = hash_files(files, ["sha256"], workers=3)
+
+    assert digests == {
+        f: {"sha256": hashlib.sha256(data).hexdigest()} for f, data in files.items()
+    }
+
+
+def test_downloader_check_md5(tmp_path):
+    from nebula import downloader
+
+    fname = tmp_path / "image.img"
+    fname.write_bytes(b"sdcard" * 1000)
+    h = multi_hash(["md5"])
+    h.update(b"sdcard" * 1000)
+
+    downloader().check(str(fname), h.hexdigest())
+    with pytest.raises(Exception, match="MD5 hash check failed"):
+        downloader().check(str(fname), "0" * 32)
+
+
+def test_manager_verify_checksum_uses_manifest(tmp_path):
+    from unittest.mock import Mock
+
+    from nebula import manager
+    from nebula.manifest import record_file, start_manifest
+
+    (tmp_path / "BOOT.BIN").write_bytes(b"boot")
+    start_manifest(str(tmp_path), "zynq-zc706-adv7511-fmcomms11")
+    record_file(str(tmp_path), "BOOT.BIN", hashlib.sha256(b"boot").hexdigest())
+    m = Mock(board_name="zynq-zc706-adv7511-fmcomms11")
+
+    manager.verify_checksum(m, str(tmp_path))
+    m.net.verify_checksums.assert_called_once_with(
+        {"/boot/BOOT.BIN": hashlib.sha256(b"boot").hexdigest()}
+    )
+
+    # The manifest is trusted, the file is not hashed again
+    record_file(str(tmp_path), "BOOT.BIN", "0" * 64)
+    manager.verify_checksum(m, str(tmp_path))
+    m.net.verify_checksums.assert_called_with({"/boot/BOOT.BIN": "0" * 64})
+
+    # A local copy changed after the download is not a valid reference
+    (tmp_path / "BOOT.BIN").write_bytes(b"tampered")
+    with pytest.raises(Exception, match="BOOT.BIN"):
+        manager.verify_checksum(m, str(tmp_path))
+    assert m.net.verify_checksums.call_count == 2
+
+
+def test_manager_verify_checksum_keeps_manifests_apart(tmp_path):
+    from unittest.mock import Mock
+
+    from nebula import manager
+    from nebula.manifest import record_file, start_manifest
+
+    for name, contents in [("a", b"boot"), ("b", b"other")]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "BOOT.BIN").write_bytes(contents)
+        start_manifest(str(tmp_path / name), "zynq-zc706-adv7511-fmcomms11")
+        record_file(
+            str(tmp_path / name), "BOOT.BIN", hashlib.sha256(contents).hexdigest()
+        )
+    m = Mock(board_name="zynq-zc706-adv7511-fmcomms11")
+
+    # Two downloads of the same file must agree instead of one silently
+    # replacing the other
+    with pytest.raises(Exception, match="/boot/BOOT.BIN"):
+        manager.verify_checksum(m, str(tmp_path))
+    m.net.verify_checksums.assert_not_called()
+
+    (tmp_path / "b" / "BOOT.BIN").write_bytes(b"boot")
+    record_file(str(tmp_path / "b"), "BOOT.BIN", hashlib.sha256(b"boot").hexdigest())
+    manager.verify_checksum(m, str(tmp_path))
+    m.net.verify_checksums.assert_called_once_with(
+        {"/boot/BOOT.BIN": hashlib.sha256(b"boot").hexdigest()}
+    )
@@ -0,0 +1,75 @@
+from unittest.mock import Mock
+
+import pytest
+
+from nebula.manifest import (
+    find_manifests,
+    manifest,
+    manifest_session,
+    record_fields,
+    record_file,
+    start_manifest,
+)
+from nebula.network import network
+
+
+def test_manifest_replaces_stale_entries(tmp_path):
+    out = tmp_path / "outs"
+    out.mkdir()
+    (out / "BOOT.BIN").write_bytes(b"boot")
+    (out / "uImage").write_bytes(b"kernel")
+    start_manifest(str(out), "zynq-zc706-adv7511-fmcomms11", branch="main")
+    record_file(str(out), "BOOT.BIN", "aa", "http://server/BOOT.BIN")
+    record_file(str(out), "BOOT.BIN", "bb", "http://server/BOOT.BIN")
+    record_file(str(out), "uImage", "cc")
+    record_fields(str(out), properties={"hdl_git_sha": "1234"})
+    record_fields(str(out), properties={"linux_git_sha": "5678"})
+    (out / "uImage").unlink()
+
+    m = manifest(str(out))
+    assert m.files == {
+        "BOOT.BIN": {"size": 4, "sha256": "bb", "url": "http://server/BOOT.BIN"}
+    }
+    assert m.data["properties"] == {"hdl_git_sha": "1234", "linux_git_sha": "5678"}
+    assert [f.folder for f in find_manifests(str(tmp_path), board="pluto")] == []
+    assert len(find_manifests(str(tmp_path), board=m.board)) == 1
+
+
+def test_manifest_session_saves_once(tmp_path, monkeypatch):
+    out = tmp_path / "outs"
+    out.mkdir()
+    saves = []
+    save = manifest.save
+    monkeypatch.setattr(manifest, "save", lambda m: saves.append(m) or save(m))
+
+    with manifest_session(str(out)):
+        start_manifest(str(out), "pluto", branch="main")
+        for i in range(20):
+            (out / f"file{i}").write_bytes(b"x")
+            record_file(str(out), f"file{i}", str(i))
+        record_fields(str(out), properties={"hdl_git_sha": "1234"})
+        assert not (out / "manifest.json").exists()
+
+    assert len(saves) == 1
+    m = manifest(str(out))
+    assert m.board == "pluto"
+    assert len(m.files) == 20
+
+
+def test_manifest_in_current_folder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "BOOT.BIN").write_bytes(b"boot")
+    record_file("", "BOOT.BIN", "aa")
+
+    assert manifest(str(tmp_path)).files["BOOT.BIN"]["sha256"] == "aa"
+
+
+def test_verify_checksums_single_command():
+    net = network(dutip="127.0.0.1")
+    net.run_ssh_command = Mock(
+        return_value=Mock(stdout="/boot/BOOT.BIN aa\n/boot/uImage missing\n")
+    )
+    with pytest.raises(Exception, match="/boot/uImage"):
+        net.verify_checksums({"/boot/BOOT.BIN": "aa", "/boot/uImage": "cc"})
+    net.verify_checksums({"/boot/BOOT.BIN": "aa"})
+    assert net.run_ssh_command.call_count == 2
@@ -0,0 +1,130 @@
+import os
+import time
+from unittest.mock import Mock, patch
+
+from nebula import downloader
+from nebula.downloader import bandwidth_limiter
+from nebula.manifest import record_file, start_manifest
+from nebula.mirror import load_ready_index, mirror, parse_rate, ready_entry
+
+BOARD = "zynq-zc706-adv7511-fmcomms11"
+SERVER = "artifactory.analog.com"
+URL = (
+    f"https://{SERVER}/artifactory/sdg-generic-development/boot_partition/main/"
+    f"2024_05_01-10_00_00/{BOARD}/BOOT.BIN"
+)
+
+
+def fake_bulk(contents, calls=None):
+    def bulk(boards, yamlfilename, output_folder, workers, **kwargs):
+        if calls is not None:
+            calls.append(boards)
+        folders = {}
+        for board in boards:
+            folder = os.path.join(output_folder, board)
+            os.makedirs(folder)
+            start_manifest(
+                folder,
+                board,
+                source=kwargs["source"],
+                branch=kwargs["branch"],
+                folder="boot_partition",
+            )
+            with open(os.path.join(folder, "BOOT.BIN"), "wb") as f:
+                f.write(contents)
+            record_file(folder, "BOOT.BIN", contents.hex(), URL)
+            folders[board] = folder
+        return folders
+
+    return bulk
+
+
+def test_mirror_publishes_new_builds(tmp_path):
+    m = mirror(board_names=["zynq-zc706-adv7511-fmcomms11"])
+    m.mirror_dir = str(tmp_path / "mirror")
+    with patch("nebula.mirror.download_boot_files_bulk", fake_bulk(b"build1")):
+        assert m.sync() == ["zynq-zc706-adv7511-fmcomms11"]
+        first = load_ready_index(m.mirror_dir)["zynq-zc706-adv7511-fmcomms11"]
+        assert m.sync() == []
+    with patch("nebula.mirror.download_boot_files_bulk", fake_bulk(b"build2")):
+        assert m.sync() == ["zynq-zc706-adv7511-fmcomms11"]
+    generations = [g for g in os.listdir(m.mirror_dir) if g.startswith("gen-")]
+    assert len(generations) == 2
+    assert os.path.isdir(first["path"])
+
+    d = downloader()
+    d.mirror_dir = m.mirror_dir
+    d.output_folder = str(tmp_path / "outs")
+    assert d._link_from_mirror(
+        "zynq-zc706-adv7511-fmcomms11",
+        "artifactory",
+        "main",
+        "boot_partition",
+        SERVER,
+    )
+    assert (tmp_path / "outs" / "BOOT.BIN").read_bytes() == b"build2"
+    assert (tmp_path / "outs" / "manifest.json").stat().st_nlink == 1
+    assert not d._link_from_mirror(
+        "zynq-zc706-adv7511-fmcomms11",
+        "artifactory",
+        "release",
+        "boot_partition",
+        SERVER,
+    )
+
+
+def test_mirror_entries_expire_and_match_server(tmp_path):
+    m = mirror(board_names=[BOARD])
+    m.mirror_dir = str(tmp_path / "mirror")
+    with patch("nebula.mirror.download_boot_files_bulk", fake_bulk(b"build1")):
+        m.sync()
+    args = (m.mirror_dir, BOARD, "artifactory", "main", "boot_partition")
+
+    assert ready_entry(*args, SERVER, None, max_age=60)
+    # Builds from another server or URL template are not served
+    assert not ready_entry(*args, "other.server", None, max_age=60)
+    assert not ready_entry(*args, SERVER, "https://other/{}", max_age=60)
+    # Nor are builds the mirror has not confirmed for a while
+    with patch("nebula.mirror.time.time", return_value=time.time() + 120):
+        assert not ready_entry(*args, SERVER, None, max_age=60)
+
+    d = downloader()
+    d.mirror_dir = m.mirror_dir
+    d.output_folder = str(tmp_path / "outs")
+    d.mirror_max_age = 0
+    assert not d._link_from_mirror(
+        BOARD, "artifactory", "main", "boot_partition", SERVER
+    )
+
+
+def test_mirror_skips_unchanged_builds(tmp_path):
+    m = mirror(board_names=[BOARD])
+    m.mirror_dir = str(tmp_path / "mirror")
+    m.resolver = Mock()
+    m.resolver.newest_folder.return_value = "2024_05_01-10_00_00"
+    m.resolver.checksum.return_value = b"build1".hex()
+    calls = []
+    with patch("nebula.mirror.download_boot_files_bulk", fake_bulk(b"build1", calls)):
+        assert m.sync() == [BOARD]
+        first = load_ready_index(m.mirror_dir)[BOARD]
+        assert m.sync() == []
+        assert len(calls) == 1
+        m.resolver.newest_folder.assert_called_with(URL.rsplit("/", 3)[0])
+        assert load_ready_index(m.mirror_dir)[BOARD]["checked"] > first["checked"]
+
+        # A newer build folder is downloaded again
+        m.resolver.newest_folder.return_value = "2024_05_02-10_00_00"
+        m.sync()
+        assert len(calls) == 2
+    generations = [g for g in os.listdir(m.mirror_dir) if g.startswith("gen-")]
+    assert len(generations) == 1
+
+
+def test_bandwidth_limiter():
+    assert parse_rate("2M") == 2 * 1024**2
+    assert parse_rate("512KB/s") == 512 * 1024
+    limiter = bandwidth_limiter(1000000)
+    start = time.monotonic()
+    for _ in range(15):
+        limiter.consume(100000)
+    assert time.monotonic() - start >= 0.45
@@ -1,10 +1,134 @@
 import os
 import shutil
+import subprocess
+import sys
+import threading
 import time
+from unittest.mock import patch
 
 import pytest
+import serial
 
 from nebula import pdu, uart
+from nebula.uart import log_writer
+
+
+@pytest.fixture()
+def loop_uart(tmp_path):
+    """uart on a pyserial loopback port, bytes written to it are read back"""
+    with patch(
+        "nebula.uart.serial.Serial",
+        side_effect=lambda *args, **kwargs: serial.serial_for_url(
+            "loop://", timeout=0.5
+        ),
+    ):
+        u = uart(address="loop://", logfilename=str(tmp_path / "uart.log"))
+    yield u
+    u.stop_log(force=True)
+
+
+def _fake_shell(fd, logged_in=True):
+    """Echo lines written to the pty master and run them with /bin/sh.
+    Unless logged_in, root with password analog has to log in first"""
+    buf = b""
+    username = None
+    while True:
+        try:
+            data = os.read(fd, 1024)
+        except OSError:
+            return
+        if not data:
+            return
+        buf += data
+        while b"\n" in buf:
+            line, buf = buf.split(b"\n", 1)
+            if not logged_in:
+                if username is None:
+                    username = line.strip() or None
+                    prompt = b"Password: " if username else b"analog login: "
+                    os.write(fd, line + b"\r\n" + prompt)
+                    continue
+                logged_in = (username, line.strip()) == (b"root", b"analog")
+                username = None
+                if not logged_in:
+                    os.write(fd, b"\r\nLogin incorrect\r\nanalog login: ")
+                    continue
+                line = b""
+            out = line + b"\r\n"
+            if line.strip():
+                res = subprocess.run(
+                    line.decode(),
+                    shell=True,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                )
+                out += res.stdout.replace(b"\n", b"\r\n")
+            os.write(fd, out + b"root@analog:~# ")
+
+
+def _pty_uart(tmp_path, logged_in):
+    master, slave = os.openpty()
+    threading.Thread(target=_fake_shell, args=(master, logged_in), daemon=True).start()
+    u = uart(address=os.ttyname(slave), logfilename=str(tmp_path / "uart.log"))
+    yield u
+    u.stop_log(force=True)
+    u.com.close()
+    os.close(slave)
+    os.close(master)
+
+
+@pytest.fixture()
+def shell_uart(tmp_path):
+    """uart on a pty running a fake Linux shell"""
+    yield from _pty_uart(tmp_path, logged_in=True)
+
+
+@pytest.fixture()
+def login_uart(tmp_path):
+    """uart on a pty running a fake Linux shell waiting for a login"""
+    yield from _pty_uart(tmp_path, logged_in=False)
+
+
+def test_log_writer_batches_lines(tmp_path):
+    fname = tmp_path / "uart.log"
+    fname.write_text("old\n")
+    writer = log_writer(str(fname), append=True, flush_interval=0.05)
+    for i in range(1000):
+        writer.write(f"line {i}")
+    writer.close()
+    assert fname.read_text() == "old\n" + "".join(f"line {i}\n" for i in range(1000))
+
+    writer = log_writer(str(fname), append=False, flush_interval=10)
+    writer.write("new")
+    writer.close()
+    assert fname.read_text() == "new\n"
+
+
+def test_log_writer_flushed_at_exit(tmp_path):
+    fname = tmp_path / "uart.log"
+    script = (
+        "from nebula.uart import log_writer\n"
+        f"log_writer({str(fname)!r}, flush_interval=60).write('last words')\n"
+    )
+    subprocess.run([sys.executable, "-c", script], check=True)
+    assert fname.read_text() == "last words\n"
+
+
+def test_uart_log_single_sink(loop_uart):
+    loop_uart.com.write(b"U-Boot 2021.01\n")
+    assert loop_uart._read_until_stop() == ["U-Boot 2021.01"]
+
+    loop_uart.start_log(logappend=True)
+    loop_uart.com.write(b"Starting kernel ...\nroot@analog:~#\n")
+    for _ in range(50):
+        if not loop_uart.com.in_waiting:
+            break
+        time.sleep(0.1)
+    loop_uart.stop_log()
+
+    assert loop_uart._log is None
+    with open(loop_uart.logfilename) as f:
+        assert f.read() == "U-Boot 2021.01\nStarting kernel ...\nroot@analog:~#\n"
 
 
 # @pytest.mark.skip(reason="Not fully implemented")
@@ -47,5 +171,146 @@ def test_adrv9361_fmc_uboot_boot():
     assert status
 
 
+def test_pattern_matcher_spans_chunks():
+    from nebula.uart import pattern_matcher
+
+    m = pattern_matcher(["Starting kernel", "root@analog", "analog"])
+    assert m.feed(b"U-Boot 2021.01\r\nStar") == []
+    assert m.feed(b"ting ker") == []
+    assert m.feed(b"nel ...\r\n") == ["Starting kernel"]
+    # Overlapping patterns are all reported, each once
+    assert m.feed(b"root@ana") == []
+    assert sorted(m.feed(b"log:~# root@analog")) == ["analog", "root@analog"]
+    assert m.search("Zynq> ") == set()
+    assert m.search("analog login:") == {"analog"}
+
+
+def test_read_until_done_wakes_on_match(loop_uart):
+    def boot():
+        time.sleep(0.2)
+        loop_uart.com.write(b"U-Boot 2021.01\nStarting kernel ...\n")
+        time.sleep(0.2)
+        loop_uart.com.write(b"analog login: root\nroot@analog:~#")
+
+    writer = threading.Thread(target=boot)
+    start = time.monotonic()
+    writer.start()
+    found = loop_uart._read_until_done_multi(
+        ["U-Boot", "Starting kernel", "root@analog"], max_time=10
+    )
+    writer.join()
+
+    assert found == [True, True, True]
+    assert time.monotonic() - start < 2
+    assert not loop_uart._read_until_done("Zynq>", max_time=1)
+    loop_uart._close_log()
+    with open(loop_uart.logfilename) as f:
+        assert f.read().splitlines() == [
+            "U-Boot 2021.01",
+            "Starting kernel ...",
+            "analog login: root",
+            "root@analog:~#",
+        ]
+
+
+def test_reader_survives_commands(loop_uart):
+    chunks = []
+    loop_uart.start_log(logappend=True)
+    reader = loop_uart.thread
+    loop_uart.subscribe(chunks.append)
+
+    # Loopback echoes the command back as its reply
+    assert not loop_uart._read_until_done("mmc 0", max_time=1)
+    loop_uart.copy_reference("BOOT.BIN.ORG", "BOOT.BIN", done_string="mmc 0")
+    assert loop_uart.thread is reader and reader.is_alive()
+    assert loop_uart.listen_thread_run
+
+    loop_uart.unsubscribe(chunks.append)
+    loop_uart.stop_log()
+    assert not reader.is_alive()
+    assert b"fatwrite mmc 0 0x8000000 BOOT.BIN ${filesize}" in b"".join(chunks)
+    with open(loop_uart.logfilename) as f:
+        assert f.read().splitlines() == [
+            "fatload mmc 0 0x8000000 BOOT.BIN.ORG",
+            "fatwrite mmc 0 0x8000000 BOOT.BIN ${filesize}",
+        ]
+
+
+def test_dropped_uart_releases_port(tmp_path):
+    import weakref
+
+    with patch(
+        "nebula.uart.serial.Serial",
+        side_effect=lambda *args, **kwargs: serial.serial_for_url(
+            "loop://", timeout=0.5
+        ),
+    ):
+        u = uart(address="loop://", logfilename=str(tmp_path / "uart.log"))
+    u.start_log()
+    u.com.write(b"root@analog:~# \n")
+    assert u.console_state.wait(timeout=5) == "shell"
+    com, reader, ref = u.com, u.thread, weakref.ref(u)
+
+    # The reader thread alone does not keep the uart alive
+    del u
+    reader.join(timeout=5)
+    assert ref() is None
+    assert not reader.is_alive()
+    assert not com.is_open
+    assert (tmp_path / "uart.log").read_text() == "root@analog:~# \n"
+
+
+def test_run_linux_command_framed(shell_uart):
+    out, status = shell_uart.run_linux_command("printf 'a\\nb\\n'; false")
+    assert (out, status) == ("a\nb", 1)
+
+    start = time.monotonic()
+    assert shell_uart._run_framed("echo 192.168.86.35") == ("192.168.86.35", 0)
+    # Returns on the end marker instead of reading for a fixed time
+    assert time.monotonic() - start < 0.5
+    assert shell_uart.get_uart_command_for_linux("uname; uname", "Li") == "Linux"
+
+    with pytest.raises(TimeoutError):
+        shell_uart._run_framed("sleep 2", timeout=0.5)
+
+
+def test_console_state_follows_stream():
+    from nebula.uart import console_state
+
+    c = console_state()
+    for chunk, state in [
+        (b"U-Boot 2021.01\r\nZy", c.UNKNOWN),
+        (b"nq> ", c.UBOOT),
+        (b"boot\r\nStarting kernel ...\r\n", c.UNKNOWN),
+        (b"analog log", c.UNKNOWN),
+        (b"in: ", c.LOGIN),
+        (b"root\r\nPassword: ", c.PASSWORD),
+        (b"\r\nLast login: Sun Oct 18 12:00:00 UTC 2026 on ttyPS0\r\n", c.PASSWORD),
+        (b"root@analog:~", c.PASSWORD),
+        (b"# ", c.SHELL),
+        (b"[   12.345678] usb 1-1: new high-speed USB device\r\n", c.SHELL),
+        (b"reboot: Restarting system\r\n", c.UNKNOWN),
+        # Pluto and M2K have a bare prompt
+        (b"\r\npluto login: root\r\nPassword: ", c.PASSWORD),
+        (b"\r\nWelcome to Pluto\r\n# ", c.SHELL),
+    ]:
+        c(chunk)
+        assert c.state == state
+    assert c.changes == 10
+    assert c.wait(timeout=0.1, since=10) is None
+
+
+def test_check_for_login_probes_once(login_uart):
+    start = time.monotonic()
+    assert login_uart._check_for_login()
+    assert login_uart.console_state.state == "shell"
+    assert time.monotonic() - start < 1
+
+    # The shell is known to be logged in, commands go out without probing
+    start = time.monotonic()
+    assert login_uart.run_linux_command("echo ok") == ("ok", 0)
+    assert time.monotonic() - start < 0.5
+
+
 if __name__ == "__main__":
     test_adrv9361_fmc_uboot_boot()
@@ -258,3 +258,32 @@ def test_backup_update_boot_files_external(power_off_dut, param):
 
     finally:
         sd.set_mux_mode("off")
+
+
+def test_write_stream_to_device(tmp_path, monkeypatch):
+    import hashlib
+
+    from nebula.usbmux import write_stream_to_device
+
+    advice = []
+    if hasattr(os, "posix_fadvise"):
+        fadvise = os.posix_fadvise
+        monkeypatch.setattr(
+            os,
+            "posix_fadvise",
+            lambda fd, off, n, a: advice.append(a) or fadvise(fd, off, n, a),
+        )
+    image = os.urandom(10000)
+    chunks = [image[i : i + 700] for i in range(0, len(image), 700)]
+    device = tmp_path / "sdcard"
+    device.write_bytes(b"")
+
+    md5 = write_stream_to_device(
+        iter(chunks), str(device), block_size=4096, verify=True
+    )
+
+    assert md5 == hashlib.md5(image).hexdigest()
+    assert device.read_bytes() == image
+    if hasattr(os, "posix_fadvise"):
+        # Verification reads the device, not pages cached by the writes
+        assert advice == [os.POSIX_FADV_DONTNEED]